@@ -0,0 +1,44 @@
+"""
+Archiva los timeblocks viejos (mueve `timeblocks` → `timeblocks_archive`).
+
+El servidor ya lo hace solo en segundo plano (TIMEBLOCK_ARCHIVE_INTERVAL_HOURS);
+este script sirve para correrlo a mano o con otro horizonte.
+Es seguro repetirlo si se interrumpe.
+
+Requiere haber ejecutado antes migrate_timeblock_times.py (usa el campo "day").
+
+Uso:
+    python archive_timeblocks.py                    # Horizonte por defecto (TIMEBLOCK_ARCHIVE_DAYS)
+    python archive_timeblocks.py --horizon-days 90  # Archivar lo anterior a 90 días
+"""
+import argparse
+import asyncio
+
+from services.timeblock_archive_service import (
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_HORIZON_DAYS,
+    archive_old_blocks,
+    ensure_indexes
+)
+
+
+async def main(horizon_days: int, batch_size: int):
+    await ensure_indexes()
+
+    print(f"🗄️ Archivando timeblocks de hace más de {horizon_days} días (lotes de {batch_size})...\n")
+    report = await archive_old_blocks(horizon_days=horizon_days, batch_size=batch_size)
+
+    print(f"📅 Fecha de corte: {report['cutoff']}")
+    print(f"📦 Lotes procesados: {report['batches']}")
+    print(f"✅ Bloques movidos al archivo: {report['moved']}")
+    if report["retried"]:
+        print(f"🔁 Bloques que cambiaron mientras se copiaban (se reintentan): {report['retried']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mueve los timeblocks viejos a timeblocks_archive")
+    parser.add_argument("--horizon-days", type=int, default=ARCHIVE_HORIZON_DAYS, help="Días que se quedan en la colección caliente")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Bloques por lote")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.horizon_days, args.batch_size))
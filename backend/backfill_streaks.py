@@ -0,0 +1,27 @@
+"""
+Calcula el estado de rachas (streaks) desde toda la historia de timeblocks.
+
+Se ejecuta una sola vez (o cuando se quiera reparar el estado); después,
+las rachas se mantienen solas cada vez que cambia un bloque completado.
+
+Requiere haber ejecutado antes migrate_timeblock_times.py (usa el campo "day").
+
+Uso:
+    python backfill_streaks.py
+"""
+import asyncio
+
+from services.streak_service import backfill_from_history
+
+
+async def main():
+    print("🔥 Calculando rachas desde toda la historia...\n")
+    state = await backfill_from_history()
+    print(f"   Racha actual: {state['current_streak']} días")
+    print(f"   Racha más larga: {state['longest_streak']} días")
+    print(f"   Último día activo: {state['last_active_date']}")
+    print("\n✅ Estado de rachas guardado.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
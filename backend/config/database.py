@@ -38,3 +38,58 @@ staking_collection = database["staking_sessions"]
 # Colección de Extra Lives (moneda mágica anti-penalización)
 # Guarda el historial de usos del sistema Extra Life por usuario
 extra_lives_collection = database["extra_lives"]
+
+# Colección de resúmenes diarios de timeblocks (rollups)
+# Un documento por (fecha, hábito) con contadores que se actualizan con $inc
+# en cada escritura, para que las estadísticas lean O(días) filas y no O(bloques)
+timeblock_rollups_collection = database["timeblock_daily_rollups"]
+
+# Colección de plantillas de timeblocks recurrentes
+# Las ocurrencias se expanden al leer; solo se escribe un timeblock real
+# cuando el usuario completa o edita una ocurrencia
+timeblock_templates_collection = database["timeblock_templates"]
+
+# Colección de contadores de cambios de timeblocks (para ETags)
+# Un documento por fecha ("date:YYYY-MM-DD") más "all" y "templates";
+# cada escritura incrementa la versión de lo que tocó
+timeblock_versions_collection = database["timeblock_versions"]
+
+# Colección con el estado de rachas (streaks) del usuario
+# Un documento pequeño con current_streak, longest_streak y last_active_date
+streak_state_collection = database["streak_states"]
+
+# Colección de heatmaps anuales de completados
+# Un documento por año con 366 bytes (un contador por día) en un campo binario
+completion_heatmaps_collection = database["completion_heatmaps"]
+
+# Colección de timeblocks archivados (colección "fría")
+# Bloques más viejos que el horizonte de archivo; solo se leen cuando
+# un rango de fechas llega hasta ellos
+timeblocks_archive_collection = database["timeblocks_archive"]
+
+# Colección con el estado del archivo de timeblocks
+# Un documento con la marca de agua "archived_before"
+timeblock_archive_state_collection = database["timeblock_archive_state"]
+
+# Colección de libros semanales de compromisos
+# Un documento por (user_address, week_id) con los bloques relevantes y
+# completados de la semana; se actualiza en cada escritura de timeblocks
+weekly_ledger_collection = database["weekly_ledger"]
+
+# Colección de firmas de liquidación ya preparadas
+# Una por (user_address, week_id, chain_id, deposit_amount), con su deadline;
+# /finance/settlement/sign las entrega sin volver a calcular ni firmar
+settlement_signatures_collection = database["settlement_signatures"]
+
+# Colección con el progreso de los jobs de liquidación por lotes
+# Un documento por (week_id, chain_id) con el último _id procesado para poder continuar
+settlement_jobs_collection = database["settlement_jobs"]
+
+# Colección de eventos Deposited / Withdrawn del contrato HabitEscrow
+# Un documento por log (_id = "<chain_id>:<tx_hash>:<log_index>"), llenada por
+# el indexador; los montos en Wei se guardan como strings
+escrow_events_collection = database["escrow_events"]
+
+# Colección con el punto de control del indexador de HabitEscrow
+# Un documento por (chain_id, contrato) con el último bloque indexado
+escrow_indexer_state_collection = database["escrow_indexer_state"]
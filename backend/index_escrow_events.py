@@ -0,0 +1,38 @@
+"""
+Indexa los eventos Deposited / Withdrawn de HabitEscrow en `escrow_events`.
+
+El servidor ya lo hace en segundo plano cada ESCROW_INDEXER_INTERVAL_SECONDS;
+este script sirve para la primera carga (desde el bloque del despliegue),
+para reindexar un rango o para probar contra un nodo local (anvil).
+
+Uso:
+    python index_escrow_events.py                              # Desde el punto de control
+    python index_escrow_events.py --from-block 12345678        # Reindexar desde un bloque
+    python index_escrow_events.py --rpc-url http://127.0.0.1:8545 --confirmations 0   # anvil
+"""
+import argparse
+import asyncio
+
+from services.escrow_indexer_service import ESCROW_CONFIRMATIONS, ensure_indexes, index_events
+
+
+async def main(rpc_url: str, contract: str, confirmations: int, from_block: int):
+    await ensure_indexes()
+
+    print("⛓️ Indexando eventos de HabitEscrow...\n")
+    report = await index_events(rpc_url, contract, confirmations, from_block)
+
+    print(f"🌐 Red: {report['chain_id']}")
+    print(f"📦 Bloques: {report['from_block']} → {report['to_block']} ({report['ranges']} rangos)")
+    print(f"✅ Eventos guardados: {report['events']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexa los eventos de HabitEscrow")
+    parser.add_argument("--rpc-url", default=None, help="Nodo RPC (default ESCROW_RPC_URL)")
+    parser.add_argument("--contract", default=None, help="Dirección de HabitEscrow (default HABIT_ESCROW_ADDRESS)")
+    parser.add_argument("--confirmations", type=int, default=ESCROW_CONFIRMATIONS, help="Bloques de margen")
+    parser.add_argument("--from-block", type=int, default=None, help="Ignorar el punto de control y empezar aquí")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rpc_url, args.contract, args.confirmations, args.from_block))
@@ -7,6 +7,24 @@ from routes.rewards_routes import rewards_router
 from routes.staking_routes import staking_router
 from routes.extra_life_routes import extra_life_router
 from routes.finance_routes import router as finance_router
+from config.database import database
+from services import (
+    escrow_indexer_service,
+    settlement_service,
+    settlement_verification_service,
+    timeblock_archive_service,
+    timeblock_copy_service,
+    timeblock_rollup_service,
+    timeblock_search_service,
+    timeblock_template_service,
+    weekly_ledger_service
+)
+from services.timeblock_events_service import event_broker
+import asyncio
+import logging
+
+# Mensajes de los servicios y jobs en segundo plano (logger por módulo)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 app = FastAPI()
 # Configurar CORS - Permite conexiones desde localhost y Cloudflare Tunnel
@@ -17,6 +35,63 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+@app.on_event("startup")
+async def create_indexes():
+    """Crea (si no existen) los índices que usan las colecciones."""
+    # Consultas de timeblocks por rango de fechas, ordenadas por hora de inicio
+    await database.timeblocks.create_index([("day", 1), ("start_minute", 1)])
+    # GET /timeblocks sin fecha: los días más recientes primero
+    await database.timeblocks.create_index([("day", -1), ("start_minute", 1)])
+    # Analíticas por hábito en un rango de fechas
+    await database.timeblocks.create_index([("habit_id", 1), ("day", 1)])
+    # Compromisos por semana (exportación contable y job de liquidación)
+    await database.commitment_configs.create_index([("week_id", 1), ("_id", 1)])
+    await timeblock_rollup_service.ensure_indexes()
+    await timeblock_template_service.ensure_indexes()
+    await timeblock_archive_service.ensure_indexes()
+    await timeblock_copy_service.ensure_indexes()
+    await timeblock_search_service.ensure_indexes()
+    await weekly_ledger_service.ensure_indexes()
+    await settlement_service.ensure_indexes()
+    await escrow_indexer_service.ensure_indexes()
+    await settlement_verification_service.ensure_indexes()
+
+@app.on_event("startup")
+async def start_archive_job():
+    """Arranca el job que archiva los timeblocks viejos en segundo plano."""
+    app.state.archive_task = asyncio.create_task(timeblock_archive_service.run_periodically())
+
+@app.on_event("startup")
+async def start_escrow_indexer():
+    """Arranca el indexador de eventos de HabitEscrow (si hay nodo y contrato configurados)."""
+    app.state.escrow_indexer_task = asyncio.create_task(escrow_indexer_service.run_periodically())
+
+@app.on_event("startup")
+async def start_settlement_verifier():
+    """Arranca el worker que verifica on-chain las liquidaciones confirmadas."""
+    app.state.settlement_verifier_task = asyncio.create_task(settlement_verification_service.run_periodically())
+
+@app.on_event("shutdown")
+async def stop_event_streams():
+    """Cierra el change stream compartido de timeblocks."""
+    await event_broker.close()
+
+@app.on_event("shutdown")
+async def stop_archive_job():
+    """Detiene el job de archivo de timeblocks."""
+    app.state.archive_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_escrow_indexer():
+    """Detiene el indexador de eventos de HabitEscrow."""
+    app.state.escrow_indexer_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_settlement_verifier():
+    """Detiene el worker de verificación de liquidaciones."""
+    app.state.settlement_verifier_task.cancel()
+
 @app.get("/")
 def read_root():
     return {"message": "Bienvenido al API de LvlUp"}
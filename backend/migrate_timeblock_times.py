@@ -0,0 +1,84 @@
+"""
+Migración: agrega la representación numérica del tiempo a los timeblocks existentes.
+
+Por cada bloque sin el campo "day" escribe:
+- day: la fecha como datetime (medianoche)
+- start_minute / end_minute: minutos desde la medianoche
+
+Es una migración "en línea": procesa por lotes ordenados por _id y cada
+escritura solo aplica si el bloque no cambió desde que se leyó, así que
+puede correr con el servidor encendido. Se puede repetir sin riesgo.
+
+Uso:
+    python migrate_timeblock_times.py
+    python migrate_timeblock_times.py --batch-size 500
+"""
+import argparse
+import asyncio
+
+from pymongo import ASCENDING, UpdateOne
+
+from config.database import database
+from models.timeblock import time_fields
+
+PROJECTION = {"date": 1, "start_time": 1, "end_time": 1}
+
+
+async def migrate(batch_size: int):
+    # Índice compuesto que usan las consultas por rango de fechas
+    await database.timeblocks.create_index([("day", ASCENDING), ("start_minute", ASCENDING)])
+
+    pending = await database.timeblocks.count_documents({"day": {"$exists": False}})
+    print(f"🔎 Bloques por migrar: {pending}\n")
+
+    migrated = 0
+    unparseable = 0
+    last_id = None
+    while True:
+        # 1. Siguiente lote (paginado por _id para no repetir ni saltar documentos)
+        query = {"day": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await database.timeblocks.find(query, PROJECTION).sort("_id", ASCENDING).to_list(batch_size)
+        if not batch:
+            break
+
+        # 2. Calcular los campos numéricos; el filtro incluye los textos leídos
+        # para no pisar un cambio hecho por la API mientras migrábamos
+        operations = []
+        for block in batch:
+            fields = time_fields(block.get("date"), block.get("start_time"), block.get("end_time"))
+            if None in fields.values():
+                unparseable += 1
+            operations.append(UpdateOne(
+                {
+                    "_id": block["_id"],
+                    "day": {"$exists": False},
+                    "date": block.get("date"),
+                    "start_time": block.get("start_time"),
+                    "end_time": block.get("end_time")
+                },
+                {"$set": fields}
+            ))
+
+        result = await database.timeblocks.bulk_write(operations, ordered=False)
+        migrated += result.modified_count
+        last_id = batch[-1]["_id"]
+        print(f"   ✅ Lote hasta {last_id}: {result.modified_count}/{len(batch)} actualizados")
+
+    remaining = await database.timeblocks.count_documents({"day": {"$exists": False}})
+    print(f"\n📦 Migrados: {migrated}")
+    if unparseable:
+        print(f"⚠️ Bloques con fecha u horas no interpretables (quedan en None): {unparseable}")
+    if remaining:
+        print(f"🔁 Quedan {remaining} bloques (cambiaron durante la migración). Vuelve a ejecutar el script.")
+    else:
+        print("🎉 Todos los bloques tienen la representación numérica.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agrega day/start_minute/end_minute a los timeblocks")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documentos por lote")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.batch_size))
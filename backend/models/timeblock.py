@@ -1,14 +1,69 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, Literal, Optional
 from datetime import datetime
 
+
+# ============================================
+# 🕒 REPRESENTACIÓN NUMÉRICA DEL TIEMPO
+# ============================================
+# En Mongo cada bloque guarda, además de los textos "date"/"start_time"/"end_time"
+# que usa la API, su forma canónica numérica:
+# - day: fecha real (datetime a medianoche) → permite rangos $gte/$lt con índice
+# - start_minute / end_minute: minutos desde la medianoche → permite calcular
+#   duraciones dentro de la base de datos
+# Analogía: el texto es la etiqueta bonita del frasco, los números son la báscula.
+
+def time_to_minutes(value: Optional[str]) -> Optional[int]:
+    """
+    Convierte una hora "HH:MM" a minutos desde la medianoche.
+    Retorna None si el texto no tiene ese formato.
+
+    Ejemplo:
+        >>> time_to_minutes("09:30")
+        570
+    """
+    try:
+        hours, minutes = str(value).strip().split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (ValueError, AttributeError):
+        return None
+
+
+def date_to_day(value: Optional[str]) -> Optional[datetime]:
+    """Convierte "YYYY-MM-DD" a datetime a medianoche (None si no es válida)."""
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def minute_fields(start_time: Optional[str], end_time: Optional[str]) -> Dict[str, Optional[int]]:
+    """Minutos desde la medianoche de inicio y fin de un bloque."""
+    return {
+        "start_minute": time_to_minutes(start_time),
+        "end_minute": time_to_minutes(end_time)
+    }
+
+
+def time_fields(date: Optional[str], start_time: Optional[str], end_time: Optional[str]) -> Dict[str, Any]:
+    """
+    Campos canónicos numéricos de un bloque a partir de sus textos.
+
+    Ejemplo:
+        >>> time_fields("2026-02-12", "09:30", "10:15")
+        {"day": datetime(2026, 2, 12), "start_minute": 570, "end_minute": 615}
+    """
+    return {"day": date_to_day(date), **minute_fields(start_time, end_time)}
+
+
 # BaseModel es la "plantilla maestra" de FastAPI para validar datos.
 class TimeBlock(BaseModel):
     # Definimos los "ingredientes" obligatorios de nuestro plato.
     title: str
     habit_id: str # Para mantener el color/icono en el frontend
     
-    # Por ahora usamos texto (str) para las horas.
+    # La API usa texto "HH:MM"; en Mongo también se guardan como minutos
+    # (ver time_fields)
     start_time: str
     end_time: str
     
@@ -20,4 +75,47 @@ class TimeBlock(BaseModel):
     completed: bool = False
     
     # Opcional, para recibir el ID desde MongoDB
-    id: Optional[str] = None
\ No newline at end of file
+    id: Optional[str] = None
+    
+    # Si el bloque nació de una plantilla recurrente, guarda su ID
+    template_id: Optional[str] = None
+
+
+# Una operación dentro de PATCH /timeblocks/bulk.
+# "action" dice qué hacer y los demás campos son los datos que esa acción necesita.
+class TimeBlockBulkOperation(BaseModel):
+    id: str
+    action: Literal["complete", "reschedule", "delete"]
+    
+    # Para "complete": nuevo estado de completado
+    completed: Optional[bool] = None
+    
+    # Para "reschedule": nuevas horas de inicio y fin
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+
+
+# Plantilla de un bloque que se repite (ej: "Gym" todos los días de semana).
+# No se guarda un bloque por día: las ocurrencias se "imaginan" al leer
+# y solo se escriben en timeblocks cuando el usuario las completa o edita.
+class TimeBlockTemplate(BaseModel):
+    title: str
+    habit_id: str
+    start_time: str
+    end_time: str
+    
+    # Regla de repetición:
+    # - "daily": todos los días
+    # - "weekdays": lunes a viernes
+    # - "custom": los días marcados en weekday_mask
+    recurrence: Literal["daily", "weekdays", "custom"] = "daily"
+    
+    # Máscara de días para "custom": bit 0 = lunes ... bit 6 = domingo
+    # Ejemplo: lunes, miércoles y viernes = 0b0010101 = 21
+    weekday_mask: int = Field(default=0, ge=0, le=127)
+    
+    # Rango de vigencia de la plantilla (end_date opcional = sin fin)
+    start_date: str = Field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d"))
+    end_date: Optional[str] = None
+    
+    id: Optional[str] = None
@@ -0,0 +1,48 @@
+"""
+Verifica / repara los libros semanales de compromisos (weekly_ledger).
+
+Recalcula cada libro desde los rollups y la configuración del compromiso
+y reporta cualquier diferencia (drift) con lo guardado.
+
+Uso:
+    python rebuild_ledgers.py            # Solo verificar (no escribe nada)
+    python rebuild_ledgers.py --apply    # Verificar y corregir
+"""
+import argparse
+import asyncio
+import pprint
+
+from services.weekly_ledger_service import ensure_indexes, verify_ledgers
+
+
+async def main(apply: bool):
+    await ensure_indexes()
+
+    modo = "CORREGIR" if apply else "SOLO VERIFICAR"
+    print(f"🔎 Recalculando libros semanales desde los rollups ({modo})...\n")
+
+    report = await verify_ledgers(apply=apply)
+
+    print(f"📒 Libros revisados: {report['checked']}")
+
+    if report["drifted"] == 0:
+        print("✅ Los libros coinciden con los rollups.")
+        return
+
+    print(f"⚠️ Libros con drift: {report['drifted']}")
+    for sample in report["samples"]:
+        pprint.pprint(sample)
+        print("-" * 40)
+
+    if apply:
+        print(f"🔧 Libros corregidos: {report['fixed']}")
+    else:
+        print("💡 Ejecuta con --apply para corregirlos.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica/repara weekly_ledger")
+    parser.add_argument("--apply", action="store_true", help="Recalcular los libros con drift")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.apply))
@@ -0,0 +1,51 @@
+"""
+Reconstruye / verifica los rollups diarios de timeblocks.
+
+Recalcula `timeblock_daily_rollups` desde la colección `timeblocks`
+por bloques de días y reporta cualquier diferencia (drift).
+
+Uso:
+    python rebuild_rollups.py                 # Solo verificar (no escribe nada)
+    python rebuild_rollups.py --apply         # Verificar y corregir
+    python rebuild_rollups.py --chunk-days 7  # Procesar de 7 en 7 días
+"""
+import argparse
+import asyncio
+import pprint
+
+from services.timeblock_rollup_service import ensure_indexes, rebuild_rollups
+
+
+async def main(chunk_days: int, apply: bool):
+    await ensure_indexes()
+
+    modo = "CORREGIR" if apply else "SOLO VERIFICAR"
+    print(f"🔎 Recalculando rollups desde timeblocks ({modo}, bloques de {chunk_days} días)...\n")
+
+    report = await rebuild_rollups(chunk_days=chunk_days, apply=apply)
+
+    print(f"📦 Bloques de días procesados: {report['chunks']}")
+    print(f"🔢 Filas (fecha, hábito) revisadas: {report['checked']}")
+
+    if report["drifted"] == 0:
+        print("✅ Los rollups coinciden con los datos crudos.")
+        return
+
+    print(f"⚠️ Filas con drift: {report['drifted']}")
+    for sample in report["samples"]:
+        pprint.pprint(sample)
+        print("-" * 40)
+
+    if apply:
+        print(f"🔧 Filas corregidas: {report['fixed']}")
+    else:
+        print("💡 Ejecuta con --apply para corregirlas.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye/verifica timeblock_daily_rollups")
+    parser.add_argument("--apply", action="store_true", help="Corregir los rollups con drift")
+    parser.add_argument("--chunk-days", type=int, default=30, help="Días por bloque de recálculo")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.chunk_days, args.apply))
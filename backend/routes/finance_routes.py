@@ -1,14 +1,51 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, Dict, Literal, Optional, List
 from services.blockchain_signer import signer_service
 from config.database import database
+from services import (
+    commitment_config_service,
+    escrow_indexer_service,
+    settlement_service,
+    weekly_ledger_service
+)
+from datetime import datetime
+import csv
+import io
+import json
+import logging
 import os
 import time
-from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/finance", tags=["Finance & Staking"])
 
+logger = logging.getLogger(__name__)
+
+# Documentos que Mongo envía por cada viaje del cursor al exportar
+EXPORT_BATCH_SIZE = 1000
+
+# Columnas de la exportación contable (en este orden en el CSV)
+EXPORT_FIELDS = [
+    "user_address",
+    "week_id",
+    "mode",
+    "selected_habit_ids",
+    "deposit_amount",
+    "tx_hash",
+    "status",
+    "settlement_tx_hash",
+    "amount_returned",
+    "onchain_amount_returned",
+    "settlement_verification",
+    "settlement_rejection",
+    "settlement_confirmed_at",
+    "settlement_verified_at"
+]
+
+# Montos en Wei: siempre como string (no caben en int64 ni en un float)
+WEI_FIELDS = {"deposit_amount", "amount_returned", "onchain_amount_returned"}
+
 # --- Modelos de Request/Response ---
 
 class CommitmentConfig(BaseModel):
@@ -25,14 +62,15 @@ class CommitmentConfig(BaseModel):
 class SettlementConfirmRequest(BaseModel):
     user_address: str
     week_id: int
-    tx_hash: str
+    tx_hash: str = Field(..., pattern=r"^0x[0-9a-fA-F]{64}$")  # el nodo rechaza cualquier otro formato
     amount_returned: str
 
 class SettlementRequest(BaseModel):
     user_address: str
     week_id: int
     chain_id: Optional[int] = 84532  # Base Sepolia por defecto
-    deposit_amount: Optional[str] = "0"  # Recibir como string para evitar overflow
+    # Sin deposit_amount: el depósito se lee de los eventos indexados
+    # (si un cliente viejo lo manda, Pydantic lo descarta)
 
 class SettlementResponse(BaseModel):
     signature: str
@@ -43,22 +81,22 @@ class SettlementResponse(BaseModel):
 
 # --- Real Business Logic (MongoDB) ---
 
-def get_week_dates(week_id: int, year: int = 2026):
-    """Retorna lista de fechas (strings) para una semana ISO dada."""
-    # Lunes de la semana
-    start_date = datetime.strptime(f'{year}-W{week_id}-1', "%Y-W%W-%w")
-    dates = []
-    for i in range(7):
-        day = start_date + timedelta(days=i)
-        dates.append(day.strftime("%Y-%m-%d"))
-    return dates
-
-async def calculate_payout(user_address: str, week_id: int, deposit_amount_wei: int) -> int:
+async def calculate_payout(
+    user_address: str,
+    week_id: int,
+    deposit_amount_wei: int,
+    ledger: Optional[Dict[str, Any]] = None
+) -> int:
     """
     Calcula cuánto devolver al usuario basándose en su rendimiento REAL en MongoDB.
     
     MODO HARD: Cuenta TODOS los hábitos completados.
     MODO CUSTOM: Cuenta SOLO los hábitos seleccionados en la configuración.
+    
+    Los conteos ya están precalculados en el libro semanal (weekly_ledger):
+    es una sola lectura de documento. El depósito viene del indexador de
+    HabitEscrow (escrow_indexer_service.get_deposit), no del cliente.
+    Si ya se leyó el libro (`ledger`), se usa ese: la firma queda atada a su `rev`.
     """
     # Usar el monto real depositado (o fallback a 0 si nada, aunque el contrato fallará si es 0)
     DEPOSIT_AMOUNT = deposit_amount_wei
@@ -66,54 +104,48 @@ async def calculate_payout(user_address: str, week_id: int, deposit_amount_wei:
     if DEPOSIT_AMOUNT == 0:
         return 0
     
-    # 0. Get Commitment Config
-    config = await database.commitment_configs.find_one({
-        "user_address": user_address,
-        "week_id": week_id
-    })
-    
-    # Default to HARD mode if no config found
-    mode = config["mode"] if config else "HARD"
-    selected_ids = config["selected_habit_ids"] if config else []
-    
-    print(f"🕵️ Payout Logic: Mode={mode}, Selected={len(selected_ids)}")
+    if ledger is None:
+        ledger = await weekly_ledger_service.get_ledger(user_address, week_id)
+    logger.debug(
+        "Payout: mode=%s %d/%d", ledger["mode"], ledger["completed_blocks"], ledger["relevant_blocks"]
+    )
+    return settlement_service.apply_payout_rule(DEPOSIT_AMOUNT, ledger["relevant_blocks"], ledger["completed_blocks"])
 
-    # 1. Obtener fechas de la semana solicitada
-    current_iso_week = datetime.now().isocalendar()[1]
-    target_week = week_id if week_id > 1 else current_iso_week
-    week_dates = get_week_dates(target_week, datetime.now().year)
-    
-    # 2. Construir Query Base
-    query = {
-        "date": {"$in": week_dates}
-    }
-    
-    # EN MODO CUSTOM: Filtrar solo los IDs seleccionados
-    if mode == "CUSTOM" and selected_ids:
-        query["habit_id"] = {"$in": selected_ids}
-        
-    total_relevant_blocks = await database.timeblocks.count_documents(query)
-    
-    # 3. Contar hábitos completados (dentro del conjunto relevante)
-    query["completed"] = True
-    completed_count = await database.timeblocks.count_documents(query)
-    
-    # 4. Regla de Negocio
-    # Si no había nada que hacer (total=0), devolvemos todo (no penalty for chilling)
-    if total_relevant_blocks == 0:
-        return int(DEPOSIT_AMOUNT)
-
-    # Calculate rate
-    completion_rate = completed_count / total_relevant_blocks
-    print(f"💰 Payout Debug: Mode {mode} | {completed_count}/{total_relevant_blocks} ({completion_rate:.2%})")
-    
-    if completion_rate >= 0.8: # Umbral del 80% para éxito
-        # Retorno completo (Integer Math)
-        return DEPOSIT_AMOUNT
-    else:
-        # Penalización proporcional: Paga lo que fallaste
-        # Regla Dura (fija): -10% -> (Amount * 9) // 10
-        return (DEPOSIT_AMOUNT * 9) // 10
+def export_row(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Una configuración como fila de exportación: campos fijos, Wei como string, fechas ISO."""
+    row = {}
+    for field in EXPORT_FIELDS:
+        value = config.get(field)
+        if field in WEI_FIELDS and value is not None:
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        row[field] = value
+    return row
+
+async def jsonl_lines(cursor) -> AsyncIterator[str]:
+    """Un JSON por configuración, en cuanto llega del cursor."""
+    async for config in cursor:
+        yield json.dumps(export_row(config), ensure_ascii=False) + "\n"
+
+async def csv_lines(cursor) -> AsyncIterator[str]:
+    """Encabezado y una fila CSV por configuración, reutilizando un solo buffer."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(EXPORT_FIELDS)
+    yield flush()
+    async for config in cursor:
+        row = export_row(config)
+        row["selected_habit_ids"] = ";".join(row["selected_habit_ids"] or [])
+        writer.writerow(["" if row[field] is None else row[field] for field in EXPORT_FIELDS])
+        yield flush()
 
 # --- Endpoints ---
 
@@ -128,26 +160,110 @@ async def save_commitment_config(config: CommitmentConfig):
         {"$set": update_data},
         upsert=True
     )
+    commitment_config_service.invalidate(config.user_address, config.week_id)
+    # El modo o los hábitos seleccionados pueden haber cambiado: recalcular su libro
+    # (si se rinde por conflictos, get_ledger o rebuild_ledgers.py lo recalculan después)
+    await weekly_ledger_service.rebuild_quietly([{"user_address": config.user_address, "week_id": config.week_id}])
     return {"message": "Configuración de compromiso guardada", "mode": config.mode}
 
 @router.get("/config/{user_address}/{week_id}")
 async def get_commitment_config(user_address: str, week_id: int):
-    """Obtiene la configuración activa para una semana."""
-    config = await database.commitment_configs.find_one({
-        "user_address": user_address,
-        "week_id": week_id
-    })
+    """Obtiene la configuración activa para una semana (desde el cache si está fresca)."""
+    config = await commitment_config_service.get_config(user_address, week_id)
     
     if not config:
         return {"active": False, "mode": "NONE", "selected_habit_ids": []}
         
-    # Convert ObjectId to string if present (though pydantic usually handles response, manual dict helps here)
-    config.pop("_id", None)
     return {
         "active": True, 
         **config
     }
 
+@router.get("/config/cache-stats")
+async def get_config_cache_stats():
+    """Aciertos/fallos del cache de configuraciones (para revisar la tasa de aciertos)."""
+    return commitment_config_service.cache_stats()
+
+@router.get("/export")
+async def export_commitments(
+    from_week: Optional[int] = None,
+    to_week: Optional[int] = None,
+    export_format: Literal["jsonl", "csv"] = Query("jsonl", alias="format")
+):
+    """
+    Exporta commitment_configs (depósitos, modos, liquidaciones, montos devueltos)
+    para conciliación contable, como JSONL o CSV.
+    
+    Se transmite desde un cursor de Motor con proyección: cada fila sale en
+    cuanto llega de Mongo, así que la memoria es constante aunque sean
+    millones de filas. Los montos en Wei van como strings (sin pérdida).
+    
+    Ejemplo:
+    - GET /finance/export?from_week=1&to_week=12&format=csv
+    """
+    if from_week is not None and to_week is not None and from_week > to_week:
+        raise HTTPException(status_code=400, detail="from_week debe ser menor o igual que to_week")
+    
+    # Rango de semanas sobre el índice (week_id, _id)
+    query: Dict[str, Any] = {}
+    if from_week is not None or to_week is not None:
+        query["week_id"] = {}
+        if from_week is not None:
+            query["week_id"]["$gte"] = from_week
+        if to_week is not None:
+            query["week_id"]["$lte"] = to_week
+    
+    cursor = database.commitment_configs.find(
+        query, {field: 1 for field in EXPORT_FIELDS}
+    ).sort([("week_id", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    
+    weeks = f"{from_week if from_week is not None else 'all'}-{to_week if to_week is not None else 'all'}"
+    if export_format == "csv":
+        lines, media_type = csv_lines(cursor), "text/csv"
+    else:
+        lines, media_type = jsonl_lines(cursor), "application/x-ndjson"
+    return StreamingResponse(
+        lines,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="commitments_{weeks}.{export_format}"'}
+    )
+
+@router.get("/payout/projection/{user_address}/{week_id}")
+async def get_projected_payout(
+    user_address: str,
+    week_id: int,
+    deposit_amount: Optional[str] = None,
+    chain_id: int = settlement_service.DEFAULT_CHAIN_ID
+):
+    """
+    Pago proyectado en vivo: cuánto se devolvería si la semana se liquidara ahora.
+    
+    Lee el libro semanal (un solo documento). Si no se envía deposit_amount
+    (en Wei, como string), se usa el depósito indexado de HabitEscrow.
+    """
+    ledger = await weekly_ledger_service.get_ledger(user_address, week_id)
+    
+    if deposit_amount is None:
+        deposit_wei = await escrow_indexer_service.get_deposit(user_address, week_id, chain_id)
+    else:
+        try:
+            deposit_wei = int(deposit_amount) if deposit_amount else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid integer amount. Send Wei as string.")
+    
+    total = ledger["relevant_blocks"]
+    completed = ledger["completed_blocks"]
+    return {
+        "user_address": user_address,
+        "week_id": week_id,
+        "mode": ledger["mode"],
+        "relevant_blocks": total,
+        "completed_blocks": completed,
+        "completion_rate": round((completed / total) * 100) if total > 0 else 0,
+        "deposit_amount": str(deposit_wei),
+        "projected_amount_to_return": str(settlement_service.apply_payout_rule(deposit_wei, total, completed))
+    }
+
 @router.post("/settlement/sign", response_model=SettlementResponse)
 async def sign_settlement(req: SettlementRequest):
     """
@@ -160,40 +276,56 @@ async def sign_settlement(req: SettlementRequest):
         if not contract_address:
             raise HTTPException(status_code=500, detail="Contract address not configured in backend")
 
-        # --- WEI PROTOCOL: VALIDATION ---
-        # Rechazar explícitamente cualquier cosa que parezca un decimal
-        if req.deposit_amount and any(c in req.deposit_amount for c in ['.', ',']):
-             raise HTTPException(
-                status_code=400, 
-                detail="Invalid format. Protocol requires atomic units (Wei/Satoshi) as integer strings. No decimals allowed."
-            )
+        # --- DEPÓSITO REAL: eventos Deposited/Withdrawn ya indexados (sin RPC aquí) ---
+        chain_id = req.chain_id or settlement_service.DEFAULT_CHAIN_ID
+        deposit_amount = await escrow_indexer_service.get_deposit(req.user_address, req.week_id, chain_id)
+        if deposit_amount == 0:
+            raise HTTPException(status_code=404, detail="No hay depósito indexado para esta semana")
+        logger.debug("Depósito indexado de %s semana %s: %s", req.user_address, req.week_id, deposit_amount)
 
-        # Convertir con seguridad
-        try:
-            deposit_amount = int(req.deposit_amount) if req.deposit_amount else 0
-        except ValueError:
-             raise HTTPException(status_code=400, detail="Invalid integer amount. Send Wei as string.")
+        # 2. ¿Ya hay una firma vigente (del job de fin de semana o de un intento
+        # anterior) calculada con esta misma versión del libro? Entonces son
+        # dos lecturas indexadas
+        ledger = await weekly_ledger_service.get_ledger(req.user_address, req.week_id)
+        prepared = await settlement_service.find_signature(
+            req.user_address, req.week_id, chain_id, deposit_amount, ledger.get("rev")
+        )
+        if prepared:
+            return {
+                "signature": prepared["signature"],
+                "amount_to_return": int(prepared["amount_to_return"]),
+                "deadline": prepared["deadline"],
+                "user_address": req.user_address,
+                "week_id": req.week_id
+            }
 
-        # 2. Validar lógica de negocio (Off-Chain)
-        amount_to_return = await calculate_payout(req.user_address, req.week_id, deposit_amount)
+        # 3. Validar lógica de negocio (Off-Chain)
+        amount_to_return = await calculate_payout(req.user_address, req.week_id, deposit_amount, ledger)
         
-        # 3. Configurar parámetros de seguridad
+        # 4. Configurar parámetros de seguridad
         deadline = int(time.time()) + 3600  # Firma válida por 1 hora
             
-        # 4. Generar Firma
+        # 5. Generar Firma
         signature = signer_service.generate_settlement_signature(
             user_address=req.user_address,
             week_id=req.week_id,
             amount_to_return=amount_to_return,
             deadline=deadline,
             contract_address=contract_address,
-            chain_id=req.chain_id
+            chain_id=chain_id
+        )
+        
+        # 6. Guardarla: los reintentos del cliente reciben esta misma firma
+        # (si otra petición igual firmó a la vez, se responde con la que quedó guardada)
+        stored = await settlement_service.store_signature(
+            req.user_address, req.week_id, chain_id, deposit_amount, ledger.get("rev"),
+            amount_to_return, signature, deadline
         )
         
         return {
-            "signature": signature,
-            "amount_to_return": amount_to_return,
-            "deadline": deadline,
+            "signature": stored["signature"],
+            "amount_to_return": int(stored["amount_to_return"]),
+            "deadline": stored["deadline"],
             "user_address": req.user_address,
             "week_id": req.week_id
         }
@@ -201,7 +333,7 @@ async def sign_settlement(req: SettlementRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error generando firma de liquidación: {str(e)}")
+        logger.exception("Error generando firma de liquidación")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/debug/settle", response_model=SettlementResponse)
@@ -210,20 +342,38 @@ async def debug_force_settle(req: SettlementRequest):
     ENDPOINT DE DEBUG: Fuerza la liquidación inmediata.
     Ignora si la semana ha terminado. Útil para testing.
     """
-    print(f"🧪 DEBUG: Forzando liquidación para {req.week_id} con deposito {req.deposit_amount}")
+    # sign_settlement ya lee (y registra) el depósito indexado
+    logger.info("DEBUG: Forzando liquidación de %s semana %s", req.user_address, req.week_id)
     return await sign_settlement(req)
 
 @router.post("/settlement/confirm")
 async def confirm_settlement(req: SettlementConfirmRequest):
-    """Marca un contrato como liquidado en la base de datos tras confirmar transacción en blockchain."""
+    """
+    Marca un contrato como liquidado en la base de datos tras confirmar transacción en blockchain.
+    
+    El tx_hash queda pendiente de verificación (settlement_verification = "PENDING"):
+    settlement_verification_service revisa el recibo en lote y, si no hay un
+    Withdrawn válido, el compromiso vuelve a ACTIVE.
+    """
     result = await database.commitment_configs.update_one(
         {"user_address": req.user_address, "week_id": req.week_id},
-        {"$set": {
-            "status": "SETTLED",
-            "settlement_tx_hash": req.tx_hash,
-            "amount_returned": req.amount_returned
-        }}
+        {
+            "$set": {
+                "status": "SETTLED",
+                "settlement_tx_hash": req.tx_hash,
+                "amount_returned": req.amount_returned,
+                "settlement_verification": "PENDING",
+                "settlement_confirmed_at": datetime.utcnow()
+            },
+            "$unset": {
+                "settlement_rejection": "",
+                "onchain_amount_returned": "",
+                "settlement_checked_at": "",
+                "settlement_check_attempts": ""
+            }
+        }
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Configuración no encontrada")
+    commitment_config_service.invalidate(req.user_address, req.week_id)
     return {"message": "Liquidación confirmada exitosamente"}
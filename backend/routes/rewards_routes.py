@@ -18,7 +18,8 @@ from models.reward import (
     TransactionConfirm
 )
 from services.blockchain_signer import signer_service
-from config.database import rewards_collection, database
+from services import timeblock_archive_service, timeblock_rollup_service
+from config.database import rewards_collection
 from datetime import datetime
 from typing import List, Tuple
 from bson import ObjectId
@@ -70,9 +71,9 @@ async def verify_task_completed(task_id: str) -> Tuple[bool, bool, str]:
     if not ObjectId.is_valid(task_id):
         return (False, False, f"El ID '{task_id}' no es un ID válido de MongoDB")
     
-    # Buscar la tarea en la colección de timeblocks
+    # Buscar la tarea en la colección de timeblocks (o en el archivo si es vieja)
     # Analogía: Ir al archivo y buscar el registro original
-    timeblock = await database.timeblocks.find_one({"_id": ObjectId(task_id)})
+    timeblock = await timeblock_archive_service.find_block({"_id": ObjectId(task_id)})
     
     if not timeblock:
         # La tarea no existe en la base de datos
@@ -357,17 +358,21 @@ async def get_user_stats(user_id: str):
         
         # 2. Contar timeblocks COMPLETADOS pero NO RECLAMADOS
         # Analogía: Ver cuántas tareas terminadas aún no han cobrado su recompensa
-        completed_timeblocks = await database.timeblocks.find({
-            "completed": True  # Solo los que están completados
-        }).to_list(length=1000)
-        
-        # Filtrar: solo los que NO están en claimed_task_ids
-        # (comparamos el _id del timeblock con los task_id reclamados)
-        pending_count = 0
-        for tb in completed_timeblocks:
-            tb_id = str(tb.get("_id"))
-            if tb_id not in claimed_task_ids:
-                pending_count += 1
+        # El total de completados sale de los rollups (incluyen los bloques
+        # archivados) y solo se consultan los bloques ya reclamados, por _id
+        total_completed = await timeblock_rollup_service.get_completed_total()
+        
+        claimed_ids = [ObjectId(t) for t in claimed_task_ids if t and ObjectId.is_valid(t)]
+        claimed_completed = 0
+        if claimed_ids:
+            cursor = await timeblock_archive_service.find_blocks(
+                {"_id": {"$in": claimed_ids}, "completed": True},
+                None,
+                projection={"_id": 1}
+            )
+            claimed_completed = len(await cursor.to_list(length=None))
+        
+        pending_count = max(0, total_completed - claimed_completed)
         
         # Calcular recompensas pendientes en tokens
         pending_rewards_amount = pending_count * REWARD_AMOUNT_PER_TASK
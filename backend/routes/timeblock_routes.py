@@ -1,178 +1,905 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from config.database import database
-from models.timeblock import TimeBlock
-from typing import List
+from models.timeblock import (
+    TimeBlock,
+    TimeBlockBulkOperation,
+    TimeBlockTemplate,
+    date_to_day,
+    minute_fields,
+    time_fields
+)
+from typing import Any, Dict, List, Optional
 from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timedelta
+import asyncio
+import json
+from services import (
+    heatmap_service,
+    streak_service,
+    timeblock_analytics_service,
+    timeblock_archive_service,
+    timeblock_copy_service,
+    timeblock_overlap_service,
+    timeblock_rollup_service,
+    timeblock_search_service,
+    timeblock_template_service,
+    timeblock_version_service
+)
+from services.timeblock_events_service import event_broker
 
 # Creamos el objeto router (nuestro mini-app)
 timeblock_router = APIRouter()
 
 
+# Ventanas permitidas para las estadísticas (en días)
+STATS_WINDOWS = (7, 30, 90)
+
+# Máximo de bloques aceptados en una sola petición bulk
+BULK_MAX_ITEMS = 500
+
+# Cada cuántos segundos se envía un "ping" SSE para mantener viva la conexión
+EVENTS_HEARTBEAT_SECONDS = 15
+
+# Documentos que Mongo envía por cada viaje del cursor al exportar
+EXPORT_BATCH_SIZE = 500
+
+# Resultados máximos por página en la búsqueda
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+def raise_if_overlaps(conflicts: List[str], reject_overlaps: bool) -> None:
+    """
+    Lanza HTTP 409 si hay bloques que chocan y el cliente pidió rechazarlos.
+    Si no, los conflictos solo se informan en la respuesta.
+    """
+    if conflicts and reject_overlaps:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "El bloque se solapa con otros bloques del día", "conflicts": conflicts}
+        )
+
+
+def not_modified(etag: str) -> Response:
+    """Respuesta 304: el cliente ya tiene la versión actual."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    """Agrega el ETag a la respuesta y pide al cliente revalidar siempre."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def parse_iso_date(value: str, field: str) -> str:
+    """
+    Valida que una fecha venga en formato "YYYY-MM-DD" y la retorna igual.
+    Lanza HTTP 400 si el formato no es válido.
+    """
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} debe tener formato YYYY-MM-DD")
+    return value
+
+
 # ============================================================
 # ENDPOINT DE ESTADÍSTICAS - Datos para las gráficas de progreso
 # ============================================================
 @timeblock_router.get("/timeblocks/stats")
-async def get_timeblock_stats():
+async def get_timeblock_stats(
+    response: Response,
+    days: int = 7,
+    if_none_match: Optional[str] = Header(None)
+):
     """
-    Calcula estadísticas de los últimos 7 días para las gráficas de progreso.
+    Calcula estadísticas de los últimos `days` días (7, 30 o 90) para las gráficas de progreso.
     
     Analogía: Es como un reporte semanal de productividad.
     Por cada día, cuenta cuántas tareas planeaste y cuántas completaste.
+    Los conteos salen de los rollups diarios (timeblock_daily_rollups),
+    así que leer 90 días cuesta lo mismo tenga la semana 10 o 10.000 bloques.
     
     Retorna:
     - daily: lista de {date, total, completed} por cada día
-    - weekly_total: total de bloques en la semana
-    - weekly_completed: bloques completados en la semana
+    - weekly_total: total de bloques en la ventana
+    - weekly_completed: bloques completados en la ventana
     - completion_rate: porcentaje de completados (0-100)
-    - current_streak: días consecutivos con al menos 1 bloque completado
+    - current_streak: días consecutivos (hasta hoy) con al menos 1 bloque completado
+    - longest_streak: la racha más larga de toda la historia
+    
+    Soporta If-None-Match: si nada cambió desde la última vez, responde 304.
     """
-    # 1. Generar las fechas de los últimos 7 días
+    if days not in STATS_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"days debe ser uno de {list(STATS_WINDOWS)}")
+    
+    # 1. Generar las fechas de la ventana (de la más antigua a hoy)
     # Usamos una lista de strings en formato ISO "2026-02-12"
     today = datetime.now()
     dates = []
-    for i in range(6, -1, -1):  # 6 días atrás hasta hoy
+    for i in range(days - 1, -1, -1):  # (days-1) días atrás hasta hoy
         d = today - timedelta(days=i)
         dates.append(d.strftime("%Y-%m-%d"))
     
-    # 2. Traer TODOS los timeblocks de esos 7 días en una sola consulta
-    # $in es como preguntar: "¿Tu fecha está en esta lista?"
-    all_blocks = await database.timeblocks.find(
-        {"date": {"$in": dates}}
-    ).to_list(500)
+    # ETag: cambia si cambia cualquier bloque/plantilla o si empieza un nuevo día
+    versions = await timeblock_version_service.get_versions([timeblock_version_service.ALL_KEY])
+    etag = timeblock_version_service.make_etag(
+        "stats", days, dates[-1], versions[timeblock_version_service.ALL_KEY]
+    )
+    if timeblock_version_service.etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
+    # 2. Leer los rollups diarios (una fila pequeña por día y hábito)
+    # en vez de escanear los timeblocks crudos
+    totals = await timeblock_rollup_service.get_daily_totals(dates[0], dates[-1])
     
-    # 3. Contar totales y completados por día
-    # Creamos un diccionario para acumular contadores por fecha
+    # Las ocurrencias virtuales de plantillas también son bloques planeados (sin completar)
+    virtual = await timeblock_template_service.virtual_daily_totals(dates[0], dates[-1])
+    
+    # 3. Rellenar los días sin bloques con ceros
     daily_stats = {}
     for date_str in dates:
-        daily_stats[date_str] = {"date": date_str, "total": 0, "completed": 0}
-    
-    for block in all_blocks:
-        date_key = block.get("date", "")
-        if date_key in daily_stats:
-            daily_stats[date_key]["total"] += 1
-            if block.get("completed", False):
-                daily_stats[date_key]["completed"] += 1
+        day = totals.get(date_str, {})
+        daily_stats[date_str] = {
+            "date": date_str,
+            "total": day.get("total", 0) + virtual.get(date_str, {}).get("total", 0),
+            "completed": day.get("completed", 0)
+        }
     
     # 4. Convertir a lista ordenada por fecha
     daily_list = [daily_stats[d] for d in dates]
     
-    # 5. Calcular totales semanales
+    # 5. Calcular totales de la ventana
     weekly_total = sum(d["total"] for d in daily_list)
     weekly_completed = sum(d["completed"] for d in daily_list)
     
     # 6. Tasa de cumplimiento (evitar división por cero)
     completion_rate = round((weekly_completed / weekly_total) * 100) if weekly_total > 0 else 0
     
-    # 7. Calcular racha: días consecutivos (desde hoy hacia atrás)
-    #    con al menos 1 bloque completado
-    current_streak = 0
-    for day in reversed(daily_list):
-        if day["completed"] > 0:
-            current_streak += 1
-        else:
-            break  # Primera vez que no hay completados, se rompe la racha
+    # 7. Rachas: se leen del estado incremental (toda la historia, no solo la ventana)
+    streaks = await streak_service.get_streaks(dates[-1])
     
     return {
         "daily": daily_list,
         "weekly_total": weekly_total,
         "weekly_completed": weekly_completed,
         "completion_rate": completion_rate,
-        "current_streak": current_streak
+        "current_streak": streaks["current_streak"],
+        "longest_streak": streaks["longest_streak"]
     }
 
+@timeblock_router.get("/timeblocks/heatmap")
+async def get_timeblock_heatmap(year: Optional[int] = None):
+    """
+    Heatmap anual estilo GitHub: bloques completados por cada día del año.
+    
+    Se lee un solo documento compacto (366 bytes), sin escanear timeblocks.
+    
+    Retorna:
+    - year: año consultado (por defecto, el actual)
+    - start_date: fecha del primer elemento de "counts" (1 de enero)
+    - counts: 366 enteros (0-255); en años no bisiestos el último queda en 0
+    """
+    year = year or datetime.now().year
+    if year < 1970 or year > 9999:
+        raise HTTPException(status_code=400, detail="year inválido")
+    
+    counts = await heatmap_service.get_heatmap(year)
+    return {"year": year, "start_date": f"{year}-01-01", "counts": counts}
+
+@timeblock_router.get("/timeblocks/analytics")
+async def get_timeblock_analytics(
+    habit_id: str,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to")
+):
+    """
+    Analíticas de un hábito en un rango de fechas.
+    
+    Se calculan con un solo pipeline de agregación y se guardan en cache
+    (con TTL) hasta que cambie algún bloque de ese hábito.
+    
+    Ejemplo:
+    - GET /timeblocks/analytics?habit_id=gym&from=2026-01-01&to=2026-01-31
+    
+    Retorna:
+    - total / completed: bloques planeados y completados
+    - completion_rate: porcentaje de completados (0-100)
+    - scheduled_minutes / completed_minutes: minutos planeados vs cumplidos
+    - hour_distribution: 24 elementos {hour, total, completed} según la hora de inicio
+    """
+    start = parse_iso_date(from_date, "from")
+    end = parse_iso_date(to_date, "to")
+    if start > end:
+        raise HTTPException(status_code=400, detail="from debe ser menor o igual que to")
+    
+    return await timeblock_analytics_service.get_habit_analytics(habit_id, start, end)
+
+@timeblock_router.get("/timeblocks/search")
+async def search_timeblocks(
+    q: str,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    completed: Optional[bool] = None,
+    page: int = 1,
+    page_size: int = 20
+):
+    """
+    Busca bloques por palabras del título, ordenados por relevancia.
+    
+    Usa el índice de texto de `title` (nunca escanea la colección).
+    
+    Ejemplos:
+    - GET /timeblocks/search?q=gym
+    - GET /timeblocks/search?q=leer&from=2026-01-01&to=2026-03-31&completed=true&page=2
+    
+    Retorna:
+    - results: bloques {id, title, habit_id, date, start_time, end_time, completed, score}
+    - has_more: si hay otra página
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q no puede estar vacío")
+    if page < 1 or not 1 <= page_size <= SEARCH_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"page debe ser >= 1 y page_size entre 1 y {SEARCH_MAX_PAGE_SIZE}"
+        )
+    
+    start_day = date_to_day(parse_iso_date(from_date, "from")) if from_date else None
+    end_day = date_to_day(parse_iso_date(to_date, "to")) if to_date else None
+    if start_day and end_day and start_day > end_day:
+        raise HTTPException(status_code=400, detail="from debe ser menor o igual que to")
+    
+    found = await timeblock_search_service.search_blocks(q, start_day, end_day, completed, page, page_size)
+    return {"q": q, "page": page, "page_size": page_size, **found}
+
 @timeblock_router.post("/timeblocks")
-async def create_timeblock(block: TimeBlock):
+async def create_timeblock(block: TimeBlock, reject_overlaps: bool = False):
+    """
+    Crea un bloque.
+    
+    Si se pisa con otros bloques del mismo día, la respuesta incluye sus IDs en
+    "conflicts". Con ?reject_overlaps=true, en vez de crearlo responde 409.
+    """
     # 1. Convertir el modelo a diccionario
     # 'dict()' transforma nuestro objeto Python a datos puros {clave: valor}
     # NOTA PRO: En versiones nuevas de Pydantic se prefiere block.model_dump(),
     # pero .dict() sigue funcionando por compatibilidad.
     block_dict = block.dict()
     
-    # 2. Insertar en la base de datos
+    # Guardar también la forma numérica (fecha real + minutos) para rangos con índice
+    block_dict.update(time_fields(block.date, block.start_time, block.end_time))
+    
+    # 2. Revisar si choca con otros bloques del mismo día
+    conflicts = await timeblock_overlap_service.check_overlaps(
+        block_dict["day"], block_dict["start_minute"], block_dict["end_minute"]
+    )
+    raise_if_overlaps(conflicts, reject_overlaps)
+    
+    # 3. Insertar en la base de datos
     # Usamos la colección "timeblocks". Si no existe, Mongo la crea.
     result = await database.timeblocks.insert_one(block_dict)
     
-    # 3. Confirmar éxito con el ID generado
-    return {"id": str(result.inserted_id), "message": "Bloque creado"}
+    # 4. Sumar el bloque al rollup de su día
+    await timeblock_rollup_service.record_block_created(block_dict)
+    
+    # 5. Confirmar éxito con el ID generado
+    return {"id": str(result.inserted_id), "message": "Bloque creado", "conflicts": conflicts}
+
+@timeblock_router.post("/timeblocks/bulk")
+async def create_timeblocks_bulk(items: List[Dict[str, Any]], reject_overlaps: bool = False):
+    """
+    Crea muchos bloques en una sola petición (p. ej. importar la semana del planner).
+    
+    Analogía: En vez de ir al buzón 150 veces con una carta cada vez,
+    llevas todas las cartas juntas en un solo viaje.
+    
+    - Cada elemento se valida con el modelo TimeBlock (en una sola pasada).
+    - Los válidos se guardan con un único insert_many sin orden (ordered=False):
+      si uno falla, los demás se insertan igual.
+    - Igual que al crear uno: los choques (con bloques del día o con elementos
+      anteriores del lote) se informan en "conflicts"; con ?reject_overlaps=true
+      ese elemento no se crea y lleva el error.
+    
+    Retorna:
+    - inserted: cuántos bloques se guardaron
+    - results: por cada elemento, {index, id, conflicts} o {index, error}
+    """
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BULK_MAX_ITEMS} bloques por petición")
+    
+    # 1. Validar todos los elementos, guardando el error de los que fallen
+    results: List[Dict[str, Any]] = [None] * len(items)
+    docs = []
+    doc_indexes = []  # Posición original de cada documento válido
+    for index, item in enumerate(items):
+        try:
+            block = TimeBlock(**item)
+            # El _id se asigna aquí para poder nombrar choques dentro del mismo lote
+            docs.append({"_id": ObjectId(), **block.dict(), **time_fields(block.date, block.start_time, block.end_time)})
+            doc_indexes.append(index)
+        except (ValidationError, TypeError) as e:
+            results[index] = {"index": index, "error": str(e)}
+    
+    # 2. Revisar choques de todo el lote (cada día se lee una sola vez)
+    conflicts_by_id = {}
+    all_conflicts = await timeblock_overlap_service.check_batch_overlaps(
+        [(doc["day"], doc["start_minute"], doc["end_minute"], str(doc["_id"])) for doc in docs],
+        skip_conflicting=reject_overlaps
+    )
+    accepted_docs, accepted_indexes = [], []
+    for doc, index, conflicts in zip(docs, doc_indexes, all_conflicts):
+        if conflicts and reject_overlaps:
+            results[index] = {"index": index, "error": "El bloque se solapa con otros bloques del día", "conflicts": conflicts}
+            continue
+        conflicts_by_id[doc["_id"]] = conflicts
+        accepted_docs.append(doc)
+        accepted_indexes.append(index)
+    docs, doc_indexes = accepted_docs, accepted_indexes
+    
+    # 3. Insertar todos los válidos en un solo viaje a Mongo
+    failed = {}
+    if docs:
+        try:
+            await database.timeblocks.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Con ordered=False, Mongo sigue con los demás y nos dice cuáles fallaron
+            for error in e.details.get("writeErrors", []):
+                failed[error["index"]] = error.get("errmsg", "Error al insertar")
+    
+    # 4. Armar la respuesta por elemento
+    inserted_docs = []
+    for position, doc in enumerate(docs):
+        index = doc_indexes[position]
+        if position in failed:
+            results[index] = {"index": index, "error": failed[position]}
+        else:
+            results[index] = {"index": index, "id": str(doc["_id"]), "conflicts": conflicts_by_id[doc["_id"]]}
+            inserted_docs.append(doc)
+    
+    # 5. Sumar los bloques insertados a los rollups con un solo bulk_write
+    await timeblock_rollup_service.record_bulk_changes((None, doc) for doc in inserted_docs)
+    
+    return {"inserted": len(inserted_docs), "results": results}
+
+@timeblock_router.post("/timeblocks/copy-week")
+async def copy_timeblocks_week(from_week: str, to_week: str):
+    """
+    Copia el plan de una semana a otra (semanas ISO "YYYY-Www").
+    
+    Todo ocurre dentro de MongoDB con un pipeline y $merge: los bloques no
+    viajan al servidor. Las copias quedan sin completar y repetir la misma
+    copia no duplica bloques.
+    
+    Ejemplo:
+    - POST /timeblocks/copy-week?from_week=2026-W07&to_week=2026-W08
+      → {"from_week": "2026-W07", "to_week": "2026-W08", "copied": 42}
+    """
+    try:
+        from_monday = timeblock_copy_service.parse_iso_week(from_week)
+        to_monday = timeblock_copy_service.parse_iso_week(to_week)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Las semanas deben tener formato YYYY-Www (ej: 2026-W07)")
+    if from_monday == to_monday:
+        raise HTTPException(status_code=400, detail="from_week y to_week deben ser distintas")
+    
+    try:
+        result = await timeblock_copy_service.copy_week(from_monday, to_monday)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "from_week": timeblock_copy_service.week_label(from_monday),
+        "to_week": timeblock_copy_service.week_label(to_monday),
+        **result
+    }
+
+@timeblock_router.patch("/timeblocks/bulk")
+async def update_timeblocks_bulk(operations: List[TimeBlockBulkOperation], reject_overlaps: bool = False):
+    """
+    Aplica muchas operaciones (completar, reprogramar, borrar) en una sola petición.
+    
+    Ejemplos: "marcar todo lo de hoy como hecho" o mover varios bloques arrastrándolos.
+    
+    Analogía: Es como entregarle al cajero una lista de trámites de una sola vez
+    en vez de hacer fila por cada trámite.
+    
+    Acciones:
+    - complete: {"id", "action": "complete", "completed": true/false}
+    - reschedule: {"id", "action": "reschedule", "start_time", "end_time"}
+    - delete: {"id", "action": "delete"}
+    
+    Retorna totales (matched/modified/deleted) y, por operación, si encontró y
+    modificó el bloque o el error correspondiente.
+    
+    Las reprogramaciones se revisan en orden, como en PUT /timeblocks/{id}/duration
+    (los bloques que la petición borra ya no cuentan): los choques van en
+    "conflicts" de cada operación o, con ?reject_overlaps=true, esa operación no
+    se aplica y lleva el error.
+    """
+    if len(operations) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BULK_MAX_ITEMS} operaciones por petición")
+    
+    # 1. Validar cada operación
+    results: List[Dict[str, Any]] = [None] * len(operations)
+    op_indexes = []  # Posición original de cada operación sobre un bloque real
+    virtual_indexes = []  # Operaciones sobre ocurrencias virtuales de plantillas
+    seen_ids = set()
+    for index, op in enumerate(operations):
+        error = None
+        occurrence = timeblock_template_service.parse_occurrence_id(op.id)
+        if not occurrence and not ObjectId.is_valid(op.id):
+            error = "ID inválido"
+        elif op.id in seen_ids:
+            # Dos operaciones sobre el mismo bloque no tienen un orden garantizado
+            error = "ID repetido en la misma petición"
+        elif op.action == "complete" and op.completed is None:
+            error = "La acción 'complete' requiere 'completed'"
+        elif op.action == "reschedule" and (op.start_time is None or op.end_time is None):
+            error = "La acción 'reschedule' requiere 'start_time' y 'end_time'"
+        
+        if error:
+            results[index] = {"index": index, "id": op.id, "action": op.action, "error": error}
+            continue
+        
+        seen_ids.add(op.id)
+        if occurrence:
+            virtual_indexes.append(index)
+        else:
+            op_indexes.append(index)
+    
+    # 2. Leer el estado previo de los bloques afectados (una sola consulta)
+    # Lo necesitamos para el día de cada bloque, los conteos y los rollups
+    ids = [ObjectId(operations[i].id) for i in op_indexes]
+    before_by_id = {}
+    if ids:
+        async for block in database.timeblocks.find({"_id": {"$in": ids}}):
+            before_by_id[str(block["_id"])] = block
+    
+    # 3. Revisar choques de las reprogramaciones (cada día se lee una sola vez)
+    reschedule_indexes = [i for i in sorted(op_indexes + virtual_indexes) if operations[i].action == "reschedule"]
+    slots = []
+    for index in reschedule_indexes:
+        op = operations[index]
+        occurrence = timeblock_template_service.parse_occurrence_id(op.id)
+        before = before_by_id.get(op.id)
+        if occurrence:
+            day = date_to_day(occurrence[1])
+        elif before is not None:
+            day = before.get("day") or date_to_day(before.get("date"))
+        else:
+            day = None  # El bloque no existe: la operación responderá matched 0
+        minutes = minute_fields(op.start_time, op.end_time)
+        slots.append((day, minutes["start_minute"], minutes["end_minute"], op.id))
+    
+    conflicts_by_index = {}
+    all_conflicts = await timeblock_overlap_service.check_batch_overlaps(
+        slots,
+        skip_conflicting=reject_overlaps,
+        removed_ids=[operations[i].id for i in op_indexes + virtual_indexes if operations[i].action == "delete"]
+    )
+    for index, conflicts in zip(reschedule_indexes, all_conflicts):
+        if conflicts and reject_overlaps:
+            results[index] = {
+                "index": index, "id": operations[index].id, "action": "reschedule",
+                "error": "El bloque se solapa con otros bloques del día", "conflicts": conflicts
+            }
+        else:
+            conflicts_by_index[index] = conflicts
+    op_indexes = [i for i in op_indexes if results[i] is None]
+    virtual_indexes = [i for i in virtual_indexes if results[i] is None]
+    
+    # 4. Construir el equivalente de cada operación para bulk_write
+    write_ops = []
+    for index in op_indexes:
+        op = operations[index]
+        selector = {"_id": ObjectId(op.id)}
+        if op.action == "complete":
+            write_ops.append(UpdateOne(selector, {"$set": {"completed": op.completed}}))
+        elif op.action == "reschedule":
+            write_ops.append(UpdateOne(selector, {"$set": {
+                "start_time": op.start_time,
+                "end_time": op.end_time,
+                **minute_fields(op.start_time, op.end_time)
+            }}))
+        else:
+            write_ops.append(DeleteOne(selector))
+    
+    # 5. Ejecutar todas las operaciones en un solo viaje, sin orden
+    failed = {}
+    totals = {"matched": 0, "modified": 0, "deleted": 0}
+    if write_ops:
+        try:
+            summary = await database.timeblocks.bulk_write(write_ops, ordered=False)
+            totals = {"matched": summary.matched_count, "modified": summary.modified_count, "deleted": summary.deleted_count}
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed[error["index"]] = error.get("errmsg", "Error al escribir")
+            totals = {"matched": e.details.get("nMatched", 0), "modified": e.details.get("nModified", 0), "deleted": e.details.get("nRemoved", 0)}
+    
+    # 6. Resultado por operación + cambios para los rollups
+    changes = []
+    for position, index in enumerate(op_indexes):
+        op = operations[index]
+        result = {"index": index, "id": op.id, "action": op.action}
+        if index in conflicts_by_index:
+            result["conflicts"] = conflicts_by_index[index]
+        before = before_by_id.get(op.id)
+        
+        if position in failed:
+            result["error"] = failed[position]
+        elif before is None:
+            result.update({"matched": 0, "modified": 0})
+        elif op.action == "delete":
+            result.update({"matched": 1, "modified": 1})
+            changes.append((before, None))
+        else:
+            if op.action == "complete":
+                after = {**before, "completed": op.completed}
+            else:
+                after = {**before, "start_time": op.start_time, "end_time": op.end_time}
+            result.update({"matched": 1, "modified": int(after != before)})
+            changes.append((before, after))
+        
+        results[index] = result
+    
+    # 7. Ajustar los rollups con un solo bulk_write
+    await timeblock_rollup_service.record_bulk_changes(changes)
+    
+    # 8. Ocurrencias virtuales: se materializan u omiten una por una
+    # (normalmente son pocas: una por plantilla y día)
+    for index in virtual_indexes:
+        op = operations[index]
+        result = {"index": index, "id": op.id, "action": op.action, "matched": 1, "modified": 1}
+        if index in conflicts_by_index:
+            result["conflicts"] = conflicts_by_index[index]
+        occurrence = timeblock_template_service.parse_occurrence_id(op.id)
+        if op.action == "delete":
+            if not await timeblock_template_service.skip_occurrence(*occurrence):
+                result.update({"matched": 0, "modified": 0})
+            else:
+                totals["deleted"] += 1
+        else:
+            if op.action == "complete":
+                op_changes = {"completed": op.completed}
+            else:
+                op_changes = {"start_time": op.start_time, "end_time": op.end_time, **minute_fields(op.start_time, op.end_time)}
+            try:
+                await timeblock_template_service.materialize_occurrence(*occurrence, op_changes)
+                totals["matched"] += 1
+                totals["modified"] += 1
+            except ValueError:
+                result.update({"matched": 0, "modified": 0})
+        results[index] = result
+    
+    return {**totals, "results": results}
 
 @timeblock_router.get("/timeblocks", response_model=List[TimeBlock])
-async def get_timeblocks(date: str = None):
+async def get_timeblocks(
+    response: Response,
+    date: str = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """
     Obtiene timeblocks. Si se proporciona 'date', filtra por ese día.
     Formato date: "2026-02-05" (ISO 8601 YYYY-MM-DD)
     
     Ejemplos:
-    - GET /timeblocks → Devuelve TODOS los bloques
+    - GET /timeblocks → Los 100 bloques de los días más recientes de la colección
+      caliente (día descendente, luego hora de inicio); el archivo no se recorre
     - GET /timeblocks?date=2026-02-05 → Solo bloques del 5 de febrero
+    
+    Si la fecha es anterior a la marca de agua del archivo, también se busca
+    en `timeblocks_archive`.
+    
+    Con 'date', también incluye las ocurrencias virtuales de las plantillas
+    recurrentes (ID "tpl_<template_id>_<fecha>") que aún no tienen documento real.
+    
+    Soporta If-None-Match: si el día no cambió, responde 304 sin consultar timeblocks.
     """
-    # 1. Construir query de filtrado
+    # 1. Construir query de filtrado y la clave de versión (ETag) correspondiente
     if date:
-        # Filtrar por fecha específica
-        query = {"date": date}
+        # Filtrar por fecha específica (campo numérico "day", indexado)
+        day = date_to_day(date)
+        if day is None:
+            raise HTTPException(status_code=400, detail="date debe tener formato YYYY-MM-DD")
+        query = {"day": day}
+        version_keys = [timeblock_version_service.date_key(date), timeblock_version_service.TEMPLATES_KEY]
     else:
-        # Sin filtro, devuelve todos (comportamiento actual para compatibilidad)
+        # Sin filtro: los días más recientes de la colección caliente (el archivo no se recorre)
         query = {}
+        version_keys = [timeblock_version_service.ALL_KEY]
+    
+    # Si el cliente ya tiene esta versión, no hace falta consultar los bloques
+    versions = await timeblock_version_service.get_versions(version_keys)
+    etag = timeblock_version_service.make_etag("timeblocks", date or "all", *(versions[k] for k in version_keys))
+    if timeblock_version_service.etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     
     # 2. Buscar documentos con el filtro aplicado
-    blocks = await database.timeblocks.find(query).to_list(100)
+    # (un día archivado también se busca en timeblocks_archive)
+    if date:
+        cursor = await timeblock_archive_service.find_blocks(query, query["day"], sort=[("start_minute", 1)])
+    else:
+        # Los días más recientes primero (índice (day -1, start_minute 1))
+        cursor = database.timeblocks.find(query).sort([("day", -1), ("start_minute", 1)])
+    blocks = await cursor.to_list(100)
     
     # 3. FastAPI se encarga automágicamente de convertirlos a JSON
     # Truco: Mapeamos el "_id" de Mongo al "id" de nuestro modelo
     for block in blocks:
         block["id"] = str(block["_id"])
+    
+    # 4. Agregar las ocurrencias virtuales del día (no existen en la colección)
+    if date:
+        blocks.extend(await timeblock_template_service.expand_occurrences(date))
     return blocks
 
+
+@timeblock_router.get("/timeblocks/conflicts")
+async def get_timeblock_conflicts(date: str):
+    """
+    Lista todos los pares de bloques que se solapan en un día.
+    
+    Solo se leen las horas (start_minute/end_minute) del día y los pares se
+    encuentran con un barrido O(n log n), sin descargar los bloques completos.
+    
+    Ejemplo:
+    - GET /timeblocks/conflicts?date=2026-02-12
+      → {"date": "2026-02-12", "conflicts": [{"a": "<id>", "b": "<id>"}]}
+    """
+    day = date_to_day(parse_iso_date(date, "date"))
+    intervals = await timeblock_overlap_service.load_day_intervals(day)
+    pairs = timeblock_overlap_service.overlapping_pairs(intervals)
+    return {"date": date, "conflicts": [{"a": a, "b": b} for a, b in pairs]}
+
+
+@timeblock_router.get("/timeblocks/events")
+async def stream_timeblock_events(
+    request: Request,
+    date: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Server-Sent Events con los cambios de timeblocks (insert/update/delete).
+    
+    Todos los clientes comparten UN change stream de MongoDB; cada uno recibe
+    solo los cambios de su fecha (?date=YYYY-MM-DD) o todos si no la indica.
+    Al reconectarse, el navegador envía Last-Event-ID y se reenvían los eventos
+    perdidos; si ya no se pueden recuperar llega un evento "reset".
+    
+    Ejemplo (frontend):
+        new EventSource("/timeblocks/events?date=2026-02-12")
+    """
+    if date:
+        parse_iso_date(date, "date")
+    
+    subscriber = event_broker.subscribe(date, last_event_id)
+    
+    async def sse_messages():
+        try:
+            while not await request.is_disconnected():
+                # Cola desbordada o historial perdido: el cliente debe recargar
+                if subscriber.overflowed:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                try:
+                    token, event = await asyncio.wait_for(subscriber.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies/túneles
+                    yield ": ping\n\n"
+                    continue
+                data = json.dumps(event, default=str, ensure_ascii=False)
+                yield f"id: {token}\nevent: {event['operation']}\ndata: {data}\n\n"
+        finally:
+            event_broker.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        sse_messages(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ============================================================
+# PLANTILLAS RECURRENTES
+# ============================================================
+@timeblock_router.post("/timeblocks/templates")
+async def create_timeblock_template(template: TimeBlockTemplate):
+    """
+    Crea una plantilla recurrente (daily, weekdays o custom con weekday_mask).
+    Sus ocurrencias aparecen en GET /timeblocks?date= sin escribir un bloque por día.
+    """
+    try:
+        template_id = await timeblock_template_service.create_template(template)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": template_id, "message": "Plantilla creada"}
+
+@timeblock_router.get("/timeblocks/templates")
+async def get_timeblock_templates():
+    """Lista las plantillas recurrentes."""
+    return await timeblock_template_service.list_templates()
+
+@timeblock_router.delete("/timeblocks/templates/{id}")
+async def delete_timeblock_template(id: str):
+    """
+    Borra una plantilla. Los bloques que ya se materializaron (completados/editados) se conservan.
+    """
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+    
+    if not await timeblock_template_service.delete_template(id):
+        raise HTTPException(status_code=404, detail="Plantilla no encontrada")
+    
+    return {"message": "Plantilla eliminada correctamente"}
+
+@timeblock_router.get("/timeblocks/export")
+async def export_timeblocks(
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to")
+):
+    """
+    Exporta los timeblocks de un rango de fechas como NDJSON (un JSON por línea).
+    
+    Analogía: En vez de llenar un camión entero antes de salir (to_list),
+    es una cinta transportadora: cada bloque sale en cuanto llega de Mongo.
+    La memoria se mantiene constante aunque exportes un año completo.
+    
+    Ejemplo:
+    - GET /timeblocks/export?from=2026-01-01&to=2026-12-31
+    """
+    # 1. Validar el rango
+    start = parse_iso_date(from_date, "from")
+    end = parse_iso_date(to_date, "to")
+    if start > end:
+        raise HTTPException(status_code=400, detail="from debe ser menor o igual que to")
+    
+    # 2. Cursor asíncrono ordenado, que trae EXPORT_BATCH_SIZE documentos por viaje
+    # Rango semiabierto [start, end + 1 día) sobre el índice (day, start_minute)
+    day_range = {"$gte": date_to_day(start), "$lt": date_to_day(end) + timedelta(days=1)}
+    # Si el rango llega a días archivados, el cursor también lee timeblocks_archive
+    cursor = await timeblock_archive_service.find_blocks(
+        {"day": day_range},
+        date_to_day(start),
+        projection={"day": 0, "start_minute": 0, "end_minute": 0},
+        sort=[("day", 1), ("start_minute", 1)],
+        batch_size=EXPORT_BATCH_SIZE
+    )
+    
+    # 3. Generador: produce una línea por bloque sin acumular la lista
+    async def ndjson_lines():
+        async for block in cursor:
+            block["id"] = str(block.pop("_id"))
+            yield json.dumps(block, default=str, ensure_ascii=False) + "\n"
+    
+    filename = f"timeblocks_{start}_{end}.ndjson"
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @timeblock_router.put("/timeblocks/{id}")
 async def update_timeblock(id: str, completed: bool):
+    # 0. Ocurrencia virtual de una plantilla: se materializa con el nuevo estado
+    occurrence = timeblock_template_service.parse_occurrence_id(id)
+    if occurrence:
+        try:
+            block = await timeblock_template_service.materialize_occurrence(*occurrence, {"completed": completed})
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return {"message": "Estado actualizado correctamente", "id": str(block["_id"])}
+    
     # 1. Verificar ID válido
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="ID inválido")
     
     # 2. Actualizar en Mongo
     # $set es el operador para "modificar solo esto y dejar lo demás igual"
-    result = await database.timeblocks.update_one(
+    # ReturnDocument.BEFORE nos devuelve cómo estaba el bloque ANTES del cambio
+    before = await database.timeblocks.find_one_and_update(
         {"_id": ObjectId(id)}, 
-        {"$set": {"completed": completed}}
+        {"$set": {"completed": completed}},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Bloque no encontrado")
+    
+    # 3. Ajustar el rollup solo con la diferencia (p. ej. +1 completado)
+    await timeblock_rollup_service.record_block_changed(before, {**before, "completed": completed})
         
     return {"message": "Estado actualizado correctamente"}
 
 @timeblock_router.put("/timeblocks/{id}/duration")
-async def update_timeblock_duration(id: str, start_time: str, end_time: str):
+async def update_timeblock_duration(id: str, start_time: str, end_time: str, reject_overlaps: bool = False):
     """
     Actualiza el tiempo de inicio y fin de un bloque.
     Esto permite persistir cambios de duración cuando el usuario expande o reduce un bloque.
+    
+    Igual que al crear: los choques con otros bloques se informan en "conflicts"
+    o, con ?reject_overlaps=true, se rechazan con 409.
     """
+    minutes = minute_fields(start_time, end_time)
+    
+    # 0. Ocurrencia virtual de una plantilla: se materializa con las nuevas horas
+    occurrence = timeblock_template_service.parse_occurrence_id(id)
+    if occurrence:
+        conflicts = await timeblock_overlap_service.check_overlaps(
+            date_to_day(occurrence[1]), minutes["start_minute"], minutes["end_minute"], exclude_id=id
+        )
+        raise_if_overlaps(conflicts, reject_overlaps)
+        try:
+            await timeblock_template_service.materialize_occurrence(
+                *occurrence, {"start_time": start_time, "end_time": end_time, **minutes}
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return {"message": "Duración actualizada correctamente", "conflicts": conflicts}
+    
     # 1. Verificar ID válido
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="ID inválido")
     
-    # 2. Actualizar ambos campos en Mongo
-    result = await database.timeblocks.update_one(
+    # 2. Buscar el día del bloque (solo ese campo) y revisar choques
+    current = await database.timeblocks.find_one({"_id": ObjectId(id)}, {"day": 1, "date": 1})
+    if current is None:
+        raise HTTPException(status_code=404, detail="Bloque no encontrado")
+    
+    day = current.get("day") or date_to_day(current.get("date"))
+    conflicts = await timeblock_overlap_service.check_overlaps(
+        day, minutes["start_minute"], minutes["end_minute"], exclude_id=id
+    )
+    raise_if_overlaps(conflicts, reject_overlaps)
+    
+    # 3. Actualizar ambos campos en Mongo
+    before = await database.timeblocks.find_one_and_update(
         {"_id": ObjectId(id)}, 
-        {"$set": {"start_time": start_time, "end_time": end_time}}
+        {"$set": {"start_time": start_time, "end_time": end_time, **minutes}},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Bloque no encontrado")
+    
+    # 4. Ajustar los minutos planeados en el rollup
+    await timeblock_rollup_service.record_block_changed(
+        before, {**before, "start_time": start_time, "end_time": end_time}
+    )
         
-    return {"message": "Duración actualizada correctamente"}
+    return {"message": "Duración actualizada correctamente", "conflicts": conflicts}
 
 @timeblock_router.delete("/timeblocks/{id}")
 async def delete_timeblock(id: str):
+    # 0. Ocurrencia virtual: se marca la fecha como omitida en la plantilla
+    occurrence = timeblock_template_service.parse_occurrence_id(id)
+    if occurrence:
+        if not await timeblock_template_service.skip_occurrence(*occurrence):
+            raise HTTPException(status_code=404, detail="Plantilla no encontrada")
+        return {"message": "Bloque eliminado correctamente"}
+    
     # 1. Validar ID de MongoDB
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="ID inválido")
     
-    # 2. Intentar borrar
-    result = await database.timeblocks.delete_one({"_id": ObjectId(id)})
+    # 2. Intentar borrar (nos devuelve el bloque borrado para restarlo del rollup)
+    deleted = await database.timeblocks.find_one_and_delete({"_id": ObjectId(id)})
     
     # 3. Verificar si se borró algo
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Bloque no encontrado")
+    
+    # 4. Restar el bloque del rollup de su día
+    await timeblock_rollup_service.record_block_deleted(deleted)
+    
+    # 5. Si venía de una plantilla, la ocurrencia no debe volver a aparecer
+    if deleted.get("template_id"):
+        await timeblock_template_service.skip_occurrence(deleted["template_id"], deleted["date"])
         
     return {"message": "Bloque eliminado correctamente"}
\ No newline at end of file
@@ -17,9 +17,12 @@ from eth_account import Account
 from eth_account.messages import encode_defunct
 from web3 import Web3
 import os
+import logging
 from typing import Dict
 import time
 
+logger = logging.getLogger(__name__)
+
 
 class BlockchainSigner:
     """
@@ -45,7 +48,7 @@ class BlockchainSigner:
         # Dirección pública del firmante (backend)
         self.signer_address = self.account.address
         
-        print(f"✅ BlockchainSigner inicializado. Dirección: {self.signer_address}")
+        logger.info("BlockchainSigner inicializado. Dirección: %s", self.signer_address)
     
     def generate_claim_signature(
         self, 
@@ -0,0 +1,101 @@
+"""
+Servicio de Configuraciones de Compromiso (con cache) 📌
+
+Lee `commitment_configs` a través de un cache en memoria (LRU con TTL).
+Una configuración (user_address, week_id) solo cambia al guardarla
+(save_commitment_config) o al confirmar su liquidación (confirm_settlement);
+esas dos rutas invalidan su entrada de forma explícita.
+
+Analogía: Es como tener en el escritorio la ficha del cliente que estás
+atendiendo. No vas al archivo cada vez que la miras; solo vuelves cuando
+alguien la modifica o cuando ya pasó un rato.
+
+Detalles:
+- También se guarda "no existe" (None): el frontend pregunta por semanas
+  sin configuración en cada carga de página.
+- El TTL limita cuánto puede tardar en verse un cambio hecho por OTRO
+  proceso del servidor (la invalidación explícita es solo local).
+- Una lectura que empezó antes de una invalidación no guarda su resultado:
+  cada invalidate() anota su número (`_epoch`) y la lectura solo guarda si
+  su llave no se invalidó después de que empezó. Si no, una lectura lenta
+  volvería a meter la configuración vieja por todo el TTL.
+- Los contadores de aciertos/fallos se exponen en /finance/config/cache-stats.
+"""
+
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config.database import database
+
+# Segundos que una configuración puede servirse desde el cache
+CONFIG_CACHE_TTL_SECONDS = 60
+
+# Máximo de configuraciones guardadas (se descartan las menos usadas)
+CONFIG_CACHE_MAX_ENTRIES = 1024
+
+# (user_address, week_id) -> (expira_en, configuración o None)
+_cache: "OrderedDict[Tuple[str, int], Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+# Número de la última invalidación, y en qué número se invalidó cada llave
+# (las más viejas se descartan; _forgotten_epoch guarda la mayor descartada)
+_epoch = 0
+_invalidated_at: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+_forgotten_epoch = 0
+
+
+async def get_config(user_address: str, week_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Configuración de una semana (sin _id), o None si no existe.
+    Retorna una copia: quien la modifique no altera el cache.
+    """
+    key = (user_address, week_id)
+    cached = _cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        _stats["hits"] += 1
+        _cache.move_to_end(key)
+        return copy.deepcopy(cached[1])
+
+    _stats["misses"] += 1
+    started_at = _epoch
+    config = await database.commitment_configs.find_one(
+        {"user_address": user_address, "week_id": week_id}, {"_id": 0}
+    )
+    # ¿Alguien escribió esta configuración mientras la leíamos? Entonces no se guarda
+    if _invalidated_at.get(key, _forgotten_epoch) > started_at:
+        return copy.deepcopy(config)
+
+    _cache[key] = (time.monotonic() + CONFIG_CACHE_TTL_SECONDS, config)
+    _cache.move_to_end(key)
+    while len(_cache) > CONFIG_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return copy.deepcopy(config)
+
+
+def invalidate(user_address: str, week_id: int) -> None:
+    """Olvida la configuración de una semana (llamar después de escribirla)."""
+    global _epoch, _forgotten_epoch
+    key = (user_address, week_id)
+    _epoch += 1
+    _invalidated_at[key] = _epoch
+    _invalidated_at.move_to_end(key)
+    while len(_invalidated_at) > CONFIG_CACHE_MAX_ENTRIES:
+        _, forgotten = _invalidated_at.popitem(last=False)
+        _forgotten_epoch = max(_forgotten_epoch, forgotten)
+
+    if _cache.pop(key, None) is not None:
+        _stats["invalidations"] += 1
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Aciertos, fallos, tasa de aciertos y tamaño actual del cache."""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "size": len(_cache),
+        "max_entries": CONFIG_CACHE_MAX_ENTRIES,
+        "ttl_seconds": CONFIG_CACHE_TTL_SECONDS
+    }
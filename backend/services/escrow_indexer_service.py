@@ -0,0 +1,271 @@
+"""
+Servicio Indexador de Eventos de HabitEscrow ⛓️
+
+Lee los eventos `Deposited` y `Withdrawn` del contrato HabitEscrow con
+`eth_getLogs`, por rangos de bloques, y los guarda en `escrow_events`.
+La liquidación lee el depósito desde ahí: ya no confía en el monto que
+manda el cliente y no hace llamadas RPC mientras atiende una petición.
+
+Analogía: Es como el estado de cuenta del banco.
+El cajero no llama al banco central cada vez que alguien dice "yo deposité
+1 ETH": revisa el estado de cuenta, que se actualiza solo cada cierto tiempo.
+
+Detalles:
+- Tamaño de rango adaptable: si el nodo rechaza un rango (demasiados
+  resultados, timeout), se parte a la mitad y se reintenta; cada rango
+  exitoso lo duplica hasta ESCROW_LOG_MAX_CHUNK_BLOCKS.
+- Idempotente: cada log tiene _id = "<chain_id>:<tx_hash>:<log_index>" y se
+  escribe con $setOnInsert. Repetir un rango no duplica nada.
+- Punto de control: después de guardar cada rango se guarda el último bloque
+  indexado en `escrow_indexer_state`. Si el proceso se corta, continúa desde ahí.
+- Solo se indexan bloques con ESCROW_CONFIRMATIONS confirmaciones. Un reorg
+  más profundo que eso no se corrige solo (habría que reindexar el rango).
+- Las direcciones se guardan en minúsculas.
+
+Probar contra un nodo local (anvil): ver test_escrow_indexer.py.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from hexbytes import HexBytes
+from pymongo import ASCENDING, UpdateOne
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+
+from config.database import escrow_events_collection, escrow_indexer_state_collection
+
+logger = logging.getLogger(__name__)
+
+# Nodo RPC de la red donde vive HabitEscrow
+ESCROW_RPC_URL = os.getenv("ESCROW_RPC_URL") or os.getenv("BASE_SEPOLIA_RPC_URL")
+
+# Bloque desde el que se empieza a indexar (el del despliegue del contrato)
+ESCROW_START_BLOCK = int(os.getenv("ESCROW_START_BLOCK", "0"))
+
+# Confirmaciones antes de indexar un bloque (protege de reorgs poco profundos)
+ESCROW_CONFIRMATIONS = int(os.getenv("ESCROW_CONFIRMATIONS", "3"))
+
+# Tamaño inicial y máximo del rango de bloques por eth_getLogs
+ESCROW_LOG_CHUNK_BLOCKS = 2000
+ESCROW_LOG_MAX_CHUNK_BLOCKS = 10000
+
+# Cada cuántos segundos corre el indexador en segundo plano (0 = desactivado)
+ESCROW_INDEXER_INTERVAL_SECONDS = int(os.getenv("ESCROW_INDEXER_INTERVAL_SECONDS", "15"))
+
+# topic0 de cada evento (keccak de su firma)
+DEPOSITED_TOPIC = Web3.to_hex(Web3.keccak(text="Deposited(address,uint256,uint256)"))
+WITHDRAWN_TOPIC = Web3.to_hex(Web3.keccak(text="Withdrawn(address,uint256,uint256,uint256)"))
+
+# Mayor entero que cabe en un int64 de MongoDB (week_id y números de bloque)
+MAX_INT64 = 2 ** 63 - 1
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def _word(data: bytes, index: int) -> int:
+    """uint256 número `index` de los datos ABI de un log."""
+    return int.from_bytes(data[index * 32:(index + 1) * 32], "big")
+
+
+def decode_log(log: Dict[str, Any], chain_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Convierte un log de HabitEscrow en el documento de `escrow_events`.
+
+    Retorna None si no es Deposited/Withdrawn o si su weekId no cabe en
+    int64 (cualquiera puede llamar deposit() con un weekId absurdo).
+    """
+    topics = [HexBytes(topic) for topic in log["topics"]]
+    event = {DEPOSITED_TOPIC: "Deposited", WITHDRAWN_TOPIC: "Withdrawn"}.get(Web3.to_hex(topics[0]) if topics else None)
+    if event is None or len(topics) < 3:
+        return None
+
+    week_id = int.from_bytes(topics[2], "big")
+    if week_id > MAX_INT64:
+        return None
+
+    data = bytes(HexBytes(log["data"]))
+    tx_hash = Web3.to_hex(HexBytes(log["transactionHash"]))
+    doc = {
+        "_id": f"{chain_id}:{tx_hash}:{log['logIndex']}",
+        "chain_id": chain_id,
+        "contract": Web3.to_checksum_address(log["address"]).lower(),
+        "event": event,
+        "user_address": Web3.to_checksum_address(topics[1][-20:]).lower(),
+        "week_id": week_id,
+        "tx_hash": tx_hash,
+        "block_number": log["blockNumber"],
+        "block_hash": Web3.to_hex(HexBytes(log["blockHash"])),
+        "log_index": log["logIndex"]
+    }
+    if event == "Deposited":
+        doc["amount"] = str(_word(data, 0))
+    else:
+        doc["amount_returned"] = str(_word(data, 0))
+        doc["penalty"] = str(_word(data, 1))
+    return doc
+
+
+def deposit_from_events(events: List[Dict[str, Any]]) -> int:
+    """
+    Depósito vigente según los eventos de un (usuario, semana), en orden.
+    Deposited suma (se permite "top-up"); Withdrawn lo deja en 0 (el contrato borra el depósito).
+    """
+    deposit = 0
+    for event in events:
+        deposit = deposit + int(event["amount"]) if event["event"] == "Deposited" else 0
+    return deposit
+
+
+# ============================================
+# 📖 LECTURAS (sin RPC)
+# ============================================
+
+async def ensure_indexes() -> None:
+    """Eventos de un (red, usuario, semana) en orden de la cadena."""
+    await escrow_events_collection.create_index([
+        ("chain_id", ASCENDING),
+        ("user_address", ASCENDING),
+        ("week_id", ASCENDING),
+        ("block_number", ASCENDING),
+        ("log_index", ASCENDING)
+    ])
+
+
+async def get_deposit(user_address: str, week_id: int, chain_id: int) -> int:
+    """Depósito indexado (Wei) de un usuario para una semana; 0 si no hay."""
+    events = await escrow_events_collection.find(
+        {"chain_id": chain_id, "user_address": user_address.lower(), "week_id": week_id},
+        {"event": 1, "amount": 1}
+    ).sort([("block_number", ASCENDING), ("log_index", ASCENDING)]).to_list(length=None)
+    return deposit_from_events(events)
+
+
+async def get_deposits(week_id: int, user_addresses: List[str], chain_id: int) -> Dict[str, int]:
+    """
+    Depósitos indexados de muchos usuarios para la misma semana, con una sola consulta $in.
+    Las llaves son las direcciones tal como llegaron.
+    """
+    by_key: Dict[str, List[Dict[str, Any]]] = {user.lower(): [] for user in user_addresses}
+    cursor = escrow_events_collection.find(
+        {"chain_id": chain_id, "week_id": week_id, "user_address": {"$in": list(by_key)}},
+        {"user_address": 1, "event": 1, "amount": 1}
+    ).sort([("block_number", ASCENDING), ("log_index", ASCENDING)])
+    async for event in cursor:
+        by_key[event["user_address"]].append(event)
+    return {user: deposit_from_events(by_key[user.lower()]) for user in user_addresses}
+
+
+# ============================================
+# ⛓️ INDEXADO
+# ============================================
+
+async def _save_events(logs: List[Dict[str, Any]], chain_id: int) -> int:
+    """Guarda los logs decodificados (idempotente). Retorna cuántos eran de HabitEscrow."""
+    docs = [doc for doc in (decode_log(log, chain_id) for log in logs) if doc]
+    if docs:
+        await escrow_events_collection.bulk_write(
+            [UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": doc}, upsert=True) for doc in docs],
+            ordered=False
+        )
+    return len(docs)
+
+
+async def index_events(
+    rpc_url: Optional[str] = None,
+    contract_address: Optional[str] = None,
+    confirmations: int = ESCROW_CONFIRMATIONS,
+    from_block: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Indexa los eventos nuevos hasta el último bloque confirmado.
+
+    Pasos:
+    1. Leer el punto de control (o empezar en ESCROW_START_BLOCK / from_block)
+    2. Por cada rango: eth_getLogs con los dos topics, guardar los eventos
+       y después mover el punto de control
+    3. Ajustar el tamaño del rango según responda el nodo
+
+    Args:
+        rpc_url: Nodo RPC (default ESCROW_RPC_URL)
+        contract_address: HabitEscrow (default HABIT_ESCROW_ADDRESS)
+        confirmations: Bloques de margen respecto a la punta de la cadena
+        from_block: Forzar el bloque inicial (ignora el punto de control)
+
+    Returns:
+        Reporte con la red, el rango indexado y cuántos eventos se guardaron
+
+    Raises:
+        ValueError: Si falta el nodo o la dirección del contrato
+    """
+    rpc_url = rpc_url or ESCROW_RPC_URL
+    contract_address = contract_address or os.getenv("HABIT_ESCROW_ADDRESS")
+    if not rpc_url or not contract_address:
+        raise ValueError("ESCROW_RPC_URL y HABIT_ESCROW_ADDRESS deben estar configuradas")
+
+    w3 = AsyncWeb3(AsyncHTTPProvider(rpc_url))
+    contract = Web3.to_checksum_address(contract_address)
+    chain_id, head = await asyncio.gather(w3.eth.chain_id, w3.eth.block_number)
+    state_id = f"{chain_id}:{contract.lower()}"
+
+    # 1. Punto de control
+    state = await escrow_indexer_state_collection.find_one({"_id": state_id}) or {}
+    start = from_block if from_block is not None else state.get("last_block", ESCROW_START_BLOCK - 1) + 1
+    chunk = state.get("chunk_size", ESCROW_LOG_CHUNK_BLOCKS)
+    safe_head = head - confirmations
+
+    report = {"chain_id": chain_id, "from_block": start, "to_block": safe_head, "events": 0, "ranges": 0}
+    block = start
+    while block <= safe_head:
+        to_block = min(block + chunk - 1, safe_head)
+
+        # 2. Un rango de logs; si el nodo lo rechaza, se parte a la mitad
+        try:
+            logs = await w3.eth.get_logs({
+                "address": contract,
+                "fromBlock": block,
+                "toBlock": to_block,
+                "topics": [[DEPOSITED_TOPIC, WITHDRAWN_TOPIC]]
+            })
+        except Exception as e:  # cada proveedor reporta "rango muy grande" a su manera
+            if chunk == 1:
+                raise
+            chunk = max(1, chunk // 2)
+            logger.warning("eth_getLogs falló en %s-%s (%s); rango reducido a %s", block, to_block, type(e).__name__, chunk)
+            continue
+
+        report["events"] += await _save_events(logs, chain_id)
+        report["ranges"] += 1
+        await escrow_indexer_state_collection.update_one(
+            {"_id": state_id},
+            {"$set": {"last_block": to_block, "chunk_size": chunk, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+        # 3. El rango funcionó: probar uno más grande
+        chunk = min(chunk * 2, ESCROW_LOG_MAX_CHUNK_BLOCKS)
+        block = to_block + 1
+
+    return report
+
+
+async def run_periodically() -> None:
+    """
+    Job en segundo plano: indexa cada ESCROW_INDEXER_INTERVAL_SECONDS segundos.
+    No arranca si falta la configuración; un error se reintenta en la siguiente vuelta.
+    """
+    if ESCROW_INDEXER_INTERVAL_SECONDS <= 0 or not ESCROW_RPC_URL or not os.getenv("HABIT_ESCROW_ADDRESS"):
+        return
+
+    while True:
+        try:
+            report = await index_events()
+            if report["events"]:
+                logger.info("Eventos de HabitEscrow indexados: %s (hasta el bloque %s)", report["events"], report["to_block"])
+        except Exception as e:  # nodo caído, error RPC o de Mongo: no detener el job
+            logger.warning("Error indexando HabitEscrow: %s: %s", type(e).__name__, e)
+        await asyncio.sleep(ESCROW_INDEXER_INTERVAL_SECONDS)
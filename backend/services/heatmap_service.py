@@ -0,0 +1,154 @@
+"""
+Servicio de Heatmap Anual de Completados 🟩
+
+Guarda, por año, cuántos bloques se completaron cada día en un arreglo
+compacto de 366 bytes (un byte por día, máximo 255) dentro de un solo
+campo binario de BSON en `completion_heatmaps`.
+
+Analogía: Es como el calendario de la pared donde tachas los días de gym.
+Para ver el año completo miras UNA hoja, no revisas cada recibo del gimnasio.
+
+- Lectura: un solo find_one de ~400 bytes por año.
+- Escritura: cuando cambia el número de completados de un día, se le suma
+  la diferencia a su byte (con control optimista de versión para no pisar
+  otros cambios). Corre en segundo plano, fuera de la petición
+  (timeblock_rollup_service); rebuild_rollups.py corrige cualquier desfase.
+- Si el año todavía no tiene heatmap, se construye una vez desde los rollups
+  diarios (máximo 366 filas por hábito).
+- Si los reintentos optimistas se agotan, el año se recalcula completo
+  desde los rollups (nunca se descarta un cambio).
+
+Nota: igual que las rachas, hay un único heatmap por año (la app aún no
+separa usuarios en timeblocks).
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+from bson.binary import Binary
+from pymongo.errors import DuplicateKeyError
+
+from config.database import completion_heatmaps_collection, timeblock_rollups_collection
+
+logger = logging.getLogger(__name__)
+
+# Un byte por día: años bisiestos incluidos
+DAYS_PER_YEAR = 366
+
+# Valor máximo que cabe en un byte
+MAX_DAY_COUNT = 255
+
+# Reintentos si otro proceso cambió el heatmap al mismo tiempo
+MAX_RETRIES = 5
+
+# Prefijo fijo del usuario (sin auth todavía; ver streak_service.STREAK_STATE_ID)
+HEATMAP_OWNER = "default_user"
+
+
+def heatmap_id(year: int) -> str:
+    """ID del documento de un año."""
+    return f"{HEATMAP_OWNER}:{year}"
+
+
+def day_index(date: str) -> int:
+    """Posición del día dentro del año (0 = 1 de enero)."""
+    return datetime.strptime(date, "%Y-%m-%d").timetuple().tm_yday - 1
+
+
+async def _counts_from_rollups(year: int) -> bytearray:
+    """Completados por día de un año, sumados desde los rollups diarios."""
+    counts = bytearray(DAYS_PER_YEAR)
+    cursor = timeblock_rollups_collection.aggregate([
+        {"$match": {"date": {"$gte": f"{year}-01-01", "$lte": f"{year}-12-31"}}},
+        {"$group": {"_id": "$date", "completed": {"$sum": "$completed"}}}
+    ])
+    async for row in cursor:
+        counts[day_index(row["_id"])] = max(0, min(row["completed"], MAX_DAY_COUNT))
+    return counts
+
+
+async def _build_from_rollups(year: int) -> Dict[str, Any]:
+    """
+    Construye el heatmap de un año desde los rollups diarios y lo guarda.
+    Si otro proceso lo creó primero, usa el suyo.
+    """
+    counts = await _counts_from_rollups(year)
+    doc = {"_id": heatmap_id(year), "year": year, "counts": Binary(bytes(counts)), "version": 0}
+    try:
+        await completion_heatmaps_collection.insert_one(doc)
+    except DuplicateKeyError:
+        return await completion_heatmaps_collection.find_one({"_id": heatmap_id(year)})
+    return doc
+
+
+async def _get_or_build(year: int) -> Dict[str, Any]:
+    """Documento del año (lo construye si todavía no existe)."""
+    doc = await completion_heatmaps_collection.find_one({"_id": heatmap_id(year)})
+    return doc if doc is not None else await _build_from_rollups(year)
+
+
+async def rebuild_year(year: int) -> None:
+    """
+    Recalcula el heatmap de un año desde los rollups y lo reemplaza.
+    Se usa al agotar los reintentos y al reparar rollups con drift.
+    """
+    counts = await _counts_from_rollups(year)
+    await completion_heatmaps_collection.update_one(
+        {"_id": heatmap_id(year)},
+        {"$set": {"year": year, "counts": Binary(bytes(counts))}, "$inc": {"version": 1}},
+        upsert=True
+    )
+
+
+async def get_heatmap(year: int) -> List[int]:
+    """Completados por día del año (lista de 366 enteros; el índice 0 es el 1 de enero)."""
+    doc = await _get_or_build(year)
+    return list(doc["counts"])
+
+
+async def on_completion_changed(completed_deltas: Dict[str, int]) -> None:
+    """
+    Suma a cada fecha la diferencia de completados (sin volver a leer los rollups).
+
+    Args:
+        completed_deltas: {fecha: cambio en los bloques completados ese día (ej: +1)}
+            Los rollups ya deben tener el cambio escrito.
+    """
+    # Agrupar las fechas por año: un documento = una escritura
+    by_year: Dict[int, Dict[int, int]] = {}
+    for date, delta in completed_deltas.items():
+        if not date or not delta:
+            continue
+        by_year.setdefault(int(date[:4]), {})[day_index(date)] = delta
+
+    for year, days in by_year.items():
+        for _ in range(MAX_RETRIES):
+            doc = await completion_heatmaps_collection.find_one({"_id": heatmap_id(year)})
+            if doc is None:
+                # Año nuevo: se construye desde los rollups, que ya incluyen el cambio
+                # (si otro proceso lo creó al mismo tiempo, no se sabe si lo incluye: recalcular)
+                try:
+                    await completion_heatmaps_collection.insert_one({
+                        "_id": heatmap_id(year), "year": year,
+                        "counts": Binary(bytes(await _counts_from_rollups(year))), "version": 0
+                    })
+                except DuplicateKeyError:
+                    await rebuild_year(year)
+                break
+
+            counts = bytearray(doc["counts"])
+            for index, delta in days.items():
+                counts[index] = max(0, min(counts[index] + delta, MAX_DAY_COUNT))
+
+            # Solo escribe si nadie cambió el documento desde que lo leímos
+            result = await completion_heatmaps_collection.update_one(
+                {"_id": doc["_id"], "version": doc["version"]},
+                {"$set": {"counts": Binary(bytes(counts))}, "$inc": {"version": 1}}
+            )
+            if result.matched_count:
+                break
+        else:
+            # Demasiados conflictos: no descartar el cambio, recalcular el año completo
+            logger.warning("Heatmap %s: %s conflictos de versión; se recalcula desde los rollups", year, MAX_RETRIES)
+            await rebuild_year(year)
@@ -0,0 +1,226 @@
+"""
+Servicio de Simulación de Políticas de Pago 📊
+
+Antes de cambiar la regla de liquidación (umbral de éxito y penalización),
+mide cuánto habría cambiado lo devuelto y lo que se lleva la tesorería con
+los datos reales: cumplimiento semanal de cada usuario (weekly_ledger) y
+depósitos reales (eventos Deposited indexados de HabitEscrow).
+
+Analogía: Es como la hoja de cálculo del contador antes de subir una tarifa.
+No se cobra de nuevo a cada cliente para ver qué pasa: se copia la columna
+de consumos una vez y se prueban todas las tarifas sobre esa columna.
+
+Cómo:
+- Los datos se cargan UNA vez en arreglos de NumPy (un elemento por
+  usuario-semana con depósito).
+- Cada política se evalúa con operaciones sobre arreglos completos; para un
+  umbral se calculan todas las penalizaciones a la vez (matriz
+  penalizaciones x usuario-semanas). No hay ciclos por usuario.
+- Los montos se manejan en ETH (float64): es un reporte, no un pago.
+
+Curvas de penalización (si el cumplimiento queda bajo el umbral):
+- flat: se pierde `penalty` del depósito (la regla actual: 80% / 10%).
+- linear: se pierde `penalty` escalado por lo que faltó para el umbral
+  (0% de cumplimiento = penalty completo; justo bajo el umbral ≈ 0).
+
+Solo para uso offline (simulate_payout_policies.py); el servidor no lo importa.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config.database import escrow_events_collection, weekly_ledger_collection
+from services import settlement_service
+
+WEI_PER_ETH = 10 ** 18
+
+# Curvas de penalización disponibles
+PENALTY_CURVES = ("flat", "linear")
+
+# Libros leídos por cada viaje del cursor
+HISTORY_BATCH_SIZE = 5000
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def parse_grid(spec: str) -> np.ndarray:
+    """
+    Valores de una rejilla: "inicio:fin:paso" (fin incluido) o lista "0.7,0.8".
+
+    Ejemplo:
+        >>> parse_grid("0.5:0.7:0.1")
+        array([0.5, 0.6, 0.7])
+
+    Raises:
+        ValueError: Si el texto no tiene ninguno de los dos formatos
+    """
+    if ":" in spec:
+        start, stop, step = (float(part) for part in spec.split(":"))
+        if step <= 0:
+            raise ValueError("El paso de la rejilla debe ser positivo")
+        return np.round(np.arange(start, stop + step / 2, step), 6)
+    return np.array([float(value) for value in spec.split(",")])
+
+
+def penalty_fractions(rate: np.ndarray, threshold: float, penalties: np.ndarray, curve: str) -> np.ndarray:
+    """
+    Fracción del depósito que se pierde, para cada penalización y usuario-semana.
+
+    Returns:
+        Matriz (len(penalties), len(rate))
+    """
+    short = rate < threshold
+    if curve == "flat":
+        shape = short.astype(np.float64)
+    elif curve == "linear":
+        shape = np.where(short, (threshold - rate) / threshold, 0.0)
+    else:
+        raise ValueError(f"Curva desconocida: {curve}")
+    return penalties[:, None] * shape[None, :]
+
+
+def is_current_policy(curve: str, threshold: float, penalty: float) -> bool:
+    """¿Es la regla que aplica hoy settlement_service.apply_payout_rule?"""
+    return (
+        curve == "flat"
+        and np.isclose(threshold, settlement_service.PAYOUT_SUCCESS_THRESHOLD)
+        and np.isclose(penalty, settlement_service.PAYOUT_PENALTY_PERCENT / 100)
+    )
+
+
+# ============================================
+# 📥 CARGA (una sola vez)
+# ============================================
+
+async def load_history(
+    from_week: Optional[int] = None,
+    to_week: Optional[int] = None,
+    chain_id: int = settlement_service.DEFAULT_CHAIN_ID
+) -> Dict[str, Any]:
+    """
+    Carga los usuario-semanas con depósito en arreglos de NumPy.
+
+    Pasos:
+    1. Depósitos por (usuario, semana): una agregación sobre los Deposited
+       indexados (suma los "top-up")
+    2. Cumplimiento: un solo recorrido de weekly_ledger con proyección
+    3. Unir ambos en arreglos paralelos
+
+    Returns:
+        {"user": índice de usuario, "deposit": ETH, "rate": cumplimiento,
+         "users": usuarios distintos, "without_ledger": depósitos sin libro}
+    """
+    week_query: Dict[str, Any] = {}
+    if from_week is not None or to_week is not None:
+        week_query["week_id"] = {}
+        if from_week is not None:
+            week_query["week_id"]["$gte"] = from_week
+        if to_week is not None:
+            week_query["week_id"]["$lte"] = to_week
+
+    # 1. Depósitos (los montos se guardan como string: se suman como Decimal128)
+    deposits: Dict[tuple, float] = {}
+    async for row in escrow_events_collection.aggregate([
+        {"$match": {"chain_id": chain_id, "event": "Deposited", **week_query}},
+        {"$group": {
+            "_id": {"user": "$user_address", "week": "$week_id"},
+            "amount": {"$sum": {"$toDecimal": "$amount"}}
+        }}
+    ]):
+        deposits[(row["_id"]["user"], row["_id"]["week"])] = float(row["amount"].to_decimal()) / WEI_PER_ETH
+
+    # 2 y 3. Libros de esas semanas, unidos a su depósito
+    user_index: Dict[str, int] = {}
+    users: List[int] = []
+    amounts: List[float] = []
+    relevant: List[int] = []
+    completed: List[int] = []
+    cursor = weekly_ledger_collection.find(
+        week_query, {"user_address": 1, "week_id": 1, "relevant_blocks": 1, "completed_blocks": 1}
+    ).batch_size(HISTORY_BATCH_SIZE)
+    async for ledger in cursor:
+        user = ledger["user_address"].lower()
+        amount = deposits.pop((user, ledger["week_id"]), None)
+        if not amount:
+            continue
+        users.append(user_index.setdefault(user, len(user_index)))
+        amounts.append(amount)
+        relevant.append(ledger.get("relevant_blocks", 0))
+        completed.append(ledger.get("completed_blocks", 0))
+
+    relevant_arr = np.array(relevant, dtype=np.float64)
+    completed_arr = np.array(completed, dtype=np.float64)
+    # Sin bloques relevantes = cumplimiento total (igual que apply_payout_rule)
+    rate = np.divide(completed_arr, relevant_arr, out=np.ones_like(relevant_arr), where=relevant_arr > 0)
+
+    return {
+        "user": np.array(users, dtype=np.int64),
+        "deposit": np.array(amounts, dtype=np.float64),
+        "rate": rate,
+        "users": len(user_index),
+        "without_ledger": len(deposits)
+    }
+
+
+# ============================================
+# 🧮 SIMULACIÓN (vectorizada)
+# ============================================
+
+def simulate(
+    history: Dict[str, Any],
+    thresholds: Sequence[float],
+    penalties: Sequence[float],
+    curves: Sequence[str] = PENALTY_CURVES
+) -> List[Dict[str, Any]]:
+    """
+    Evalúa cada combinación (curva, umbral, penalización) sobre el historial.
+
+    Por cada (curva, umbral) se calcula de una vez la matriz de pérdidas
+    penalizaciones x usuario-semanas; la pérdida acumulada por usuario sale
+    de un solo np.bincount sobre esa matriz.
+
+    Returns:
+        Una fila por política con lo devuelto, lo de la tesorería y la
+        distribución de pérdidas entre los usuarios afectados (ETH)
+    """
+    deposit, rate, user = history["deposit"], history["rate"], history["user"]
+    n_users = history["users"]
+    penalties_arr = np.asarray(penalties, dtype=np.float64)
+    n_penalties = len(penalties_arr)
+    total_deposited = float(deposit.sum())
+
+    # Posición de cada (penalización, usuario) en la matriz aplanada de pérdidas por usuario
+    slots = (np.arange(n_penalties)[:, None] * n_users + user[None, :]).ravel()
+
+    results = []
+    for curve in curves:
+        for threshold in thresholds:
+            lost = penalty_fractions(rate, threshold, penalties_arr, curve) * deposit
+            treasury = lost.sum(axis=1)
+            affected_weeks = np.count_nonzero(lost, axis=1)
+            per_user = np.bincount(slots, weights=lost.ravel(), minlength=n_penalties * n_users)
+            per_user = per_user.reshape(n_penalties, n_users)
+
+            for i, penalty in enumerate(penalties_arr):
+                losses = per_user[i][per_user[i] > 0]
+                p50, p90 = np.percentile(losses, [50, 90]) if losses.size else (0.0, 0.0)
+                results.append({
+                    "curve": curve,
+                    "threshold": float(threshold),
+                    "penalty": float(penalty),
+                    "current": bool(is_current_policy(curve, threshold, penalty)),
+                    "total_deposited_eth": total_deposited,
+                    "total_returned_eth": total_deposited - float(treasury[i]),
+                    "treasury_eth": float(treasury[i]),
+                    "treasury_share": float(treasury[i]) / total_deposited if total_deposited else 0.0,
+                    "affected_user_weeks": int(affected_weeks[i]),
+                    "affected_users": int(losses.size),
+                    "affected_users_share": losses.size / n_users if n_users else 0.0,
+                    "loss_per_user_p50_eth": float(p50),
+                    "loss_per_user_p90_eth": float(p90),
+                    "loss_per_user_max_eth": float(losses.max()) if losses.size else 0.0
+                })
+    return results
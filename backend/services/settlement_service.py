@@ -0,0 +1,358 @@
+"""
+Servicio de Liquidación Semanal (Settlement) 🧾
+
+Calcula cuánto se devuelve de cada depósito y prepara las firmas EIP-712
+que el contrato HabitEscrow pide para liberar los fondos.
+
+Analogía: Es como la nómina de fin de mes.
+En vez de que cada empleado haga fila en la oficina el día de pago para que
+le calculen y le firmen el cheque en el momento, contabilidad prepara todos
+los cheques la noche anterior y en ventanilla solo se entregan.
+
+Piezas:
+- apply_payout_rule: la regla de negocio (80% de cumplimiento = todo de
+  vuelta; si no, se pierde el 10%).
+- settle_week: job por lotes que recorre las configuraciones ACTIVE de una
+  semana, calcula todos los pagos desde los libros semanales (con el
+  depósito indexado de HabitEscrow) y firma en un
+  ProcessPoolExecutor (una firma EIP-712 es trabajo de CPU puro).
+  Guarda cada firma en `settlement_signatures` y un punto de control en
+  `settlement_jobs`, así que si se corta puede continuar donde quedó.
+- find_signature / store_signature: cache idempotente que usa
+  /finance/settlement/sign. Mientras la firma guardada tenga margen de
+  vigencia, los reintentos del cliente reciben la misma firma con una sola
+  lectura indexada. Las firmas se borran solas al expirar (índice TTL) y se
+  invalidan cuando cambia el libro semanal de su usuario y semana. Cada
+  firma guarda el `rev` del libro con el que se calculó (`ledger_rev`) y
+  solo se entrega si el libro sigue en ese `rev`: una firma calculada antes
+  de un cambio y guardada después del borrado no vuelve a salir.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from config.database import database, settlement_jobs_collection, settlement_signatures_collection
+from services import escrow_indexer_service, weekly_ledger_service
+
+logger = logging.getLogger(__name__)
+
+# Configuraciones leídas y firmadas por lote
+SETTLEMENT_BATCH_SIZE = 500
+
+# Vigencia de las firmas preparadas por el job (segundos)
+# Más larga que la de una firma en línea: deben servir durante toda la ventana de cobro
+BATCH_DEADLINE_SECONDS = int(os.getenv("SETTLEMENT_BATCH_DEADLINE_SECONDS", str(3 * 24 * 3600)))
+
+# Margen mínimo de vigencia para entregar una firma guardada (segundos)
+MIN_DEADLINE_MARGIN_SECONDS = 600
+
+# Red por defecto (Base Sepolia)
+DEFAULT_CHAIN_ID = 84532
+
+# Regla de pago vigente: con este cumplimiento se devuelve todo;
+# por debajo se pierde PAYOUT_PENALTY_PERCENT del depósito
+# (simulate_payout_policies.py mide el impacto de cambiarlos)
+PAYOUT_SUCCESS_THRESHOLD = 0.8
+PAYOUT_PENALTY_PERCENT = 10
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def apply_payout_rule(deposit_amount_wei: int, total_relevant_blocks: int, completed_count: int) -> int:
+    """
+    Regla de negocio: cuánto se devuelve del depósito según el cumplimiento.
+    """
+    # Si no había nada que hacer (total=0), devolvemos todo (no penalty for chilling)
+    if total_relevant_blocks == 0:
+        return int(deposit_amount_wei)
+
+    # Calculate rate
+    completion_rate = completed_count / total_relevant_blocks
+
+    if completion_rate >= PAYOUT_SUCCESS_THRESHOLD:  # Umbral del 80% para éxito
+        # Retorno completo (Integer Math)
+        return deposit_amount_wei
+    else:
+        # Penalización proporcional: Paga lo que fallaste
+        # Regla Dura (fija): -10% -> (Amount * 90) // 100
+        return (deposit_amount_wei * (100 - PAYOUT_PENALTY_PERCENT)) // 100
+
+
+def signature_key(user_address: str, week_id: int, chain_id: int, deposit_amount: int) -> Dict[str, Any]:
+    """
+    Filtro único de una firma guardada (el monto se guarda como string: Wei no cabe en int64).
+    La dirección va en minúsculas, igual que al invalidar (evict_signatures).
+    """
+    return {
+        "user_address": user_address.lower(),
+        "week_id": week_id,
+        "chain_id": chain_id,
+        "deposit_amount": str(deposit_amount)
+    }
+
+
+def _signature_fields(
+    signature: str,
+    amount_to_return: int,
+    deadline: int,
+    source: str,
+    ledger_rev: Optional[int]
+) -> Dict[str, Any]:
+    """Campos de una firma guardada (expires_at alimenta el índice TTL)."""
+    return {
+        "signature": signature,
+        "ledger_rev": ledger_rev,
+        "amount_to_return": str(amount_to_return),
+        "deadline": deadline,
+        "expires_at": datetime.utcfromtimestamp(deadline),
+        "created_at": datetime.utcnow(),
+        "source": source
+    }
+
+
+def _sign_chunk(items: List[Tuple[str, int, int, int, str, int]]) -> List[str]:
+    """
+    Firma un trozo de liquidaciones dentro de un proceso del pool.
+
+    Cada item es (user_address, week_id, amount_to_return, deadline, contract_address, chain_id).
+    El firmante se importa aquí: cada proceso usa su propia instancia.
+    """
+    from services.blockchain_signer import signer_service
+
+    return [
+        signer_service.generate_settlement_signature(
+            user_address=user_address,
+            week_id=week_id,
+            amount_to_return=amount,
+            deadline=deadline,
+            contract_address=contract_address,
+            chain_id=chain_id
+        )
+        for user_address, week_id, amount, deadline, contract_address, chain_id in items
+    ]
+
+
+# ============================================
+# 📖 BÚSQUEDA
+# ============================================
+
+async def ensure_indexes() -> None:
+    """Una firma por (usuario, semana, red, depósito) y borrado automático al expirar."""
+    await settlement_signatures_collection.create_index(
+        [("user_address", ASCENDING), ("week_id", ASCENDING), ("chain_id", ASCENDING), ("deposit_amount", ASCENDING)],
+        unique=True
+    )
+    await settlement_signatures_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+
+async def find_signature(
+    user_address: str,
+    week_id: int,
+    chain_id: int,
+    deposit_amount: int,
+    ledger_rev: Optional[int]
+) -> Optional[Dict[str, Any]]:
+    """
+    Firma ya preparada con esta versión del libro (`rev`) y que todavía
+    tiene margen de vigencia (None si no hay).
+    """
+    doc = await settlement_signatures_collection.find_one(
+        {
+            **signature_key(user_address, week_id, chain_id, deposit_amount),
+            "ledger_rev": ledger_rev,
+            "deadline": {"$gt": int(time.time()) + MIN_DEADLINE_MARGIN_SECONDS}
+        },
+        {"_id": 0, "signature": 1, "amount_to_return": 1, "deadline": 1}
+    )
+    return doc
+
+
+async def store_signature(
+    user_address: str,
+    week_id: int,
+    chain_id: int,
+    deposit_amount: int,
+    ledger_rev: Optional[int],
+    amount_to_return: int,
+    signature: str,
+    deadline: int
+) -> Dict[str, Any]:
+    """
+    Guarda una firma hecha en línea y retorna la que quedó guardada.
+
+    Si dos peticiones firmaron a la vez (doble clic), gana la primera
+    ($setOnInsert) y ambas responden con la misma firma.
+    Una firma guardada sin margen de vigencia, o calculada con otra versión
+    del libro, se reemplaza.
+    """
+    key = signature_key(user_address, week_id, chain_id, deposit_amount)
+    fields = _signature_fields(signature, amount_to_return, deadline, "inline", ledger_rev)
+
+    # Reemplazar la vieja si ya no sirve (el TTL puede tardar hasta un minuto en
+    # borrarla; con otro ledger_rev su monto puede estar mal)
+    await settlement_signatures_collection.delete_one({
+        **key,
+        "$or": [
+            {"deadline": {"$lte": int(time.time()) + MIN_DEADLINE_MARGIN_SECONDS}},
+            {"ledger_rev": {"$ne": ledger_rev}}
+        ]
+    })
+    projection = {"_id": 0, "signature": 1, "amount_to_return": 1, "deadline": 1}
+    try:
+        return await settlement_signatures_collection.find_one_and_update(
+            key,
+            {"$setOnInsert": fields},
+            upsert=True,
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Otra petición insertó al mismo tiempo: usar la suya si es de la misma versión del libro
+        stored = await settlement_signatures_collection.find_one({**key, "ledger_rev": ledger_rev}, projection)
+        return stored or {k: fields[k] for k in projection if k in fields}
+
+
+async def evict_signatures(keys: Iterable[Tuple[str, int]]) -> None:
+    """
+    Borra las firmas guardadas de estos (user_address, week_id): su pago cambió.
+    """
+    selectors = [{"user_address": user_address.lower(), "week_id": week_id} for user_address, week_id in keys]
+    if selectors:
+        await settlement_signatures_collection.delete_many({"$or": selectors})
+
+
+# ============================================
+# 🏭 JOB POR LOTES
+# ============================================
+
+async def _settle_batch(
+    configs: List[Dict[str, Any]],
+    week_id: int,
+    chain_id: int,
+    contract_address: str,
+    pool: ProcessPoolExecutor,
+    workers: int
+) -> int:
+    """
+    Calcula, firma y guarda un lote de configuraciones. Retorna cuántas se firmaron.
+    """
+    # 1. Pagos desde los libros semanales y los depósitos indexados (una consulta $in de cada uno)
+    users = [c["user_address"] for c in configs]
+    ledgers, deposits = await asyncio.gather(
+        weekly_ledger_service.get_ledgers(week_id, users),
+        escrow_indexer_service.get_deposits(week_id, users, chain_id)
+    )
+    deadline = int(time.time()) + BATCH_DEADLINE_SECONDS
+
+    settlements = []  # (user_address, depósito, monto a devolver, rev del libro)
+    for config in configs:
+        deposit = deposits[config["user_address"]]
+        if deposit == 0:
+            logger.warning("Sin depósito indexado para %s (semana %s); se omite", config["user_address"], week_id)
+            continue
+        ledger = ledgers[config["user_address"]]
+        amount = apply_payout_rule(deposit, ledger["relevant_blocks"], ledger["completed_blocks"])
+        settlements.append((config["user_address"], deposit, amount, ledger.get("rev")))
+
+    if not settlements:
+        return 0
+
+    # 2. Firmar en paralelo: un trozo por proceso
+    items = [(user, week_id, amount, deadline, contract_address, chain_id) for user, _, amount, _ in settlements]
+    size = -(-len(items) // workers)  # división hacia arriba
+    loop = asyncio.get_running_loop()
+    signed = await asyncio.gather(*(
+        loop.run_in_executor(pool, _sign_chunk, items[i:i + size]) for i in range(0, len(items), size)
+    ))
+    signatures = [signature for chunk in signed for signature in chunk]
+
+    # 3. Guardar todas las firmas del lote en un solo bulk_write
+    operations = [
+        UpdateOne(
+            signature_key(user_address, week_id, chain_id, deposit),
+            {"$set": _signature_fields(signature, amount, deadline, "batch", ledger_rev)},
+            upsert=True
+        )
+        for (user_address, deposit, amount, ledger_rev), signature in zip(settlements, signatures)
+    ]
+    await settlement_signatures_collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+async def settle_week(
+    week_id: int,
+    chain_id: int = DEFAULT_CHAIN_ID,
+    workers: Optional[int] = None,
+    batch_size: int = SETTLEMENT_BATCH_SIZE,
+    restart: bool = False
+) -> Dict[str, Any]:
+    """
+    Prepara las firmas de liquidación de todas las configuraciones ACTIVE de una semana.
+
+    Las configuraciones se leen en streaming, ordenadas por _id. Tras cada
+    lote se guarda el último _id procesado: al volver a ejecutar, el job
+    continúa desde ahí (restart=True empieza de cero).
+
+    Returns:
+        Reporte con firmas hechas, segundos y firmas por segundo
+    """
+    contract_address = os.getenv("HABIT_ESCROW_ADDRESS")
+    if not contract_address:
+        raise ValueError("HABIT_ESCROW_ADDRESS no está configurada")
+
+    workers = workers or os.cpu_count() or 1
+    job_id = f"{week_id}:{chain_id}"
+    job = None if restart else await settlement_jobs_collection.find_one({"_id": job_id})
+
+    query: Dict[str, Any] = {"week_id": week_id, "status": "ACTIVE"}
+    if job and job.get("last_config_id"):
+        query["_id"] = {"$gt": job["last_config_id"]}
+
+    job_update: Dict[str, Any] = {
+        "$set": {"week_id": week_id, "chain_id": chain_id, "started_at": datetime.utcnow(), "finished_at": None}
+    }
+    if restart:
+        job_update["$unset"] = {"last_config_id": ""}
+    await settlement_jobs_collection.update_one({"_id": job_id}, job_update, upsert=True)
+
+    report = {"week_id": week_id, "chain_id": chain_id, "resumed": "_id" in query, "signed": 0}
+    started = time.perf_counter()
+
+    cursor = database.commitment_configs.find(
+        query, {"user_address": 1}
+    ).sort("_id", ASCENDING).batch_size(batch_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        batch: List[Dict[str, Any]] = []
+        async for config in cursor:
+            batch.append(config)
+            if len(batch) < batch_size:
+                continue
+            report["signed"] += await _settle_batch(batch, week_id, chain_id, contract_address, pool, workers)
+            await settlement_jobs_collection.update_one({"_id": job_id}, {"$set": {"last_config_id": batch[-1]["_id"]}})
+            logger.info("Semana %s: %s firmas (%.1f/s)", week_id, report["signed"], report["signed"] / (time.perf_counter() - started))
+            batch = []
+
+        if batch:
+            report["signed"] += await _settle_batch(batch, week_id, chain_id, contract_address, pool, workers)
+            await settlement_jobs_collection.update_one({"_id": job_id}, {"$set": {"last_config_id": batch[-1]["_id"]}})
+
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 2)
+    report["signatures_per_sec"] = round(report["signed"] / elapsed, 1) if elapsed > 0 else 0.0
+
+    await settlement_jobs_collection.update_one(
+        {"_id": job_id},
+        {"$set": {"finished_at": datetime.utcnow(), "last_report": report}}
+    )
+    return report
@@ -0,0 +1,350 @@
+"""
+Servicio de Verificación de Liquidaciones On-Chain ✅
+
+POST /finance/settlement/confirm solo anota el tx_hash que manda el cliente
+(settlement_verification = "PENDING"). Este worker junta las confirmaciones
+pendientes, pide sus recibos al nodo en lotes JSON-RPC (muchas llamadas
+eth_getTransactionReceipt en un solo POST), decodifica el evento
+`Withdrawn` de HabitEscrow y lo compara con `amount_returned`.
+
+Analogía: Es como el cajero que recibe los vouchers de transferencia
+durante el día. No llama al banco por cada uno mientras el cliente espera:
+al cierre los junta, los revisa todos contra el estado de cuenta en una
+sola consulta y marca cuáles eran buenos.
+
+Resultados:
+- VERIFIED: el recibo tiene un Withdrawn de este contrato, usuario y semana
+  con el mismo monto devuelto.
+- REJECTED: la transacción falló (reverted), no retira este compromiso, o
+  no apareció en RECEIPT_WAIT_MINUTES. El compromiso vuelve a ACTIVE.
+  Si el retiro sí ocurrió pero con otro monto, queda SETTLED y se guarda
+  el monto real (`onchain_amount_returned`).
+- INVALID: el nodo responde con error a la consulta de ese tx_hash (hash
+  malformado, o un error que dura más de RECEIPT_WAIT_MINUTES). El
+  compromiso vuelve a ACTIVE. El resto del lote se decide normalmente.
+- Sin recibo todavía (transacción en el mempool): se revisa en la siguiente vuelta.
+- Lote JSON-RPC fallido o con respuesta malformada: sus confirmaciones se
+  revisan en la siguiente vuelta (no cuentan como "sin recibo").
+
+Cola: las pendientes se revisan de la menos recién revisada a la más
+(`settlement_checked_at`; las nunca revisadas primero). Cada vuelta que no
+decide una confirmación le anota la hora y suma `settlement_check_attempts`,
+así que las que esperan recibo no tapan a las nuevas cuando hay más de
+VERIFY_SCAN_LIMIT pendientes.
+
+Todo lo que se decide en una vuelta se escribe con un solo bulk_write.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from pymongo import ASCENDING, UpdateOne
+
+from config.database import database
+from services import commitment_config_service, escrow_indexer_service
+
+logger = logging.getLogger(__name__)
+
+# Recibos pedidos por cada POST JSON-RPC
+RECEIPT_BATCH_SIZE = 100
+
+# Lotes JSON-RPC en vuelo al mismo tiempo
+RECEIPT_CONCURRENCY = 8
+
+# Confirmaciones pendientes revisadas por vuelta
+VERIFY_SCAN_LIMIT = 5000
+
+# Minutos que se espera un recibo antes de rechazar la confirmación
+RECEIPT_WAIT_MINUTES = int(os.getenv("SETTLEMENT_RECEIPT_WAIT_MINUTES", "30"))
+
+# Código JSON-RPC de parámetros inválidos: el tx_hash nunca va a tener recibo
+RPC_INVALID_PARAMS = -32602
+
+# Cada cuántos segundos corre el worker en segundo plano (0 = desactivado)
+VERIFY_INTERVAL_SECONDS = int(os.getenv("SETTLEMENT_VERIFY_INTERVAL_SECONDS", "10"))
+
+# Campos que necesita la verificación
+PENDING_PROJECTION = {
+    "user_address": 1,
+    "week_id": 1,
+    "settlement_tx_hash": 1,
+    "amount_returned": 1,
+    "settlement_confirmed_at": 1,
+    "settlement_checked_at": 1
+}
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def _normalize_log(log: Dict[str, Any]) -> Dict[str, Any]:
+    """Log JSON-RPC crudo (cantidades en hex) al formato que espera decode_log."""
+    return {**log, "logIndex": int(log["logIndex"], 16), "blockNumber": int(log["blockNumber"], 16)}
+
+
+def check_receipt(
+    config: Dict[str, Any],
+    receipt: Optional[Dict[str, Any]],
+    contract: str,
+    chain_id: int,
+    now: datetime
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Decide qué pasa con una confirmación según su recibo.
+
+    Returns:
+        (veredicto, campos a guardar). veredicto None = seguir esperando.
+    """
+    if receipt is None:
+        confirmed_at = config.get("settlement_confirmed_at") or now
+        if now - confirmed_at < timedelta(minutes=RECEIPT_WAIT_MINUTES):
+            return None, {}
+        return "REJECTED", {"status": "ACTIVE", "settlement_rejection": "receipt_not_found"}
+
+    if receipt.get("status") != "0x1":
+        return "REJECTED", {"status": "ACTIVE", "settlement_rejection": "reverted"}
+
+    withdrawn = None
+    for log in receipt.get("logs", []):
+        event = escrow_indexer_service.decode_log(_normalize_log(log), chain_id)
+        if (
+            event and event["event"] == "Withdrawn"
+            and event["contract"] == contract
+            and event["user_address"] == config["user_address"].lower()
+            and event["week_id"] == config["week_id"]
+        ):
+            withdrawn = event
+            break
+    if withdrawn is None:
+        return "REJECTED", {"status": "ACTIVE", "settlement_rejection": "no_withdrawn_event"}
+
+    claimed = str(config.get("amount_returned") or "")
+    if not claimed.isdigit() or int(claimed) != int(withdrawn["amount_returned"]):
+        return "REJECTED", {
+            "settlement_rejection": "amount_mismatch",
+            "onchain_amount_returned": withdrawn["amount_returned"]
+        }
+    return "VERIFIED", {"settlement_block": withdrawn["block_number"]}
+
+
+def check_rpc_error(config: Dict[str, Any], error: Any, now: datetime) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Decide qué pasa con una confirmación cuyo recibo respondió con error.
+
+    Returns:
+        (veredicto, campos a guardar). veredicto None = reintentar solo esta.
+    """
+    code = error.get("code") if isinstance(error, dict) else None
+    confirmed_at = config.get("settlement_confirmed_at") or now
+    if code != RPC_INVALID_PARAMS and now - confirmed_at < timedelta(minutes=RECEIPT_WAIT_MINUTES):
+        return None, {}
+    return "INVALID", {
+        "status": "ACTIVE",
+        "settlement_rejection": "rpc_error",
+        "settlement_rpc_error": str(error)[:200]
+    }
+
+
+# ============================================
+# 🌐 JSON-RPC POR LOTES
+# ============================================
+
+async def _rpc_batch(
+    session: aiohttp.ClientSession,
+    rpc_url: str,
+    calls: List[Tuple[str, list]]
+) -> Tuple[List[Any], Dict[int, Any]]:
+    """
+    Manda varias llamadas JSON-RPC en un solo POST.
+
+    Returns:
+        (resultados en el mismo orden, {posición: error} de las llamadas que
+        el nodo rechazó; esas tienen resultado None)
+
+    Raises:
+        ValueError: Si la respuesta no es una lista con una respuesta por
+            cada id pedido (todo el lote se reintenta)
+    """
+    payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params} for i, (method, params) in enumerate(calls)]
+    async with session.post(rpc_url, json=payload) as response:
+        response.raise_for_status()
+        replies = await response.json()
+
+    # Algunos nodos responden un solo objeto (error de límite, lote no soportado)
+    if not isinstance(replies, list):
+        raise ValueError(f"respuesta JSON-RPC no es un lote: {str(replies)[:200]}")
+
+    # Los nodos pueden responder en otro orden: se ordena por id
+    results: Dict[int, Any] = {}
+    errors: Dict[int, Any] = {}
+    for reply in replies:
+        if not isinstance(reply, dict) or reply.get("id") not in range(len(calls)):
+            raise ValueError(f"respuesta JSON-RPC sin id válido: {str(reply)[:200]}")
+        results[reply["id"]] = reply.get("result")
+        if "error" in reply:
+            # Error de una sola llamada (ej: hash inválido): no tumba el lote
+            errors[reply["id"]] = reply["error"]
+    if len(results) != len(calls):
+        raise ValueError(f"respuesta JSON-RPC incompleta: {len(results)} de {len(calls)}")
+    return [results[i] for i in range(len(calls))], errors
+
+
+async def _fetch_receipts(
+    session: aiohttp.ClientSession,
+    rpc_url: str,
+    tx_hashes: List[str],
+    semaphore: asyncio.Semaphore
+) -> Optional[Tuple[List[Optional[Dict[str, Any]]], Dict[int, Any]]]:
+    """
+    Recibos de un lote de transacciones y los errores por transacción.
+    Si el POST falla o la respuesta viene malformada, retorna None: el lote
+    se reintenta en la siguiente vuelta (no cuenta como "sin recibo").
+    """
+    async with semaphore:
+        try:
+            receipts, errors = await _rpc_batch(
+                session, rpc_url, [("eth_getTransactionReceipt", [tx]) for tx in tx_hashes]
+            )
+            if any(receipt is not None and not isinstance(receipt, dict) for receipt in receipts):
+                raise ValueError("recibo JSON-RPC no es un objeto")
+            return receipts, errors
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning("Lote de recibos falló (%s: %s); se reintenta en la siguiente vuelta", type(e).__name__, e)
+            return None
+
+
+# ============================================
+# ✅ VERIFICACIÓN
+# ============================================
+
+async def ensure_indexes() -> None:
+    """Cola de confirmaciones pendientes: menos recién revisadas primero (índice parcial: solo las PENDING)."""
+    await database.commitment_configs.create_index(
+        [("settlement_checked_at", ASCENDING), ("settlement_confirmed_at", ASCENDING)],
+        partialFilterExpression={"settlement_verification": "PENDING"}
+    )
+
+
+async def verify_pending(
+    rpc_url: Optional[str] = None,
+    contract_address: Optional[str] = None,
+    limit: int = VERIFY_SCAN_LIMIT
+) -> Dict[str, Any]:
+    """
+    Revisa hasta `limit` confirmaciones pendientes contra sus recibos.
+
+    Pasos:
+    1. Leer las pendientes (las nunca revisadas, o revisadas hace más tiempo, primero)
+    2. Pedir los recibos en lotes JSON-RPC, varios en paralelo
+    3. Decidir cada una y escribir todo con un bulk_write (las que siguen
+       en espera solo avanzan en la cola). El filtro incluye el tx_hash: si
+       el cliente confirmó otra transacción mientras tanto, esa no se pisa.
+
+    Returns:
+        Reporte con verificadas, rechazadas, inválidas, en espera y confirmaciones por minuto
+
+    Raises:
+        ValueError: Si falta el nodo o la dirección del contrato
+    """
+    rpc_url = rpc_url or escrow_indexer_service.ESCROW_RPC_URL
+    contract_address = contract_address or os.getenv("HABIT_ESCROW_ADDRESS")
+    if not rpc_url or not contract_address:
+        raise ValueError("ESCROW_RPC_URL y HABIT_ESCROW_ADDRESS deben estar configuradas")
+    contract = contract_address.lower()
+
+    started = time.perf_counter()
+    report = {"checked": 0, "verified": 0, "rejected": 0, "invalid": 0, "waiting": 0}
+
+    # 1. Pendientes
+    configs = await database.commitment_configs.find(
+        {"settlement_verification": "PENDING"}, PENDING_PROJECTION
+    ).sort([("settlement_checked_at", ASCENDING), ("settlement_confirmed_at", ASCENDING)]).limit(limit).to_list(length=limit)
+    if not configs:
+        return {**report, "seconds": 0.0, "per_minute": 0.0}
+
+    # 2. Recibos en lotes
+    semaphore = asyncio.Semaphore(RECEIPT_CONCURRENCY)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+        (chain_id_hex,), errors = await _rpc_batch(session, rpc_url, [("eth_chainId", [])])
+        if errors:
+            raise ValueError(f"eth_chainId falló: {errors[0]}")
+        chain_id = int(chain_id_hex, 16)
+        chunks = [configs[i:i + RECEIPT_BATCH_SIZE] for i in range(0, len(configs), RECEIPT_BATCH_SIZE)]
+        receipts = await asyncio.gather(*(
+            _fetch_receipts(session, rpc_url, [c["settlement_tx_hash"] for c in chunk], semaphore)
+            for chunk in chunks
+        ))
+
+    # 3. Veredictos y un solo bulk_write
+    now = datetime.utcnow()
+    operations = []
+    decided = []
+
+    def requeue(config: Dict[str, Any]) -> None:
+        """Sigue pendiente: al final de la cola."""
+        report["waiting"] += 1
+        operations.append(UpdateOne(
+            {"_id": config["_id"], "settlement_verification": "PENDING", "settlement_tx_hash": config["settlement_tx_hash"]},
+            {"$set": {"settlement_checked_at": now}, "$inc": {"settlement_check_attempts": 1}}
+        ))
+
+    for chunk, fetched in zip(chunks, receipts):
+        if fetched is None:
+            # Lote fallido: no se sabe si hay recibo, se revisa en otra vuelta
+            report["checked"] += len(chunk)
+            for config in chunk:
+                requeue(config)
+            continue
+        chunk_receipts, errors = fetched
+        for i, (config, receipt) in enumerate(zip(chunk, chunk_receipts)):
+            if i in errors:
+                verdict, fields = check_rpc_error(config, errors[i], now)
+            else:
+                verdict, fields = check_receipt(config, receipt, contract, chain_id, now)
+            report["checked"] += 1
+            if verdict is None:
+                requeue(config)
+                continue
+            report[verdict.lower()] += 1
+            operations.append(UpdateOne(
+                {"_id": config["_id"], "settlement_verification": "PENDING", "settlement_tx_hash": config["settlement_tx_hash"]},
+                {"$set": {**fields, "settlement_verification": verdict, "settlement_verified_at": now}}
+            ))
+            decided.append((config["user_address"], config["week_id"]))
+
+    if operations:
+        await database.commitment_configs.bulk_write(operations, ordered=False)
+        for user_address, week_id in decided:
+            commitment_config_service.invalidate(user_address, week_id)
+
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 2)
+    report["per_minute"] = round(report["checked"] * 60 / elapsed, 1) if elapsed > 0 else 0.0
+    return report
+
+
+async def run_periodically() -> None:
+    """
+    Job en segundo plano: verifica cada VERIFY_INTERVAL_SECONDS segundos.
+    No arranca si falta la configuración; un error se reintenta en la siguiente vuelta.
+    """
+    if VERIFY_INTERVAL_SECONDS <= 0 or not escrow_indexer_service.ESCROW_RPC_URL or not os.getenv("HABIT_ESCROW_ADDRESS"):
+        return
+
+    while True:
+        try:
+            report = await verify_pending()
+            if report["verified"] or report["rejected"] or report["invalid"]:
+                logger.info(
+                    "Liquidaciones verificadas: %s, rechazadas: %s, inválidas: %s",
+                    report["verified"], report["rejected"], report["invalid"]
+                )
+        except Exception as e:  # nodo caído, error RPC o de Mongo: no detener el job
+            logger.warning("Error verificando liquidaciones: %s: %s", type(e).__name__, e)
+        await asyncio.sleep(VERIFY_INTERVAL_SECONDS)
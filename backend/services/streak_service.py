@@ -0,0 +1,178 @@
+"""
+Servicio de Rachas (Streaks) 🔥
+
+Mantiene en `streak_states` un documento pequeño con:
+- current_streak: días seguidos (hasta last_active_date) con al menos un bloque completado
+- longest_streak: la racha más larga de toda la historia
+- last_active_date: último día con al menos un bloque completado
+
+Analogía: Es como el contador de días sin accidentes de una fábrica.
+No se revisa todo el historial cada vez que alguien pregunta: se actualiza
+el cartel cuando pasa algo, y leerlo es instantáneo.
+
+Actualización:
+- Caso común (completar algo hoy, o el día siguiente al último activo):
+  se ajusta el documento en O(1).
+- Casos raros (des-completar un día o editar un día pasado dentro de la racha):
+  se recalcula desde los rollups diarios, que son una fila por día y hábito.
+- Corre en segundo plano, fuera de la petición (timeblock_rollup_service).
+
+Nota: la app aún no tiene usuarios separados en timeblocks, así que hay un
+único estado con ID fijo (igual que la configuración del planificador).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from pymongo.errors import DuplicateKeyError
+
+from config.database import streak_state_collection, timeblock_rollups_collection
+from services import timeblock_archive_service
+
+# ID fijo del estado (sin auth todavía; ver config_routes.USER_CONFIG_ID)
+STREAK_STATE_ID = "default_user_streak"
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def next_day(date: str) -> str:
+    """Fecha ISO del día siguiente."""
+    return (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def empty_state() -> Dict[str, Any]:
+    """Estado inicial: sin rachas."""
+    return {"current_streak": 0, "longest_streak": 0, "last_active_date": None}
+
+
+def advance_streak(state: Dict[str, Any], date: str) -> Dict[str, Any]:
+    """
+    Avanza el estado con la siguiente fecha activa (las fechas deben llegar ORDENADAS).
+
+    Ejemplo:
+        >>> state = empty_state()
+        >>> for d in ["2026-02-01", "2026-02-02", "2026-02-05"]:
+        ...     state = advance_streak(state, d)
+        >>> state
+        {"current_streak": 1, "longest_streak": 2, "last_active_date": "2026-02-05"}
+    """
+    last = state["last_active_date"]
+    if date == last:
+        return state
+
+    current = state["current_streak"] + 1 if last is not None and date == next_day(last) else 1
+    return {
+        "current_streak": current,
+        "longest_streak": max(state["longest_streak"], current),
+        "last_active_date": date
+    }
+
+
+async def _save_state(state: Dict[str, Any]) -> None:
+    """Reemplaza el documento de estado."""
+    await streak_state_collection.replace_one({"_id": STREAK_STATE_ID}, state, upsert=True)
+
+
+# ============================================
+# 📖 LECTURA
+# ============================================
+
+async def get_state() -> Dict[str, Any]:
+    """Estado guardado (ceros si todavía no existe)."""
+    state = await streak_state_collection.find_one({"_id": STREAK_STATE_ID}, {"_id": 0})
+    return state or empty_state()
+
+
+async def get_streaks(today: str) -> Dict[str, int]:
+    """
+    Rachas para mostrar hoy. La racha actual solo cuenta si el último día
+    activo es hoy (mismo criterio que usaban las estadísticas de 7 días).
+    """
+    state = await get_state()
+    current = state["current_streak"] if state["last_active_date"] == today else 0
+    return {"current_streak": current, "longest_streak": state["longest_streak"]}
+
+
+# ============================================
+# ✏️ ACTUALIZACIÓN
+# ============================================
+
+async def recompute_from_rollups() -> Dict[str, Any]:
+    """
+    Recalcula el estado desde los rollups diarios (una fila por día activo).
+    Se usa solo en los casos que no se pueden resolver en O(1).
+    """
+    cursor = timeblock_rollups_collection.aggregate([
+        {"$group": {"_id": "$date", "completed": {"$sum": "$completed"}}},
+        {"$match": {"completed": {"$gt": 0}}},
+        {"$sort": {"_id": 1}}
+    ])
+    state = empty_state()
+    async for row in cursor:
+        state = advance_streak(state, row["_id"])
+    await _save_state(state)
+    return state
+
+
+async def on_completion_changed(completed_deltas: Dict[str, int]) -> None:
+    """
+    Actualiza las rachas después de que cambió el número de completados de algunas fechas.
+
+    Args:
+        completed_deltas: {fecha: cambio en los bloques completados ese día (ej: +1)}
+            Los rollups ya deben tener el cambio escrito.
+    """
+    for date in sorted(d for d in completed_deltas if d and completed_deltas[d]):
+        # Si se completó algo, el día quedó activo; si se des-completó, puede que no
+        active = completed_deltas[date] > 0
+        state = await get_state()
+        last = state["last_active_date"]
+
+        # Caso O(1): un día nuevo después del último activo
+        if active and (last is None or date > last):
+            try:
+                result = await streak_state_collection.update_one(
+                    # Condición optimista: solo si nadie cambió el estado mientras tanto
+                    {"_id": STREAK_STATE_ID, "last_active_date": last},
+                    {"$set": advance_streak(state, date)},
+                    upsert=last is None
+                )
+                if result.matched_count or result.upserted_id is not None:
+                    continue
+            except DuplicateKeyError:
+                # Otro proceso creó el estado al mismo tiempo (primer completado de todos)
+                pass
+
+        # Sin efecto: un día posterior al último activo (no estaba activo),
+        # o completar algo más en el último día activo
+        if (not active and last is not None and date > last) or (active and date == last):
+            continue
+
+        # Casos raros (días pasados, des-completar, carreras): recalcular
+        await recompute_from_rollups()
+
+
+async def backfill_from_history() -> Dict[str, Any]:
+    """
+    Calcula el estado una sola vez desde toda la historia de timeblocks.
+
+    Usa un único cursor ordenado por día (índice (day, start_minute)) y
+    proyectado (solo la fecha); el estado avanza fecha por fecha, así que la
+    memoria no depende del tamaño de la historia.
+    Requiere que los bloques tengan el campo "day" (migrate_timeblock_times.py).
+    """
+    # Toda la historia: incluye los bloques archivados
+    cursor = await timeblock_archive_service.find_blocks(
+        {"completed": True, "day": {"$type": "date"}},
+        None,
+        projection={"_id": 0, "date": 1},
+        sort=[("day", 1)]
+    )
+
+    state = empty_state()
+    async for block in cursor:
+        state = advance_streak(state, block["date"])
+    await _save_state(state)
+    return state
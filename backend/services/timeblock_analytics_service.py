@@ -0,0 +1,148 @@
+"""
+Servicio de Analíticas por Hábito 📈
+
+Responde "¿cómo voy con el hábito X?" en un rango de fechas:
+tasa de cumplimiento, minutos planeados vs completados y en qué horas del
+día se planean (y se cumplen) los bloques.
+
+Analogía: Es como el informe del entrenador.
+No te entrega todas tus fichas de entrenamiento; las resume en una hoja.
+Y si vuelves a pedirla sin haber entrenado desde entonces, te da la
+misma fotocopia en vez de volver a sumar todo.
+
+Cómo funciona:
+- Un solo pipeline de agregación sobre (habit_id, day) agrupa los bloques
+  por hora de inicio; los totales salen de sumar esos 24 grupos.
+- Las ocurrencias virtuales de plantillas del hábito también cuentan como
+  bloques planeados (sin completar), igual que en /timeblocks/stats.
+- El resultado se guarda en un cache en memoria con TTL, junto con la
+  versión del hábito ("habit:<id>") y de las plantillas. Cualquier escritura
+  a ese hábito sube su versión, así que la siguiente lectura recalcula.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+from models.timeblock import date_to_day, time_to_minutes
+from services import timeblock_archive_service, timeblock_template_service, timeblock_version_service
+
+# Segundos que un resultado puede reutilizarse (aunque su versión no cambie)
+ANALYTICS_CACHE_TTL_SECONDS = 300
+
+# Máximo de resultados guardados (se descartan los menos usados)
+ANALYTICS_CACHE_MAX_ENTRIES = 256
+
+# Horas del día para la distribución
+HOURS_PER_DAY = 24
+
+# (habit_id, from, to) -> (versiones, expira_en, resultado)
+_cache: "OrderedDict[Tuple[str, str, str], Tuple[Tuple[int, int], float, Dict[str, Any]]]" = OrderedDict()
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def _pipeline(habit_id: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    """
+    Pipeline que agrupa los bloques del hábito por hora de inicio.
+
+    Los minutos salen de start_minute/end_minute (0 si faltan o el fin es
+    anterior al inicio, igual que en los rollups).
+    """
+    minutes = {"$max": [0, {"$ifNull": [{"$subtract": ["$end_minute", "$start_minute"]}, 0]}]}
+    completed = {"$eq": ["$completed", True]}
+    return [
+        {"$match": {
+            "habit_id": habit_id,
+            "day": {"$gte": date_to_day(start_date), "$lt": date_to_day(end_date) + timedelta(days=1)}
+        }},
+        {"$project": {
+            "_id": 0,
+            "hour": {"$floor": {"$divide": ["$start_minute", 60]}},
+            "completed": completed,
+            "minutes": minutes
+        }},
+        {"$group": {
+            "_id": "$hour",
+            "total": {"$sum": 1},
+            "completed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+            "scheduled_minutes": {"$sum": "$minutes"},
+            "completed_minutes": {"$sum": {"$cond": ["$completed", "$minutes", 0]}}
+        }}
+    ]
+
+
+async def _compute(habit_id: str, start_date: str, end_date: str) -> Dict[str, Any]:
+    """Corre el pipeline, suma las ocurrencias virtuales y arma la respuesta."""
+    hours = [{"hour": h, "total": 0, "completed": 0} for h in range(HOURS_PER_DAY)]
+    totals = {"total": 0, "completed": 0, "scheduled_minutes": 0, "completed_minutes": 0}
+
+    # 1. Bloques reales (con el archivo si el rango llega a días archivados)
+    cursor = await timeblock_archive_service.aggregate_blocks(
+        _pipeline(habit_id, start_date, end_date), date_to_day(start_date)
+    )
+    async for row in cursor:
+        for k in totals:
+            totals[k] += row[k]
+        # Los bloques sin hora válida cuentan en los totales, no en la distribución
+        hour = row["_id"]
+        if hour is not None and 0 <= hour < HOURS_PER_DAY:
+            hours[int(hour)]["total"] += row["total"]
+            hours[int(hour)]["completed"] += row["completed"]
+
+    # 2. Ocurrencias virtuales: planeadas, nunca completadas
+    virtual = await timeblock_template_service.virtual_counts_by_template(start_date, end_date, [habit_id])
+    for template, count in virtual:
+        start = time_to_minutes(template["start_time"])
+        end = time_to_minutes(template["end_time"])
+        totals["total"] += count
+        if start is not None and end is not None and end >= start:
+            totals["scheduled_minutes"] += (end - start) * count
+        if start is not None and 0 <= start // 60 < HOURS_PER_DAY:
+            hours[start // 60]["total"] += count
+
+    completion_rate = round((totals["completed"] / totals["total"]) * 100) if totals["total"] > 0 else 0
+    return {
+        "habit_id": habit_id,
+        "from": start_date,
+        "to": end_date,
+        **totals,
+        "completion_rate": completion_rate,
+        "hour_distribution": hours
+    }
+
+
+# ============================================
+# 📖 LECTURA (CON CACHE)
+# ============================================
+
+async def get_habit_analytics(habit_id: str, start_date: str, end_date: str) -> Dict[str, Any]:
+    """
+    Analíticas del hábito en [start_date, end_date] (fechas "YYYY-MM-DD").
+
+    Pasos:
+    1. Leer las versiones del hábito y de las plantillas (un find pequeño)
+    2. Si hay un resultado en cache con esas versiones y sin expirar, usarlo
+    3. Si no, correr el pipeline y guardar el resultado
+    """
+    habit_version_key = timeblock_version_service.habit_key(habit_id)
+    keys = [habit_version_key, timeblock_version_service.TEMPLATES_KEY]
+    versions = await timeblock_version_service.get_versions(keys)
+    version = (versions[habit_version_key], versions[timeblock_version_service.TEMPLATES_KEY])
+
+    cache_key = (habit_id, start_date, end_date)
+    cached = _cache.get(cache_key)
+    now = time.monotonic()
+    if cached and cached[0] == version and cached[1] > now:
+        _cache.move_to_end(cache_key)
+        return cached[2]
+
+    result = await _compute(habit_id, start_date, end_date)
+    _cache[cache_key] = (version, now + ANALYTICS_CACHE_TTL_SECONDS, result)
+    _cache.move_to_end(cache_key)
+    while len(_cache) > ANALYTICS_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return result
@@ -0,0 +1,257 @@
+"""
+Servicio de Archivo de TimeBlocks (Hot / Cold) 🗄️
+
+Mueve los bloques más viejos que un horizonte configurable desde `timeblocks`
+(colección "caliente") a `timeblocks_archive` (colección "fría").
+
+Analogía: Es como el archivo muerto de una oficina.
+Los expedientes de este año están en el escritorio (rápidos de consultar);
+los de hace años se pasan en cajas al sótano. Casi nunca se bajan al sótano,
+pero cuando alguien pide un expediente viejo, se busca ahí.
+
+Reglas:
+- Se archiva en lotes: insert_many en el archivo y luego UN delete_many en
+  la colección caliente que solo borra los bloques que siguen idénticos a
+  lo copiado. Los que cambiaron entre medio siguen en la colección
+  caliente: su copia se quita del archivo y se reintentan en el siguiente
+  lote (no se pierde la actualización). Si el proceso se corta a la mitad,
+  repetirlo es seguro (una copia previa se reemplaza).
+- El change stream de timeblocks ve el borrado de un bloque archivado; el
+  servicio de eventos lo descarta (is_archived) para que los clientes SSE
+  no lo reciban como un borrado.
+- Los rollups, rachas y heatmaps NO cambian: mover un bloque no es borrarlo.
+- Se guarda una "marca de agua" (archived_before): todos los días anteriores
+  pueden estar en el archivo. Las lecturas solo consultan el archivo cuando
+  su rango empieza antes de esa marca.
+- Los días archivados son de solo lectura para las plantillas (no se
+  materializan ocurrencias nuevas en ellos).
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from config.database import database, timeblock_archive_state_collection, timeblocks_archive_collection
+
+# Días que un bloque permanece en la colección caliente
+ARCHIVE_HORIZON_DAYS = int(os.getenv("TIMEBLOCK_ARCHIVE_DAYS", "180"))
+
+# Bloques movidos por lote (copia + borrado condicional)
+ARCHIVE_BATCH_SIZE = 1000
+
+# Cada cuántas horas corre el job en segundo plano (0 = desactivado)
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("TIMEBLOCK_ARCHIVE_INTERVAL_HOURS", "24"))
+
+logger = logging.getLogger(__name__)
+
+# Documento con la marca de agua del archivo
+ARCHIVE_STATE_ID = "timeblocks_archive"
+
+# Código de Mongo para llave duplicada
+DUPLICATE_KEY_CODE = 11000
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+async def ensure_indexes() -> None:
+    """El archivo se consulta igual que la colección caliente: por (day, start_minute) y (habit_id, day)."""
+    await timeblocks_archive_collection.create_index([("day", ASCENDING), ("start_minute", ASCENDING)])
+    await timeblocks_archive_collection.create_index([("habit_id", ASCENDING), ("day", ASCENDING)])
+
+
+async def get_watermark() -> Optional[datetime]:
+    """Día (a medianoche) antes del cual los bloques pueden estar archivados (None si nunca se archivó)."""
+    state = await timeblock_archive_state_collection.find_one({"_id": ARCHIVE_STATE_ID})
+    return state.get("archived_before") if state else None
+
+
+async def needs_archive(start_day: Optional[datetime]) -> bool:
+    """
+    ¿Una lectura que empieza en `start_day` necesita consultar el archivo?
+    (start_day=None significa "toda la historia")
+    """
+    watermark = await get_watermark()
+    if watermark is None:
+        return False
+    return start_day is None or start_day < watermark
+
+
+async def find_blocks(
+    match: Dict[str, Any],
+    start_day: Optional[datetime],
+    projection: Optional[Dict[str, Any]] = None,
+    sort: Optional[List] = None,
+    batch_size: Optional[int] = None
+):
+    """
+    Cursor de bloques que cumplen `match`, en la colección caliente y, si el
+    rango lo necesita, también en el archivo.
+
+    Con archivo se usa una sola agregación con $unionWith: Mongo une y ordena
+    ambas colecciones y el llamador recibe un único cursor.
+
+    Args:
+        match: Filtro de bloques
+        start_day: Primer día que cubre la lectura (None = toda la historia)
+        projection: Campos a incluir/excluir
+        sort: Lista de (campo, dirección)
+        batch_size: Documentos por viaje del cursor
+    """
+    if not await needs_archive(start_day):
+        cursor = database.timeblocks.find(match, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": match},
+        {"$unionWith": {"coll": timeblocks_archive_collection.name, "pipeline": [{"$match": match}]}}
+    ]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    if projection:
+        pipeline.append({"$project": projection})
+    options = {"batchSize": batch_size} if batch_size else {}
+    return database.timeblocks.aggregate(pipeline, **options)
+
+
+async def aggregate_blocks(pipeline: List[Dict[str, Any]], start_day: Optional[datetime]):
+    """
+    Corre una agregación sobre los bloques y, si el rango lo necesita,
+    también sobre el archivo. La primera etapa debe ser un $match: se repite
+    dentro del $unionWith para que el archivo también use su índice.
+    """
+    if await needs_archive(start_day):
+        match = pipeline[0]
+        union = {"$unionWith": {"coll": timeblocks_archive_collection.name, "pipeline": [match]}}
+        pipeline = [match, union, *pipeline[1:]]
+    return database.timeblocks.aggregate(pipeline)
+
+
+async def is_archived(block_id: Any) -> bool:
+    """¿El bloque está en el archivo? (su borrado de la colección caliente fue un movimiento)"""
+    return await timeblocks_archive_collection.find_one({"_id": block_id}, {"_id": 1}) is not None
+
+
+def _unchanged(block: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Filtro que solo coincide si el documento sigue idéntico a `block`.
+    $literal evita que textos que empiezan con "$" se lean como campos.
+    """
+    return {"_id": block["_id"], "$expr": {"$eq": ["$$ROOT", {"$literal": block}]}}
+
+
+async def find_block(match: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Un bloque: primero en la colección caliente y, si no está, en el archivo."""
+    block = await database.timeblocks.find_one(match)
+    if block is None and await get_watermark() is not None:
+        block = await timeblocks_archive_collection.find_one(match)
+    return block
+
+
+# ============================================
+# 🧊 ARCHIVADO
+# ============================================
+
+async def archive_old_blocks(
+    horizon_days: int = ARCHIVE_HORIZON_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    Mueve al archivo los bloques con día anterior a (hoy - horizon_days).
+
+    Pasos por lote:
+    1. Leer hasta `batch_size` bloques viejos (por _id, sobre el índice de day)
+    2. insert_many en el archivo (desordenado; si una corrida interrumpida
+       ya había copiado un bloque, esa copia se reemplaza)
+    3. Un delete_many de esos _id, con la condición de que cada bloque siga
+       idéntico a lo copiado
+    4. Si no se borraron todos: los que siguen en la colección caliente
+       cambiaron; se quita su copia del archivo y se reintentan
+
+    La marca de agua se sube ANTES de mover: así una lectura concurrente
+    nunca deja de ver un bloque (a lo sumo, por un instante, lo ve en ambas).
+
+    Returns:
+        Reporte con la fecha de corte, lotes y bloques movidos
+    """
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=horizon_days)
+
+    # La marca solo avanza (con un horizonte mayor no se "desarchiva")
+    await timeblock_archive_state_collection.update_one(
+        {"_id": ARCHIVE_STATE_ID},
+        {"$max": {"archived_before": cutoff}},
+        upsert=True
+    )
+
+    report: Dict[str, Any] = {"cutoff": cutoff.strftime("%Y-%m-%d"), "batches": 0, "moved": 0, "retried": 0}
+    query = {"day": {"$lt": cutoff}}
+
+    while True:
+        batch = await database.timeblocks.find(query).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        # 2. Copia
+        try:
+            await timeblocks_archive_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error["code"] != DUPLICATE_KEY_CODE for error in errors):
+                raise
+            # Copias de una corrida interrumpida: el bloque pudo cambiar desde entonces
+            await timeblocks_archive_collection.bulk_write(
+                [ReplaceOne({"_id": batch[error["index"]]["_id"]}, batch[error["index"]]) for error in errors],
+                ordered=False
+            )
+
+        # 3. Borrado condicional: un solo delete_many
+        result = await database.timeblocks.delete_many({"$or": [_unchanged(block) for block in batch]})
+
+        # 4. Conciliar lo que no se borró (normalmente nada)
+        not_moved = []
+        if result.deleted_count < len(batch):
+            not_moved = await database.timeblocks.distinct("_id", {"_id": {"$in": [block["_id"] for block in batch]}})
+            if not_moved:
+                await timeblocks_archive_collection.delete_many({"_id": {"$in": not_moved}})
+            vanished = len(batch) - result.deleted_count - len(not_moved)
+            if vanished:
+                # Borrados por el usuario entre la lectura y el borrado: su copia no se puede distinguir
+                logger.warning("Archivo: %d bloques se borraron mientras se archivaban", vanished)
+
+        report["batches"] += 1
+        report["moved"] += result.deleted_count
+        report["retried"] += len(not_moved)
+        if not result.deleted_count:
+            # Todo el lote cambió mientras tanto: se reintenta en la siguiente corrida
+            break
+
+    return report
+
+
+async def run_periodically() -> None:
+    """
+    Job en segundo plano: archiva cada ARCHIVE_INTERVAL_HOURS horas.
+    Un error no detiene el job; se reintenta en la siguiente vuelta.
+    """
+    if ARCHIVE_INTERVAL_HOURS <= 0:
+        return
+
+    while True:
+        try:
+            report = await archive_old_blocks()
+            if report["moved"]:
+                logger.info("Timeblocks archivados: %s (anteriores a %s)", report["moved"], report["cutoff"])
+        except PyMongoError as e:
+            logger.warning("Error archivando timeblocks: %s: %s", type(e).__name__, e)
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
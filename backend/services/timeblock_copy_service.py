@@ -0,0 +1,163 @@
+"""
+Servicio para Copiar la Semana de TimeBlocks 📋
+
+Copia el plan de una semana a otra sin que los bloques salgan de MongoDB:
+un pipeline selecciona la semana origen, mueve cada bloque los días que
+separan ambas semanas, lo deja sin completar y lo escribe con $merge.
+
+Analogía: Es como pedirle a la copiadora de la oficina que saque copia
+de la hoja de la semana pasada con la fecha cambiada, en vez de llevarte
+la hoja a casa, reescribirla a mano y volver a entregarla.
+
+Reglas:
+- Los bloques que nacieron de una plantilla no se copian (la plantilla ya
+  genera sus ocurrencias en la semana destino).
+- Cada copia lleva `copy_key` = "<id origen>:<semana destino>" con índice
+  único: repetir la misma copia no duplica bloques.
+- Los solapamientos con bloques ya existentes en la semana destino no se
+  revisan: la copia ocurre entera dentro de Mongo.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from config.database import database
+from services import timeblock_archive_service, timeblock_rollup_service
+
+# Milisegundos de un día (las fechas en Mongo se suman en milisegundos)
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def parse_iso_week(value: str) -> datetime:
+    """
+    Lunes de una semana ISO en formato "YYYY-Www".
+
+    Ejemplo:
+        >>> parse_iso_week("2026-W07")
+        datetime(2026, 2, 9, 0, 0)
+
+    Raises:
+        ValueError: Si el texto no tiene ese formato
+    """
+    return datetime.strptime(f"{value}-1", "%G-W%V-%u")
+
+
+def week_label(monday: datetime) -> str:
+    """Semana ISO ("YYYY-Www") de un lunes."""
+    year, week, _ = monday.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+# ============================================
+# 📋 COPIA
+# ============================================
+
+async def ensure_indexes() -> None:
+    """Índice único usado por $merge para reconocer copias ya hechas."""
+    await database.timeblocks.create_index([("copy_key", ASCENDING)], unique=True, sparse=True)
+
+
+async def copy_week(from_monday: datetime, to_monday: datetime) -> Dict[str, Any]:
+    """
+    Copia los bloques de la semana que empieza en `from_monday` a la que
+    empieza en `to_monday`.
+
+    Pasos:
+    1. $merge dentro de Mongo: los bloques nuevos llevan un `copy_batch` único
+       (los que ya existían conservan el suyo)
+    2. Agrupar SOLO los bloques de este copy_batch por (fecha, hábito):
+       a lo sumo 7 x hábitos filas pequeñas
+    3. Sumar esos totales a los rollups (las copias nacen sin completar)
+    4. Quitar `copy_batch` de los bloques (solo servía para el paso 2;
+       `copy_key` se queda porque es lo que evita duplicar)
+
+    Args:
+        from_monday: Lunes de la semana origen
+        to_monday: Lunes de la semana destino
+
+    Returns:
+        Cuántos bloques se copiaron
+
+    Raises:
+        ValueError: Si la semana destino ya está archivada
+    """
+    watermark = await timeblock_archive_service.get_watermark()
+    if watermark is not None and to_monday < watermark:
+        raise ValueError("La semana destino pertenece a días archivados")
+
+    shift_ms = (to_monday - from_monday).days * MS_PER_DAY
+    batch = str(ObjectId())
+    new_day = {"$add": ["$day", shift_ms]}
+
+    # 1. Copiar dentro de Mongo (ningún documento viaja al servidor)
+    await database.timeblocks.aggregate([
+        {"$match": {
+            "day": {"$gte": from_monday, "$lt": from_monday + timedelta(days=7)},
+            "template_id": {"$not": {"$type": "string"}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "title": 1,
+            "habit_id": 1,
+            "start_time": 1,
+            "end_time": 1,
+            "start_minute": 1,
+            "end_minute": 1,
+            "day": new_day,
+            "date": {"$dateToString": {"format": "%Y-%m-%d", "date": new_day}},
+            "completed": {"$literal": False},
+            "copy_key": {"$concat": [{"$toString": "$_id"}, ":", week_label(to_monday)]},
+            "copy_batch": batch
+        }},
+        {"$merge": {
+            "into": database.timeblocks.name,
+            "on": "copy_key",
+            "whenMatched": "keepExisting",
+            "whenNotMatched": "insert"
+        }}
+    ]).to_list(length=None)
+
+    # 2. Totales de lo que de verdad se insertó en esta llamada
+    minutes = {"$max": [0, {"$ifNull": [{"$subtract": ["$end_minute", "$start_minute"]}, 0]}]}
+    rows = await database.timeblocks.aggregate([
+        {"$match": {
+            "day": {"$gte": to_monday, "$lt": to_monday + timedelta(days=7)},
+            "copy_batch": batch
+        }},
+        {"$group": {
+            "_id": {"date": "$date", "habit_id": "$habit_id"},
+            "total": {"$sum": 1},
+            "scheduled_minutes": {"$sum": minutes}
+        }}
+    ]).to_list(length=None)
+
+    # 3. Rollups, versiones (ETag / analíticas) de las fechas y hábitos tocados
+    deltas: Dict[Tuple[str, str], Dict[str, int]] = {
+        (row["_id"]["date"], row["_id"]["habit_id"]): {
+            "total": row["total"],
+            "scheduled_minutes": row["scheduled_minutes"]
+        }
+        for row in rows
+    }
+    await timeblock_rollup_service.apply_deltas(
+        deltas,
+        {date for date, _ in deltas},
+        {habit_id for _, habit_id in deltas}
+    )
+
+    # 4. El marcador de esta llamada ya no hace falta
+    if rows:
+        await database.timeblocks.update_many(
+            {"day": {"$gte": to_monday, "$lt": to_monday + timedelta(days=7)}, "copy_batch": batch},
+            {"$unset": {"copy_batch": ""}}
+        )
+
+    return {"copied": sum(row["total"] for row in rows)}
+
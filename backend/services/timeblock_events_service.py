@@ -0,0 +1,201 @@
+"""
+Servicio de Eventos en Tiempo Real de TimeBlocks 📡
+
+Un solo change stream de MongoDB sobre `timeblocks` (compartido por todo el
+proceso) reparte cada cambio a los clientes conectados por Server-Sent Events.
+
+Analogía: Es como la radio de un taxi.
+En vez de que cada taxista llame a la central cada minuto preguntando
+"¿hay algo nuevo?" (polling), la central transmite una sola vez por radio
+y cada taxi escucha solo los avisos de su zona (su fecha).
+
+Detalles:
+- El stream arranca con el primer suscriptor y se detiene con el último.
+  Al detenerse se olvidan el resume token y el historial: el siguiente
+  stream empieza "desde ahora" (lo que cambió sin nadie escuchando no se
+  reenvía como si fuera en vivo).
+- Si la conexión con Mongo se corta, el stream se reabre desde el último
+  resume token, sin perder eventos.
+- Cada evento SSE lleva como `id` su resume token. Si un cliente se reconecta
+  con Last-Event-ID, se le reenvían los eventos recientes que se perdió
+  (del historial en memoria); si ya no están, recibe un evento "reset"
+  para que vuelva a pedir los datos completos.
+- El archivado (timeblock_archive_service) borra bloques viejos de
+  `timeblocks` al moverlos a `timeblocks_archive`: esos borrados no se
+  envían (el bloque sigue existiendo).
+- Requiere que MongoDB sea un replica set (un nodo local alcanza:
+  `mongod --replSet rs0` + `rs.initiate()`).
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config.database import database
+from services import timeblock_archive_service
+
+logger = logging.getLogger(__name__)
+
+# Eventos recientes guardados para reenviar a clientes que se reconectan
+HISTORY_SIZE = 1000
+
+# Eventos pendientes por cliente antes de considerarlo "lento"
+QUEUE_SIZE = 100
+
+# Espera antes de reabrir el change stream tras un error (segundos)
+RETRY_DELAY_SECONDS = 1.0
+
+# Códigos de Mongo que indican que el resume token ya no sirve
+# (280 = ChangeStreamFatalError, 286 = ChangeStreamHistoryLost)
+LOST_RESUME_CODES = (280, 286)
+
+# Campos internos que no se envían al cliente
+HIDDEN_FIELDS = ("_id", "day", "start_minute", "end_minute")
+
+
+class Subscriber:
+    """Un cliente conectado: su cola de eventos y la fecha que le interesa."""
+
+    def __init__(self, date: Optional[str]):
+        self.date = date
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # True si la cola se llenó: el cliente debe recargar todo
+        self.overflowed = False
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        """¿Este evento es de la fecha del cliente? (los borrados no traen fecha: van a todos)"""
+        return self.date is None or event.get("date") in (None, self.date)
+
+
+class TimeblockEventBroker:
+    """Dueño del change stream compartido y de la lista de suscriptores."""
+
+    def __init__(self):
+        self.subscribers: List[Subscriber] = []
+        self.history: Deque[Tuple[str, Dict[str, Any]]] = deque(maxlen=HISTORY_SIZE)
+        self.resume_token: Optional[Dict[str, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+
+    # ----------------------------------------
+    # Suscripciones
+    # ----------------------------------------
+
+    def subscribe(self, date: Optional[str], last_event_id: Optional[str] = None) -> Subscriber:
+        """
+        Registra un cliente y arranca el stream si es el primero.
+
+        Si trae last_event_id, encola los eventos que se perdió o un "reset"
+        si ya no están en el historial.
+        """
+        subscriber = Subscriber(date)
+
+        if last_event_id:
+            missed = self._events_after(last_event_id)
+            if missed is None:
+                subscriber.overflowed = True
+            else:
+                for token, event in missed:
+                    if subscriber.wants(event):
+                        self._offer(subscriber, token, event)
+
+        self.subscribers.append(subscriber)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """Quita un cliente y detiene el stream si ya no queda nadie."""
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+        if not self.subscribers and self.task is not None:
+            self._stop()
+
+    async def close(self) -> None:
+        """Detiene el stream (al apagar el servidor)."""
+        self.subscribers.clear()
+        if self.task is not None:
+            self._stop()
+
+    def _stop(self) -> None:
+        """Cancela el stream y olvida su posición: un Last-Event-ID viejo recibe "reset"."""
+        self.task.cancel()
+        self.task = None
+        self.resume_token = None
+        self.history.clear()
+
+    def _events_after(self, last_event_id: str) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """Eventos del historial posteriores a last_event_id (None si ya no está)."""
+        tokens = [token for token, _ in self.history]
+        if last_event_id not in tokens:
+            return None
+        return list(self.history)[tokens.index(last_event_id) + 1:]
+
+    # ----------------------------------------
+    # Change stream
+    # ----------------------------------------
+
+    async def _run(self) -> None:
+        """Lee el change stream y reparte los eventos; se reabre tras errores."""
+        while True:
+            try:
+                async with database.timeblocks.watch(
+                    full_document="updateLookup",
+                    resume_after=self.resume_token
+                ) as stream:
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        if await is_archive_move(change):
+                            continue
+                        self._publish(change["_id"]["_data"], to_event(change))
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.warning("Change stream de timeblocks interrumpido: %s: %s", type(e).__name__, e)
+                if isinstance(e, OperationFailure) and e.code in LOST_RESUME_CODES:
+                    # El token ya no existe en el oplog: empezar de cero y avisar a todos
+                    self.resume_token = None
+                    self.history.clear()
+                    for subscriber in self.subscribers:
+                        subscriber.overflowed = True
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+    def _publish(self, token: str, event: Dict[str, Any]) -> None:
+        """Guarda el evento en el historial y lo encola para cada cliente interesado."""
+        self.history.append((token, event))
+        for subscriber in self.subscribers:
+            if subscriber.wants(event):
+                self._offer(subscriber, token, event)
+
+    @staticmethod
+    def _offer(subscriber: Subscriber, token: str, event: Dict[str, Any]) -> None:
+        """Encola sin bloquear; si el cliente va muy atrasado se marca para reset."""
+        try:
+            subscriber.queue.put_nowait((token, event))
+        except asyncio.QueueFull:
+            subscriber.overflowed = True
+
+
+async def is_archive_move(change: Dict[str, Any]) -> bool:
+    """¿Es el borrado de un bloque que se movió al archivo?"""
+    if change["operationType"] != "delete":
+        return False
+    return await timeblock_archive_service.is_archived(change["documentKey"]["_id"])
+
+
+def to_event(change: Dict[str, Any]) -> Dict[str, Any]:
+    """Convierte un cambio de Mongo en el evento que ve el cliente."""
+    document = change.get("fullDocument") or {}
+    block = {k: v for k, v in document.items() if k not in HIDDEN_FIELDS} if document else None
+    return {
+        "operation": change["operationType"],
+        "id": str(change.get("documentKey", {}).get("_id")),
+        "date": document.get("date"),
+        "block": block
+    }
+
+
+# Instancia única del proceso (un solo change stream para todos los clientes)
+event_broker = TimeblockEventBroker()
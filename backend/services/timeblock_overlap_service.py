@@ -0,0 +1,168 @@
+"""
+Servicio de Detección de Solapamientos ⏱️
+
+Detecta bloques que se pisan en el mismo día (ej: "Gym 9:00-10:00" y
+"Lectura 9:30-10:30").
+
+Analogía: Es como la agenda de un consultorio.
+Antes de dar una cita nueva, la recepcionista mira solo las horas ocupadas
+de ESE día (no los nombres de los pacientes ni otros días) y revisa
+si el nuevo horario choca con alguna.
+
+Cómo funciona:
+- De Mongo solo se traen start_minute/end_minute del día (consulta proyectada
+  sobre el índice (day, start_minute)), ya ordenados por inicio.
+- Con la lista ordenada, bisect encuentra en O(log n) dónde dejan de empezar
+  bloques antes de que termine el nuevo; solo esos pueden chocar.
+- En los endpoints bulk, cada día se carga una sola vez para todo el lote.
+- Para listar TODOS los pares en conflicto se usa un barrido (sweep line) con
+  un heap de los bloques "abiertos": O(n log n + pares).
+"""
+
+import asyncio
+import heapq
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from models.timeblock import time_to_minutes
+from services import timeblock_archive_service, timeblock_template_service
+
+# Un intervalo es (inicio, fin, id) en minutos desde la medianoche
+Interval = Tuple[int, int, str]
+
+
+async def load_day_intervals(day: datetime, exclude_id: Optional[str] = None) -> List[Interval]:
+    """
+    Intervalos ocupados de un día, ordenados por inicio.
+
+    Incluye las ocurrencias virtuales de plantillas (también ocupan tiempo).
+
+    Args:
+        day: Fecha (datetime a medianoche)
+        exclude_id: ID del bloque a ignorar (el que se está redimensionando)
+    """
+    query: Dict[str, Any] = {"day": day, "start_minute": {"$ne": None}, "end_minute": {"$ne": None}}
+    if exclude_id and ObjectId.is_valid(exclude_id):
+        query["_id"] = {"$ne": ObjectId(exclude_id)}
+
+    # Días archivados: también se leen de timeblocks_archive
+    cursor = await timeblock_archive_service.find_blocks(
+        query, day, projection={"start_minute": 1, "end_minute": 1}, sort=[("start_minute", 1)]
+    )
+    intervals = [
+        (block["start_minute"], block["end_minute"], str(block["_id"]))
+        async for block in cursor
+        if block["end_minute"] > block["start_minute"]
+    ]
+
+    for occurrence in await timeblock_template_service.expand_occurrences(day.strftime("%Y-%m-%d")):
+        start = time_to_minutes(occurrence["start_time"])
+        end = time_to_minutes(occurrence["end_time"])
+        if start is not None and end is not None and end > start and occurrence["id"] != exclude_id:
+            intervals.append((start, end, occurrence["id"]))
+
+    intervals.sort()
+    return intervals
+
+
+def find_overlaps(intervals: List[Interval], start: int, end: int) -> List[str]:
+    """
+    IDs de los intervalos (ordenados por inicio) que se pisan con [start, end).
+
+    Dos bloques que solo se tocan (uno termina 10:00, otro empieza 10:00) no chocan.
+    """
+    if end <= start:
+        return []
+
+    # Solo los que empiezan antes de que termine el nuevo pueden chocar
+    limit = bisect_left(intervals, (end,))
+    return [block_id for (s, e, block_id) in intervals[:limit] if e > start]
+
+
+def overlapping_pairs(intervals: List[Interval]) -> List[Tuple[str, str]]:
+    """
+    Todos los pares de intervalos que se pisan (barrido con heap).
+
+    Recorre los bloques por hora de inicio; el heap guarda los bloques aún
+    "abiertos" ordenados por hora de fin. Al llegar un bloque nuevo, se cierran
+    los que ya terminaron y el nuevo choca con todos los que siguen abiertos.
+    """
+    pairs: List[Tuple[str, str]] = []
+    active: List[Interval] = []  # heap de (fin, inicio, id)
+
+    for start, end, block_id in sorted(intervals):
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        pairs.extend((other_id, block_id) for (_, _, other_id) in active)
+        heapq.heappush(active, (end, start, block_id))
+
+    return pairs
+
+
+async def check_overlaps(
+    day: Optional[datetime],
+    start_minute: Optional[int],
+    end_minute: Optional[int],
+    exclude_id: Optional[str] = None
+) -> List[str]:
+    """
+    IDs de los bloques del día que chocan con el horario indicado.
+    Retorna lista vacía si la fecha u horas no se pudieron interpretar.
+    """
+    if day is None or start_minute is None or end_minute is None:
+        return []
+
+    intervals = await load_day_intervals(day, exclude_id)
+    return find_overlaps(intervals, start_minute, end_minute)
+
+
+async def check_batch_overlaps(
+    slots: List[Tuple[Optional[datetime], Optional[int], Optional[int], str]],
+    skip_conflicting: bool = False,
+    removed_ids: Iterable[str] = ()
+) -> List[List[str]]:
+    """
+    Choques de un lote de horarios, leyendo cada día de Mongo una sola vez.
+
+    Los elementos se revisan en orden, como si se aplicaran uno por uno: cada
+    horario se compara con los bloques del día y con los anteriores del lote
+    ya aceptados. Si el ID es de un bloque existente (se está moviendo), su
+    posición vieja deja de contar en cuanto se acepta la nueva.
+
+    Args:
+        slots: (día, start_minute, end_minute, id) por elemento
+        skip_conflicting: True si los elementos que chocan se van a rechazar
+                          (entonces no ocupan tiempo para los siguientes)
+        removed_ids: IDs que el mismo lote borra (ya no ocupan tiempo)
+
+    Returns:
+        Por elemento, los IDs con los que choca (vacía si no se pudo interpretar)
+    """
+    days = list({day for day, start, end, _ in slots if None not in (day, start, end)})
+    loaded = await asyncio.gather(*(load_day_intervals(day) for day in days))
+    removed = set(removed_ids)
+    intervals_by_day = {
+        day: [interval for interval in intervals if interval[2] not in removed]
+        for day, intervals in zip(days, loaded)
+    }
+
+    conflicts: List[List[str]] = []
+    for day, start, end, block_id in slots:
+        if None in (day, start, end):
+            conflicts.append([])
+            continue
+
+        intervals = intervals_by_day[day]
+        found = [other_id for other_id in find_overlaps(intervals, start, end) if other_id != block_id]
+        conflicts.append(found)
+        if found and skip_conflicting:
+            continue
+
+        intervals[:] = [interval for interval in intervals if interval[2] != block_id]
+        if end > start:
+            insort(intervals, (start, end, block_id))
+
+    return conflicts
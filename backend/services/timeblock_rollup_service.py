@@ -0,0 +1,370 @@
+"""
+Servicio de Rollups Diarios de TimeBlocks 📊
+
+Mantiene la colección `timeblock_daily_rollups`: un documento pequeño por
+(fecha, habit_id) con contadores que se actualizan de forma atómica ($inc)
+cada vez que un timeblock se crea, cambia o se borra.
+
+Analogía: Es como la caja registradora de una tienda.
+En vez de contar todos los billetes al final del día (escanear cada bloque),
+cada venta suma o resta al contador en el momento. Para saber el total
+del día solo miras el contador.
+
+Campos de cada rollup:
+- total: bloques planeados ese día para ese hábito
+- completed: bloques completados
+- scheduled_minutes: minutos planeados (según start_time/end_time)
+- completed_minutes: minutos de los bloques completados
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ASCENDING, DESCENDING, DeleteOne, ReplaceOne, UpdateOne
+
+from config.database import database, timeblock_rollups_collection, timeblocks_archive_collection
+from models.timeblock import time_to_minutes
+from services import (
+    heatmap_service,
+    streak_service,
+    timeblock_archive_service,
+    timeblock_version_service,
+    weekly_ledger_service
+)
+
+logger = logging.getLogger(__name__)
+
+# Campos contadores de cada rollup
+ROLLUP_COUNTERS = ("total", "completed", "scheduled_minutes", "completed_minutes")
+
+# Proyección mínima para recalcular rollups desde los bloques crudos
+RAW_PROJECTION = {"_id": 0, "date": 1, "habit_id": 1, "completed": 1, "start_time": 1, "end_time": 1}
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def block_minutes(start_time: Optional[str], end_time: Optional[str]) -> int:
+    """
+    Duración de un bloque en minutos (0 si las horas no se pueden interpretar).
+    """
+    start = time_to_minutes(start_time)
+    end = time_to_minutes(end_time)
+    if start is None or end is None or end < start:
+        return 0
+    return end - start
+
+
+def block_counters(block: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Contadores con los que un solo bloque contribuye a su rollup.
+    """
+    minutes = block_minutes(block.get("start_time"), block.get("end_time"))
+    completed = bool(block.get("completed", False))
+    return {
+        "total": 1,
+        "completed": 1 if completed else 0,
+        "scheduled_minutes": minutes,
+        "completed_minutes": minutes if completed else 0
+    }
+
+
+# Actualizaciones de rachas y heatmap en segundo plano
+# (se guarda la referencia para que el recolector no las cancele a medias)
+_completion_tasks: Set[asyncio.Task] = set()
+
+
+async def _update_completions(completed_deltas: Dict[str, int]) -> None:
+    """
+    Rachas y heatmap a partir de los cambios de completados por día.
+    Best-effort: un error queda en el log (rebuild_rollups.py los recalcula).
+    """
+    results = await asyncio.gather(
+        streak_service.on_completion_changed(completed_deltas),
+        heatmap_service.on_completion_changed(completed_deltas),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Error actualizando rachas/heatmap: %s: %s", type(result).__name__, result)
+
+
+# ============================================
+# ✏️ MANTENIMIENTO INCREMENTAL
+# ============================================
+
+async def ensure_indexes() -> None:
+    """
+    Crea el índice único (date, habit_id) usado por los upserts y las lecturas por rango.
+    """
+    await timeblock_rollups_collection.create_index(
+        [("date", ASCENDING), ("habit_id", ASCENDING)],
+        unique=True
+    )
+
+
+async def record_block_created(block: Dict[str, Any]) -> None:
+    """Suma un bloque nuevo a su rollup."""
+    await record_bulk_changes([(None, block)])
+
+
+async def record_block_deleted(block: Dict[str, Any]) -> None:
+    """Resta un bloque borrado de su rollup."""
+    await record_bulk_changes([(block, None)])
+
+
+async def record_block_changed(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    """
+    Aplica la diferencia entre el estado anterior y el nuevo de un bloque.
+
+    Sirve para los cambios de `completed` y de duración (start/end).
+    Si el bloque cambia de fecha u hábito, se resta del rollup viejo
+    y se suma al nuevo.
+    """
+    await record_bulk_changes([(before, after)])
+
+
+async def record_bulk_changes(
+    changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]
+) -> None:
+    """
+    Aplica muchos cambios de bloques con un solo bulk_write.
+
+    Cada cambio es una tupla (antes, después):
+    - (None, bloque) = bloque creado
+    - (bloque, None) = bloque borrado
+    - (antes, después) = bloque modificado
+
+    Los deltas se acumulan por (fecha, hábito) en memoria, así que 150 bloques
+    del mismo día terminan siendo un único $inc. Además se incrementa el
+    contador de versión (ETag) de cada fecha y hábito que de verdad cambió.
+    """
+    deltas: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: dict.fromkeys(ROLLUP_COUNTERS, 0))
+    changed_dates = set()
+    changed_habits = set()
+
+    for before, after in changes:
+        if before == after:
+            continue
+        if before is not None:
+            changed_dates.add(before.get("date"))
+            changed_habits.add(before.get("habit_id"))
+            counters = deltas[(before.get("date"), before.get("habit_id"))]
+            for k, v in block_counters(before).items():
+                counters[k] -= v
+        if after is not None:
+            changed_dates.add(after.get("date"))
+            changed_habits.add(after.get("habit_id"))
+            counters = deltas[(after.get("date"), after.get("habit_id"))]
+            for k, v in block_counters(after).items():
+                counters[k] += v
+
+    await apply_deltas(deltas, changed_dates, changed_habits)
+
+
+async def apply_deltas(
+    deltas: Dict[Tuple[str, str], Dict[str, int]],
+    changed_dates: Iterable[Optional[str]],
+    changed_habits: Iterable[Optional[str]]
+) -> None:
+    """
+    Escribe deltas ya acumulados por (fecha, hábito) y avisa a quien dependa de ellos.
+
+    Sirve también para escrituras que no pasan bloque por bloque por la API
+    (ej: copiar una semana dentro de Mongo), que solo conocen los totales.
+    """
+    operations = []
+    for (date, habit_id), counters in deltas.items():
+        # Omitimos los contadores que no cambian
+        inc = {k: v for k, v in counters.items() if v}
+        if inc:
+            operations.append(UpdateOne({"date": date, "habit_id": habit_id}, {"$inc": inc}, upsert=True))
+
+    # Libros semanales que cubren estas fechas, ANTES de tocar los rollups
+    # (ver la sección de concurrencia de weekly_ledger_service)
+    snapshot = await weekly_ledger_service.snapshot_for_deltas(deltas) if operations else []
+
+    # Rollups y versiones son colecciones distintas: se escriben en paralelo
+    pending = []
+    if operations:
+        pending.append(timeblock_rollups_collection.bulk_write(operations, ordered=False))
+    if changed_dates:
+        pending.append(timeblock_version_service.bump_dates(changed_dates, changed_habits))
+    await asyncio.gather(*pending)
+
+    # Los libros se actualizan después de los rollups: un recálculo que los lea ya ve el delta
+    if operations:
+        await weekly_ledger_service.on_deltas(deltas, snapshot)
+
+    # Rachas y heatmap solo cambian si cambió el número de completados de algún día.
+    # Se actualizan en segundo plano con la diferencia por día: la petición no espera
+    completed_deltas: Dict[str, int] = defaultdict(int)
+    for (date, _), counters in deltas.items():
+        if date and counters.get("completed"):
+            completed_deltas[date] += counters["completed"]
+    completed_deltas = {date: delta for date, delta in completed_deltas.items() if delta}
+    if completed_deltas:
+        task = asyncio.create_task(_update_completions(completed_deltas))
+        _completion_tasks.add(task)
+        task.add_done_callback(_completion_tasks.discard)
+
+
+# ============================================
+# 📖 LECTURAS
+# ============================================
+
+async def get_daily_totals(
+    start_date: str,
+    end_date: str,
+    habit_ids: Optional[List[str]] = None
+) -> Dict[str, Dict[str, int]]:
+    """
+    Suma los rollups por fecha en el rango [start_date, end_date].
+
+    Returns:
+        Diccionario {fecha: {total, completed, scheduled_minutes, completed_minutes}}
+        (solo fechas con datos)
+    """
+    match: Dict[str, Any] = {"date": {"$gte": start_date, "$lte": end_date}}
+    if habit_ids:
+        match["habit_id"] = {"$in": habit_ids}
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$date", **{k: {"$sum": f"${k}"} for k in ROLLUP_COUNTERS}}}
+    ]
+    rows = await timeblock_rollups_collection.aggregate(pipeline).to_list(length=None)
+    return {row.pop("_id"): row for row in rows}
+
+
+async def get_habit_totals(start_date: str, end_date: str) -> Dict[str, Dict[str, int]]:
+    """
+    Bloques planeados y completados por hábito en el rango [start_date, end_date],
+    en una sola agregación.
+
+    Returns:
+        Diccionario {habit_id: {total, completed}} (solo hábitos con datos)
+    """
+    pipeline = [
+        {"$match": {"date": {"$gte": start_date, "$lte": end_date}}},
+        {"$group": {"_id": "$habit_id", "total": {"$sum": "$total"}, "completed": {"$sum": "$completed"}}}
+    ]
+    rows = await timeblock_rollups_collection.aggregate(pipeline).to_list(length=None)
+    return {row.pop("_id"): row for row in rows}
+
+
+async def get_completed_total() -> int:
+    """
+    Bloques completados en toda la historia (archivados incluidos),
+    sumando los rollups en vez de recorrer los bloques.
+    """
+    rows = await timeblock_rollups_collection.aggregate([
+        {"$group": {"_id": None, "completed": {"$sum": "$completed"}}}
+    ]).to_list(length=1)
+    return rows[0]["completed"] if rows else 0
+
+
+# ============================================
+# 🔧 RECONSTRUCCIÓN / VERIFICACIÓN
+# ============================================
+
+async def _date_bounds(collection) -> Optional[Tuple[str, str]]:
+    """Fecha mínima y máxima presentes en una colección (None si está vacía)."""
+    first = await collection.find_one({"date": {"$type": "string"}}, {"date": 1}, sort=[("date", ASCENDING)])
+    last = await collection.find_one({"date": {"$type": "string"}}, {"date": 1}, sort=[("date", DESCENDING)])
+    if not first or not last:
+        return None
+    return first["date"], last["date"]
+
+
+async def rebuild_rollups(chunk_days: int = 30, apply: bool = False) -> Dict[str, Any]:
+    """
+    Recalcula los rollups desde los timeblocks crudos y reporta las diferencias (drift).
+
+    Recorre la historia en bloques de `chunk_days` días para que la memoria
+    dependa del tamaño del bloque y no de toda la historia.
+
+    Args:
+        chunk_days: Días por bloque de recálculo
+        apply: Si es True, corrige los rollups que no coinciden
+
+    Returns:
+        Reporte con filas revisadas, filas con drift y una muestra de diferencias
+    """
+    # Los bloques archivados siguen contando en sus rollups
+    bounds = [b for b in (await _date_bounds(database.timeblocks),
+                          await _date_bounds(timeblocks_archive_collection),
+                          await _date_bounds(timeblock_rollups_collection)) if b]
+    report: Dict[str, Any] = {"chunks": 0, "checked": 0, "drifted": 0, "fixed": 0, "samples": []}
+    if not bounds:
+        return report
+
+    start = datetime.strptime(min(b[0] for b in bounds), "%Y-%m-%d")
+    last = datetime.strptime(max(b[1] for b in bounds), "%Y-%m-%d")
+    fixed_years = set()
+
+    while start <= last:
+        end = min(start + timedelta(days=chunk_days - 1), last)
+        date_range = {"$gte": start.strftime("%Y-%m-%d"), "$lte": end.strftime("%Y-%m-%d")}
+
+        # 1. Recalcular desde los bloques crudos (solo campos necesarios, archivo incluido)
+        expected: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: dict.fromkeys(ROLLUP_COUNTERS, 0))
+        blocks = await timeblock_archive_service.find_blocks({"date": date_range}, start, projection=RAW_PROJECTION)
+        async for block in blocks:
+            counters = expected[(block["date"], block.get("habit_id"))]
+            for k, v in block_counters(block).items():
+                counters[k] += v
+
+        # 2. Leer los rollups guardados del mismo rango
+        stored: Dict[Tuple[str, str], Dict[str, int]] = {}
+        async for row in timeblock_rollups_collection.find({"date": date_range}):
+            stored[(row["date"], row.get("habit_id"))] = {k: row.get(k, 0) for k in ROLLUP_COUNTERS}
+
+        # 3. Comparar y preparar correcciones
+        operations = []
+        drifted_dates = set()
+        drifted_habits = set()
+        for key in expected.keys() | stored.keys():
+            report["checked"] += 1
+            want = expected.get(key)
+            have = stored.get(key)
+            # Un rollup en ceros equivale a no tener rollup (quedó tras borrar bloques)
+            if want == have or (want is None and not any(have.values())):
+                continue
+
+            report["drifted"] += 1
+            if len(report["samples"]) < 20:
+                report["samples"].append({"date": key[0], "habit_id": key[1], "expected": want, "stored": have})
+
+            drifted_dates.add(key[0])
+            drifted_habits.add(key[1])
+            selector = {"date": key[0], "habit_id": key[1]}
+            if want is None:
+                operations.append(DeleteOne(selector))
+            else:
+                operations.append(ReplaceOne(selector, {**selector, **want}, upsert=True))
+
+        if apply and operations:
+            await timeblock_rollups_collection.bulk_write(operations, ordered=False)
+            # Las estadísticas cacheadas (ETag / analíticas) de esas fechas y hábitos ya no son válidas
+            await timeblock_version_service.bump_dates(drifted_dates, drifted_habits)
+            await weekly_ledger_service.rebuild_covering(min(drifted_dates), max(drifted_dates))
+            fixed_years.update(int(d[:4]) for d in drifted_dates if d)
+            report["fixed"] += len(operations)
+
+        report["chunks"] += 1
+        start = end + timedelta(days=1)
+
+    # Rachas y heatmaps se derivan de los completados: recalcularlos UNA vez
+    # con los rollups ya corregidos (no por cada bloque de días)
+    if fixed_years:
+        await asyncio.gather(
+            streak_service.recompute_from_rollups(),
+            *(heatmap_service.rebuild_year(year) for year in fixed_years)
+        )
+
+    return report
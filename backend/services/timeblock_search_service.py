@@ -0,0 +1,98 @@
+"""
+Servicio de Búsqueda de TimeBlocks por Título 🔎
+
+Busca bloques por palabras del título ("gym", "leer") con un índice de
+texto de MongoDB sobre `title`.
+
+Analogía: Es como el índice alfabético al final de un libro.
+Para encontrar "gimnasio" no lees el libro entero: vas al índice,
+ves las páginas donde aparece y vas directo a ellas.
+
+Detalles:
+- El índice es compuesto: (title texto, day, completed). Los filtros de
+  fechas y de completado se resuelven sobre el mismo índice, sin escanear
+  la colección.
+- Los resultados se ordenan por relevancia (textScore) y se paginan.
+  Se pide un elemento de más para saber si hay otra página sin contar
+  todos los resultados.
+- Si el rango de fechas llega a días archivados (o no hay rango), también
+  se busca en `timeblocks_archive`.
+- Las ocurrencias virtuales de plantillas no se buscan (no existen en la colección).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, TEXT
+
+from config.database import database, timeblocks_archive_collection
+from services import timeblock_archive_service
+
+# Idioma para raíces y palabras vacías (la app está en español)
+SEARCH_LANGUAGE = "spanish"
+
+# Campos que devuelve la búsqueda
+SEARCH_PROJECTION = {
+    "title": 1,
+    "habit_id": 1,
+    "date": 1,
+    "start_time": 1,
+    "end_time": 1,
+    "completed": 1,
+    "score": {"$meta": "textScore"}
+}
+
+
+async def ensure_indexes() -> None:
+    """Índice de texto (con day y completed como sufijos) en timeblocks y en el archivo."""
+    keys = [("title", TEXT), ("day", ASCENDING), ("completed", ASCENDING)]
+    await database.timeblocks.create_index(keys, default_language=SEARCH_LANGUAGE)
+    await timeblocks_archive_collection.create_index(keys, default_language=SEARCH_LANGUAGE)
+
+
+async def search_blocks(
+    q: str,
+    start_day: Optional[datetime] = None,
+    end_day: Optional[datetime] = None,
+    completed: Optional[bool] = None,
+    page: int = 1,
+    page_size: int = 20
+) -> Dict[str, Any]:
+    """
+    Busca bloques cuyo título contenga las palabras de `q`.
+
+    Args:
+        q: Texto a buscar (sintaxis de $text: palabras, "frases", -exclusiones)
+        start_day / end_day: Rango de días (inclusive), opcional
+        completed: Filtrar por estado de completado, opcional
+        page: Página (empieza en 1)
+        page_size: Resultados por página
+
+    Returns:
+        {"results": [...], "has_more": bool}
+    """
+    match: Dict[str, Any] = {"$text": {"$search": q}}
+    if start_day or end_day:
+        match["day"] = {}
+        if start_day:
+            match["day"]["$gte"] = start_day
+        if end_day:
+            match["day"]["$lt"] = end_day + timedelta(days=1)
+    if completed is not None:
+        match["completed"] = completed
+
+    # Una agregación: cada colección calcula su textScore antes de unirse
+    scored = [{"$match": match}, {"$project": SEARCH_PROJECTION}]
+    pipeline: List[Dict[str, Any]] = list(scored)
+    if await timeblock_archive_service.needs_archive(start_day):
+        pipeline.append({"$unionWith": {"coll": timeblocks_archive_collection.name, "pipeline": scored}})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$skip": (page - 1) * page_size},
+        {"$limit": page_size + 1}
+    ]
+
+    blocks = await database.timeblocks.aggregate(pipeline).to_list(length=page_size + 1)
+    for block in blocks:
+        block["id"] = str(block.pop("_id"))
+    return {"results": blocks[:page_size], "has_more": len(blocks) > page_size}
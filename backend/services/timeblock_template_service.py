@@ -0,0 +1,348 @@
+"""
+Servicio de Plantillas Recurrentes de TimeBlocks 🔁
+
+Las plantillas (colección `timeblock_templates`) describen bloques que se
+repiten: todos los días, de lunes a viernes o en días elegidos.
+
+Analogía: Es como el horario escolar pegado en la nevera.
+No escribes "Matemáticas 8:00" en cada página de la agenda; miras el horario
+y sabes qué toca hoy. Solo anotas en la agenda cuando algo cambia
+("hoy sí fui", "hoy la clase empezó más tarde").
+
+Reglas:
+- Al leer un día, cada plantilla que aplica genera una ocurrencia VIRTUAL
+  (no existe en la base de datos) con ID "tpl_<template_id>_<YYYY-MM-DD>".
+- Al completar o editar una ocurrencia virtual, se escribe un timeblock real
+  con `template_id` y la fecha queda en `materialized_dates` de la plantilla.
+- Al borrar una ocurrencia, la fecha queda en `skipped_dates` de la plantilla.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from config.database import database, timeblock_templates_collection
+from models.timeblock import TimeBlockTemplate, date_to_day, time_fields
+from services import (
+    timeblock_archive_service,
+    timeblock_rollup_service,
+    timeblock_version_service,
+    weekly_ledger_service
+)
+
+# Máscaras de días predefinidas (bit 0 = lunes ... bit 6 = domingo)
+RECURRENCE_MASKS = {
+    "daily": 0b1111111,
+    "weekdays": 0b0011111
+}
+
+# Prefijo de los IDs de ocurrencias virtuales
+OCCURRENCE_PREFIX = "tpl_"
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def occurrence_id(template_id: str, date: str) -> str:
+    """ID de la ocurrencia virtual de una plantilla en una fecha."""
+    return f"{OCCURRENCE_PREFIX}{template_id}_{date}"
+
+
+def parse_occurrence_id(value: str) -> Optional[Tuple[str, str]]:
+    """
+    Separa un ID de ocurrencia virtual en (template_id, date).
+    Retorna None si el ID no es de una ocurrencia virtual.
+
+    Ejemplo:
+        >>> parse_occurrence_id("tpl_507f1f77bcf86cd799439011_2026-02-12")
+        ("507f1f77bcf86cd799439011", "2026-02-12")
+    """
+    if not value.startswith(OCCURRENCE_PREFIX):
+        return None
+
+    template_id, _, date = value[len(OCCURRENCE_PREFIX):].partition("_")
+    if not ObjectId.is_valid(template_id):
+        return None
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        return None
+    return template_id, date
+
+
+def occurs_on(template: Dict[str, Any], date: str) -> bool:
+    """
+    ¿La regla de la plantilla genera una ocurrencia en esta fecha?
+    (No considera las fechas ya materializadas u omitidas)
+    """
+    if date < template["start_date"]:
+        return False
+    if template.get("end_date") and date > template["end_date"]:
+        return False
+
+    weekday = datetime.strptime(date, "%Y-%m-%d").weekday()
+    return bool(template["weekday_mask"] & (1 << weekday))
+
+
+def is_virtual_on(template: Dict[str, Any], date: str) -> bool:
+    """¿Esta fecha sigue siendo una ocurrencia virtual (sin documento real ni omitida)?"""
+    return (
+        occurs_on(template, date)
+        and date not in template.get("materialized_dates", [])
+        and date not in template.get("skipped_dates", [])
+    )
+
+
+def to_occurrence(template: Dict[str, Any], date: str) -> Dict[str, Any]:
+    """Construye el bloque virtual de una plantilla para una fecha."""
+    template_id = str(template["_id"])
+    return {
+        "id": occurrence_id(template_id, date),
+        "title": template["title"],
+        "habit_id": template["habit_id"],
+        "start_time": template["start_time"],
+        "end_time": template["end_time"],
+        "date": date,
+        "completed": False,
+        "template_id": template_id
+    }
+
+
+def _active_query(start_date: str, end_date: str, habit_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Filtro de plantillas vigentes en algún día del rango [start_date, end_date]."""
+    query: Dict[str, Any] = {
+        "start_date": {"$lte": end_date},
+        "$or": [{"end_date": None}, {"end_date": {"$gte": start_date}}]
+    }
+    if habit_ids:
+        query["habit_id"] = {"$in": habit_ids}
+    return query
+
+
+# ============================================
+# ✏️ PLANTILLAS
+# ============================================
+
+async def ensure_indexes() -> None:
+    """
+    Índices de plantillas y el índice único (template_id, date) en timeblocks,
+    que evita materializar dos veces la misma ocurrencia.
+    """
+    await timeblock_templates_collection.create_index(
+        [("start_date", ASCENDING), ("end_date", ASCENDING)]
+    )
+    await database.timeblocks.create_index(
+        [("template_id", ASCENDING), ("date", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"template_id": {"$type": "string"}}
+    )
+
+
+async def create_template(template: TimeBlockTemplate) -> str:
+    """
+    Guarda una plantilla y retorna su ID.
+
+    Para "daily" y "weekdays" se guarda la máscara equivalente, así todas las
+    plantillas se consultan igual (por bits).
+    """
+    if template.recurrence == "custom" and template.weekday_mask == 0:
+        raise ValueError("La recurrencia 'custom' requiere al menos un día en weekday_mask")
+    if template.end_date and template.end_date < template.start_date:
+        raise ValueError("end_date debe ser mayor o igual que start_date")
+
+    doc = template.dict(exclude={"id"})
+    doc["weekday_mask"] = RECURRENCE_MASKS.get(template.recurrence, template.weekday_mask)
+    doc["materialized_dates"] = []
+    doc["skipped_dates"] = []
+
+    result = await timeblock_templates_collection.insert_one(doc)
+    await timeblock_version_service.bump_templates()
+    await weekly_ledger_service.rebuild_covering(doc["start_date"], doc.get("end_date"))
+    return str(result.inserted_id)
+
+
+async def list_templates() -> List[Dict[str, Any]]:
+    """Lista las plantillas (sin los arreglos de excepciones)."""
+    cursor = timeblock_templates_collection.find({}, {"materialized_dates": 0, "skipped_dates": 0})
+    templates = await cursor.to_list(length=None)
+    for template in templates:
+        template["id"] = str(template.pop("_id"))
+    return templates
+
+
+async def delete_template(template_id: str) -> bool:
+    """
+    Borra una plantilla. Sus ocurrencias virtuales desaparecen;
+    los bloques ya materializados se conservan.
+    """
+    deleted = await timeblock_templates_collection.find_one_and_delete(
+        {"_id": ObjectId(template_id)},
+        projection={"start_date": 1, "end_date": 1}
+    )
+    if deleted is None:
+        return False
+    await timeblock_version_service.bump_templates()
+    await weekly_ledger_service.rebuild_covering(deleted["start_date"], deleted.get("end_date"))
+    return True
+
+
+# ============================================
+# 📖 EXPANSIÓN (LECTURA)
+# ============================================
+
+async def expand_occurrences(date: str) -> List[Dict[str, Any]]:
+    """
+    Ocurrencias virtuales de un día.
+
+    El filtro por bits ($bitsAllSet) y por fechas excluidas se hace en Mongo,
+    así solo viajan las plantillas que de verdad aplican ese día.
+    """
+    weekday = datetime.strptime(date, "%Y-%m-%d").weekday()
+    query = _active_query(date, date)
+    query["weekday_mask"] = {"$bitsAllSet": 1 << weekday}
+    query["materialized_dates"] = {"$ne": date}
+    query["skipped_dates"] = {"$ne": date}
+
+    projection = {"materialized_dates": 0, "skipped_dates": 0}
+    templates = await timeblock_templates_collection.find(query, projection).to_list(length=None)
+    return [to_occurrence(template, date) for template in templates]
+
+
+async def virtual_daily_totals(
+    start_date: str,
+    end_date: str,
+    habit_ids: Optional[List[str]] = None
+) -> Dict[str, Dict[str, int]]:
+    """
+    Cuántas ocurrencias virtuales (y sus minutos) hay por día en el rango.
+
+    Las ocurrencias virtuales nunca están completadas: si se completan,
+    se materializan y pasan a contarse en los rollups.
+    El costo es O(plantillas x días), independiente de la historia de bloques.
+    """
+    templates = await timeblock_templates_collection.find(
+        _active_query(start_date, end_date, habit_ids)
+    ).to_list(length=None)
+
+    totals: Dict[str, Dict[str, int]] = {}
+    day = datetime.strptime(start_date, "%Y-%m-%d")
+    last = datetime.strptime(end_date, "%Y-%m-%d")
+    while day <= last:
+        date = day.strftime("%Y-%m-%d")
+        for template in templates:
+            if is_virtual_on(template, date):
+                counters = totals.setdefault(date, {"total": 0, "scheduled_minutes": 0})
+                counters["total"] += 1
+                counters["scheduled_minutes"] += timeblock_rollup_service.block_minutes(
+                    template["start_time"], template["end_time"]
+                )
+        day += timedelta(days=1)
+    return totals
+
+
+async def virtual_counts_by_template(
+    start_date: str,
+    end_date: str,
+    habit_ids: Optional[List[str]] = None
+) -> List[Tuple[Dict[str, Any], int]]:
+    """
+    Cuántas ocurrencias virtuales genera cada plantilla en el rango.
+    Retorna pares (plantilla, ocurrencias) solo para las que generan alguna.
+    """
+    templates = await timeblock_templates_collection.find(
+        _active_query(start_date, end_date, habit_ids)
+    ).to_list(length=None)
+
+    counts = [0] * len(templates)
+    day = datetime.strptime(start_date, "%Y-%m-%d")
+    last = datetime.strptime(end_date, "%Y-%m-%d")
+    while day <= last:
+        date = day.strftime("%Y-%m-%d")
+        for index, template in enumerate(templates):
+            if is_virtual_on(template, date):
+                counts[index] += 1
+        day += timedelta(days=1)
+    return [(template, count) for template, count in zip(templates, counts) if count]
+
+
+# ============================================
+# 💾 MATERIALIZACIÓN
+# ============================================
+
+async def materialize_occurrence(template_id: str, date: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Escribe (o actualiza) el timeblock real de una ocurrencia aplicando `changes`.
+
+    Args:
+        template_id: ID de la plantilla
+        date: Fecha de la ocurrencia
+        changes: Campos a modificar (ej: {"completed": True})
+
+    Returns:
+        El bloque tal como quedó
+
+    Raises:
+        ValueError: Si la plantilla no existe, no genera ocurrencia ese día
+            o el día ya está archivado
+    """
+    template = await timeblock_templates_collection.find_one({"_id": ObjectId(template_id)})
+    if not template or not occurs_on(template, date) or date in template.get("skipped_dates", []):
+        raise ValueError("Ocurrencia no encontrada")
+
+    # Los días archivados son de solo lectura: el bloque real podría estar
+    # en timeblocks_archive y el upsert crearía un duplicado
+    watermark = await timeblock_archive_service.get_watermark()
+    if watermark is not None and date_to_day(date) < watermark:
+        raise ValueError("La ocurrencia pertenece a un día archivado")
+
+    # El _id se genera aquí para conocerlo sin volver a consultar a Mongo;
+    # el "id" virtual (plantilla:fecha) no se guarda en el bloque real
+    base = to_occurrence(template, date)
+    del base["id"]
+    base["_id"] = ObjectId()
+    base.update(time_fields(date, base["start_time"], base["end_time"]))
+
+    # $setOnInsert solo aplica si el documento se crea; $set aplica siempre
+    on_insert = {k: v for k, v in base.items() if k not in changes and k not in ("template_id", "date")}
+    before = await database.timeblocks.find_one_and_update(
+        {"template_id": template_id, "date": date},
+        {"$setOnInsert": on_insert, "$set": changes},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if before is None:
+        # Primera vez: el bloque nace y la fecha deja de ser virtual
+        after = {**base, **changes}
+        await timeblock_templates_collection.update_one(
+            {"_id": template["_id"]},
+            {"$addToSet": {"materialized_dates": date}}
+        )
+        await timeblock_rollup_service.record_block_created(after)
+        await weekly_ledger_service.rebuild_covering(date, date)
+    else:
+        after = {**before, **changes}
+        await timeblock_rollup_service.record_block_changed(before, after)
+
+    return after
+
+
+async def skip_occurrence(template_id: str, date: str) -> bool:
+    """
+    Omite la ocurrencia de una fecha (el equivalente a "borrarla").
+    Retorna False si la plantilla no existe.
+    """
+    before = await timeblock_templates_collection.find_one_and_update(
+        {"_id": ObjectId(template_id)},
+        {"$addToSet": {"skipped_dates": date}},
+        projection={"habit_id": 1, "skipped_dates": 1}
+    )
+    if before is None:
+        return False
+    if date not in before.get("skipped_dates", []):
+        await timeblock_version_service.bump_dates([date], [before.get("habit_id")])
+        await weekly_ledger_service.rebuild_covering(date, date)
+    return True
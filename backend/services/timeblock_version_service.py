@@ -0,0 +1,91 @@
+"""
+Servicio de Versiones de TimeBlocks (ETags) 🏷️
+
+Guarda un contador de cambios por fecha en `timeblock_versions`.
+Cada escritura de timeblocks incrementa el contador de las fechas que tocó
+(y el contador global "all"). Los endpoints de lectura arman un ETag con
+esos contadores: si el cliente ya tiene esa versión, se responde 304
+sin consultar la colección `timeblocks`.
+
+Analogía: Es como el número de edición de un periódico.
+Si ya tienes la edición 42 y la de hoy sigue siendo la 42,
+no hace falta imprimirte otra copia.
+
+Claves:
+- "date:YYYY-MM-DD": cambios en bloques de ese día
+- "all": cualquier cambio en cualquier bloque
+- "templates": cambios en plantillas recurrentes (afectan a todos los días)
+- "habit:<habit_id>": cambios en bloques de ese hábito (cache de analíticas)
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from config.database import timeblock_versions_collection
+
+ALL_KEY = "all"
+TEMPLATES_KEY = "templates"
+
+
+def date_key(date: str) -> str:
+    """Clave del contador de una fecha."""
+    return f"date:{date}"
+
+
+def habit_key(habit_id: str) -> str:
+    """Clave del contador de un hábito."""
+    return f"habit:{habit_id}"
+
+
+async def bump(keys: Iterable[str]) -> None:
+    """Incrementa (con $inc atómico) los contadores indicados en un solo viaje."""
+    operations = [
+        UpdateOne({"_id": key}, {"$inc": {"version": 1}}, upsert=True)
+        for key in set(keys)
+    ]
+    if operations:
+        await timeblock_versions_collection.bulk_write(operations, ordered=False)
+
+
+async def bump_dates(dates: Iterable[Optional[str]], habit_ids: Iterable[Optional[str]] = ()) -> None:
+    """Registra un cambio en bloques de estas fechas y hábitos (y en el contador global)."""
+    await bump([date_key(d) for d in dates if d] + [habit_key(h) for h in habit_ids if h] + [ALL_KEY])
+
+
+async def bump_templates() -> None:
+    """Registra un cambio en las plantillas (invalida todas las fechas)."""
+    await bump([TEMPLATES_KEY, ALL_KEY])
+
+
+async def get_versions(keys: List[str]) -> Dict[str, int]:
+    """Versión actual de cada clave (0 si nunca cambió)."""
+    versions = dict.fromkeys(keys, 0)
+    async for doc in timeblock_versions_collection.find({"_id": {"$in": keys}}):
+        versions[doc["_id"]] = doc.get("version", 0)
+    return versions
+
+
+def make_etag(*parts) -> str:
+    """ETag débil a partir de sus partes, ej: W/"timeblocks-2026-02-12-3-1"."""
+    return 'W/"' + "-".join(str(p) for p in parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    ¿El encabezado If-None-Match del cliente contiene este ETag?
+    Comparación débil: se ignora el prefijo W/.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
@@ -0,0 +1,428 @@
+"""
+Servicio del Libro Semanal de Compromisos (weekly_ledger) 📒
+
+Un documento por (user_address, week_id) con los conteos que decide la
+liquidación: bloques relevantes y bloques completados de esa semana,
+según el modo del compromiso (HARD = todos los hábitos, CUSTOM = solo los
+`selected_habit_ids`).
+
+Analogía: Es como la libreta del fiado de la tienda de la esquina.
+El tendero no suma todas las compras del mes cuando vienes a pagar:
+anota cada compra en tu hoja al momento, y al cobrar solo lee el total.
+
+Cómo se mantiene:
+- Cada escritura de timeblocks (vía los deltas de los rollups) suma o resta
+  a los libros cuyas semanas contienen esas fechas, con $inc.
+- Los cambios de plantillas (crear, borrar, omitir o materializar una
+  ocurrencia) cambian las ocurrencias virtuales: los libros de esas fechas
+  se recalculan completos (son 7 días de rollups). Lo mismo al corregir
+  rollups con drift.
+- Guardar la configuración del compromiso recalcula su libro.
+- Si la semana que resuelve un week_id cambió (week_id <= 1 significa
+  "la semana actual"), el libro se recalcula al leerlo.
+- Cuando los conteos de un libro cambian, las firmas de liquidación
+  guardadas para ese usuario y semana se invalidan (su pago pudo cambiar).
+
+Concurrencia (un delta puede llegar mientras se recalcula un libro):
+- `rev` sube con cada escritura del libro ($inc de un delta o recálculo).
+  El recálculo solo escribe si `rev` no cambió desde antes de leer los
+  rollups; si cambió, vuelve a empezar.
+- Después de escribir, el recálculo vuelve a leer los rollups: si un delta
+  los cambió mientras tanto, recalcula otra vez.
+- `generation` sube con cada recálculo. Un delta anota la generation de los
+  libros antes de escribir los rollups; si al terminar su $inc un libro
+  cambió de generation (o apareció uno nuevo), ese recálculo pudo incluir ya
+  el delta: el libro se recalcula de nuevo.
+- rebuild_ledgers.py verifica todos los libros contra los rollups y corrige
+  los que tengan drift.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from config.database import weekly_ledger_collection
+from services import (
+    commitment_config_service,
+    settlement_service,
+    timeblock_rollup_service,
+    timeblock_template_service
+)
+
+logger = logging.getLogger(__name__)
+
+# Intentos de un recálculo antes de rendirse (rebuild_ledgers.py lo repara después)
+LEDGER_REBUILD_RETRIES = 5
+
+# Conteos que decide la liquidación
+LEDGER_COUNTS = ("relevant_blocks", "completed_blocks")
+
+
+# ============================================
+# 🔍 FUNCIONES HELPER
+# ============================================
+
+def get_week_dates(week_id: int, year: int = 2026) -> List[str]:
+    """Retorna lista de fechas (strings) para una semana ISO dada."""
+    # Lunes de la semana
+    start_date = datetime.strptime(f'{year}-W{week_id}-1', "%Y-W%W-%w")
+    dates = []
+    for i in range(7):
+        day = start_date + timedelta(days=i)
+        dates.append(day.strftime("%Y-%m-%d"))
+    return dates
+
+
+def resolve_week_dates(week_id: int) -> List[str]:
+    """Fechas de un week_id del compromiso (week_id <= 1 = semana actual)."""
+    current_iso_week = datetime.now().isocalendar()[1]
+    target_week = week_id if week_id > 1 else current_iso_week
+    return get_week_dates(target_week, datetime.now().year)
+
+
+def is_relevant(ledger: Dict[str, Any], habit_id: Optional[str]) -> bool:
+    """¿Los bloques de este hábito cuentan para el compromiso? (CUSTOM sin selección = todos)"""
+    selected = ledger.get("selected_habit_ids") or []
+    return not (ledger.get("mode") == "CUSTOM" and selected) or habit_id in selected
+
+
+# ============================================
+# 🔧 CONSTRUCCIÓN
+# ============================================
+
+async def ensure_indexes() -> None:
+    """Un libro por (usuario, semana) y búsqueda de los libros que cubren una fecha."""
+    await weekly_ledger_collection.create_index(
+        [("user_address", ASCENDING), ("week_id", ASCENDING)],
+        unique=True
+    )
+    await weekly_ledger_collection.create_index([("week_start", ASCENDING), ("week_end", ASCENDING)])
+
+
+def build_ledger(
+    user_address: str,
+    week_id: int,
+    week_dates: List[str],
+    config: Optional[Dict[str, Any]],
+    habit_totals: Dict[str, Dict[str, int]],
+    virtual: List[Tuple[Dict[str, Any], int]]
+) -> Dict[str, Any]:
+    """Arma un libro en memoria: el filtro HARD/CUSTOM sobre los totales de la semana."""
+    # Default to HARD mode if no config found
+    ledger: Dict[str, Any] = {
+        "user_address": user_address,
+        "week_id": week_id,
+        "mode": config["mode"] if config else "HARD",
+        "selected_habit_ids": config["selected_habit_ids"] if config else [],
+        "deposit_amount": config.get("deposit_amount") if config else None,
+        "week_start": week_dates[0],
+        "week_end": week_dates[-1]
+    }
+
+    relevant = {h: t for h, t in habit_totals.items() if is_relevant(ledger, h)}
+    ledger["relevant_blocks"] = sum(t["total"] for t in relevant.values())
+    ledger["completed_blocks"] = sum(t["completed"] for t in relevant.values())
+    # Las ocurrencias virtuales de plantillas cuentan como planeadas (no completadas)
+    ledger["relevant_blocks"] += sum(count for template, count in virtual if is_relevant(ledger, template["habit_id"]))
+    return ledger
+
+
+async def week_inputs(week_dates: List[str]) -> Tuple[Dict[str, Dict[str, int]], List[Tuple[Dict[str, Any], int]]]:
+    """Lo que comparten todos los libros de una semana: totales por hábito (rollups) y ocurrencias virtuales."""
+    return await asyncio.gather(
+        timeblock_rollup_service.get_habit_totals(week_dates[0], week_dates[-1]),
+        timeblock_template_service.virtual_counts_by_template(week_dates[0], week_dates[-1])
+    )
+
+
+async def compute_ledger(user_address: str, week_id: int, week_dates: List[str]) -> Dict[str, Any]:
+    """
+    Calcula un libro desde cero (sin guardarlo).
+
+    La configuración y los datos de la semana se leen en paralelo.
+    """
+    config, (habit_totals, virtual) = await asyncio.gather(
+        commitment_config_service.get_config(user_address, week_id),
+        week_inputs(week_dates)
+    )
+    return build_ledger(user_address, week_id, week_dates, config, habit_totals, virtual)
+
+
+async def rebuild_ledger(user_address: str, week_id: int) -> Dict[str, Any]:
+    """
+    Recalcula un libro desde cero y lo guarda sin perder deltas concurrentes.
+
+    Pasos (se repiten si hubo conflicto):
+    1. Leer el `rev` actual ANTES de leer los rollups
+    2. Calcular el libro
+    3. Escribir solo si `rev` sigue igual (compare-and-set)
+    4. Volver a calcular: si los rollups cambiaron mientras tanto, repetir
+
+    Raises:
+        RuntimeError: Si hubo conflicto en los LEDGER_REBUILD_RETRIES intentos
+            (el libro queda como estaba; rebuild_ledgers.py lo corrige)
+    """
+    week_dates = resolve_week_dates(week_id)
+    selector = {"user_address": user_address, "week_id": week_id}
+
+    for _ in range(LEDGER_REBUILD_RETRIES):
+        # 1. Versión del libro antes de leer los rollups
+        before = await weekly_ledger_collection.find_one(selector, {"rev": 1, **dict.fromkeys(LEDGER_COUNTS, 1)})
+
+        # 2. Calcular
+        ledger = await compute_ledger(user_address, week_id, week_dates)
+
+        # 3. Compare-and-set: si un delta tocó el libro mientras calculábamos, otra vuelta
+        if before is None:
+            try:
+                await weekly_ledger_collection.insert_one({**ledger, "rev": 0, "generation": 0})
+            except DuplicateKeyError:
+                continue  # otro proceso lo creó al mismo tiempo
+            rev = 0
+        else:
+            written = await weekly_ledger_collection.update_one(
+                {**selector, "rev": before.get("rev")},
+                {"$set": ledger, "$inc": {"rev": 1, "generation": 1}}
+            )
+            if not written.matched_count:
+                continue
+            rev = (before.get("rev") or 0) + 1
+
+        # 4. ¿Cambiaron los rollups después de leerlos? (el $inc de ese delta pudo no vernos)
+        check = await compute_ledger(user_address, week_id, week_dates)
+        if any(check[k] != ledger[k] for k in LEDGER_COUNTS):
+            continue
+
+        if before is not None and any(before.get(k) != ledger[k] for k in LEDGER_COUNTS):
+            await settlement_service.evict_signatures([(user_address, week_id)])
+        return {**ledger, "rev": rev}
+
+    raise RuntimeError(
+        f"Libro {user_address} semana {week_id}: {LEDGER_REBUILD_RETRIES} conflictos seguidos; ejecuta rebuild_ledgers.py"
+    )
+
+
+async def rebuild_quietly(ledgers: List[Dict[str, Any]]) -> None:
+    """
+    Recalcula libros sin fallar a quien llama (la escritura que los disparó ya
+    se guardó). Un recálculo que se rinde queda en el log para rebuild_ledgers.py.
+    """
+    results = await asyncio.gather(
+        *(rebuild_ledger(ledger["user_address"], ledger["week_id"]) for ledger in ledgers),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Recálculo de libro fallido: %s", result)
+
+
+async def get_ledger(user_address: str, week_id: int) -> Dict[str, Any]:
+    """
+    Libro de una semana: una sola lectura de documento.
+    Se recalcula solo si no existe o si su semana ya no es la que resuelve week_id.
+    """
+    ledger = await weekly_ledger_collection.find_one({"user_address": user_address, "week_id": week_id})
+    if ledger is None or ledger.get("week_start") != resolve_week_dates(week_id)[0]:
+        ledger = await rebuild_ledger(user_address, week_id)
+    return ledger
+
+
+
+async def _create_ledgers(week_id: int, user_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Crea los libros que faltan de una semana con una sola lectura de los datos de la semana.
+
+    Pasos:
+    1. Leer los datos de la semana UNA vez y las configuraciones (cache)
+    2. Armar todos los libros en memoria e insertarlos con un insert_many
+    3. Volver a leer los datos de la semana: los libros cuyos conteos cambiaron
+       (un delta llegó entre medio), o que ya existían (otro proceso los creó
+       o son de otra semana), pasan por rebuild_ledger
+    """
+    week_dates = resolve_week_dates(week_id)
+
+    # 1 y 2. Armar e insertar
+    configs, (habit_totals, virtual) = await asyncio.gather(
+        asyncio.gather(*(commitment_config_service.get_config(user, week_id) for user in user_addresses)),
+        week_inputs(week_dates)
+    )
+    configs = dict(zip(user_addresses, configs))
+    ledgers = {
+        user: {**build_ledger(user, week_id, week_dates, configs[user], habit_totals, virtual), "rev": 0}
+        for user in user_addresses
+    }
+    docs = [{**ledger, "generation": 0} for ledger in ledgers.values()]
+    redo = set()
+    try:
+        await weekly_ledger_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            redo.add(docs[error["index"]]["user_address"])
+
+    # 3. ¿Cambiaron los rollups mientras tanto?
+    habit_totals, virtual = await week_inputs(week_dates)
+    for user, ledger in ledgers.items():
+        check = build_ledger(user, week_id, week_dates, configs[user], habit_totals, virtual)
+        if any(check[k] != ledger[k] for k in LEDGER_COUNTS):
+            redo.add(user)
+
+    for user, ledger in zip(redo, await asyncio.gather(*(rebuild_ledger(user, week_id) for user in redo))):
+        ledgers[user] = ledger
+    return ledgers
+
+
+async def get_ledgers(week_id: int, user_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Libros de muchos usuarios para la misma semana, con una sola consulta $in.
+    Los que faltan (o son de otra semana) se crean juntos (_create_ledgers).
+    """
+    week_start = resolve_week_dates(week_id)[0]
+    ledgers = {
+        ledger["user_address"]: ledger
+        async for ledger in weekly_ledger_collection.find(
+            {"week_id": week_id, "user_address": {"$in": user_addresses}}
+        )
+        if ledger.get("week_start") == week_start
+    }
+    missing = [user for user in user_addresses if user not in ledgers]
+    if missing:
+        ledgers.update(await _create_ledgers(week_id, missing))
+    return ledgers
+
+# ============================================
+# ✏️ MANTENIMIENTO INCREMENTAL
+# ============================================
+
+async def _ledgers_covering(start_date: str, end_date: Optional[str]) -> List[Dict[str, Any]]:
+    """Libros cuya semana toca el rango [start_date, end_date] (end_date None = sin fin)."""
+    query: Dict[str, Any] = {"week_end": {"$gte": start_date}}
+    if end_date is not None:
+        query["week_start"] = {"$lte": end_date}
+    projection = {
+        "user_address": 1, "week_id": 1, "mode": 1, "selected_habit_ids": 1,
+        "week_start": 1, "week_end": 1, "generation": 1
+    }
+    return await weekly_ledger_collection.find(query, projection).to_list(length=None)
+
+
+async def snapshot_for_deltas(deltas: Dict[Tuple[str, str], Dict[str, int]]) -> List[Dict[str, Any]]:
+    """
+    Libros que cubren las fechas de unos deltas, con su generation.
+    Se lee ANTES de escribir los rollups (ver on_deltas).
+    """
+    dates = [date for date, _ in deltas if date]
+    if not dates:
+        return []
+    return await _ledgers_covering(min(dates), max(dates))
+
+
+async def on_deltas(deltas: Dict[Tuple[str, str], Dict[str, int]], snapshot: List[Dict[str, Any]]) -> None:
+    """
+    Suma los deltas de rollups (por fecha y hábito) a los libros de esas semanas.
+    Se llama DESPUÉS de escribir los rollups.
+
+    Cada libro recibe un solo $inc con lo que le es relevante; todo va en un bulk_write.
+    Después, los libros que se recalcularon (o se crearon) desde `snapshot`
+    pudieron haber leído ya estos rollups: se recalculan otra vez.
+    """
+    dates = [date for date, _ in deltas if date]
+    if not dates:
+        return
+
+    operations = []
+    changed = []
+    for ledger in snapshot:
+        inc = {"relevant_blocks": 0, "completed_blocks": 0}
+        for (date, habit_id), counters in deltas.items():
+            if date and ledger["week_start"] <= date <= ledger["week_end"] and is_relevant(ledger, habit_id):
+                inc["relevant_blocks"] += counters.get("total", 0)
+                inc["completed_blocks"] += counters.get("completed", 0)
+        inc = {k: v for k, v in inc.items() if v}
+        if inc:
+            operations.append(UpdateOne({"_id": ledger["_id"]}, {"$inc": {**inc, "rev": 1}}))
+            changed.append((ledger["user_address"], ledger["week_id"]))
+
+    if operations:
+        await asyncio.gather(
+            weekly_ledger_collection.bulk_write(operations, ordered=False),
+            settlement_service.evict_signatures(changed)
+        )
+
+    # Recalculados o creados mientras tanto: su recálculo pudo contar ya este delta
+    generations = {ledger["_id"]: ledger.get("generation") for ledger in snapshot}
+    stale = [
+        ledger for ledger in await _ledgers_covering(min(dates), max(dates))
+        if ledger["_id"] not in generations or generations[ledger["_id"]] != ledger.get("generation")
+    ]
+    await rebuild_quietly(stale)
+
+
+async def rebuild_covering(start_date: str, end_date: Optional[str]) -> None:
+    """
+    Recalcula los libros que cubren el rango. Se usa cuando cambian las
+    ocurrencias virtuales (plantilla creada/borrada, ocurrencia omitida o
+    materializada) o cuando se corrigen rollups con drift.
+    """
+    await rebuild_quietly(await _ledgers_covering(start_date, end_date))
+
+
+# ============================================
+# 🔧 VERIFICACIÓN / REPARACIÓN
+# ============================================
+
+async def verify_ledgers(apply: bool = False) -> Dict[str, Any]:
+    """
+    Compara cada libro con un recálculo desde los rollups y reporta las diferencias (drift).
+
+    Los totales de cada semana se leen una sola vez y se reutilizan para
+    todos los libros de esa semana.
+
+    Args:
+        apply: Si es True, recalcula (con rebuild_ledger) los libros con drift
+
+    Returns:
+        Reporte con libros revisados, libros con drift y una muestra de diferencias
+    """
+    report: Dict[str, Any] = {"checked": 0, "drifted": 0, "fixed": 0, "samples": []}
+    inputs_by_week: Dict[str, Tuple[Dict[str, Dict[str, int]], List[Tuple[Dict[str, Any], int]]]] = {}
+
+    cursor = weekly_ledger_collection.find(
+        {}, {"user_address": 1, "week_id": 1, "week_start": 1, **dict.fromkeys(LEDGER_COUNTS, 1)}
+    ).sort("week_id", ASCENDING)
+    async for stored in cursor:
+        report["checked"] += 1
+        user_address, week_id = stored["user_address"], stored["week_id"]
+        week_dates = resolve_week_dates(week_id)
+
+        if week_dates[0] not in inputs_by_week:
+            inputs_by_week[week_dates[0]] = await week_inputs(week_dates)
+        habit_totals, virtual = inputs_by_week[week_dates[0]]
+        config = await commitment_config_service.get_config(user_address, week_id)
+        expected = build_ledger(user_address, week_id, week_dates, config, habit_totals, virtual)
+
+        # Una semana que ya no es la que resuelve week_id también cuenta como drift
+        if stored.get("week_start") == week_dates[0] and all(stored.get(k) == expected[k] for k in LEDGER_COUNTS):
+            continue
+
+        report["drifted"] += 1
+        if len(report["samples"]) < 20:
+            report["samples"].append({
+                "user_address": user_address,
+                "week_id": week_id,
+                "expected": {k: expected[k] for k in LEDGER_COUNTS},
+                "stored": {k: stored.get(k) for k in LEDGER_COUNTS}
+            })
+        if apply:
+            try:
+                await rebuild_ledger(user_address, week_id)
+                report["fixed"] += 1
+            except RuntimeError as e:
+                logger.warning("%s", e)
+
+    return report
@@ -0,0 +1,46 @@
+"""
+Prepara las firmas de liquidación de fin de semana (job por lotes).
+
+Recorre todas las configuraciones ACTIVE de la semana, calcula sus pagos
+desde los libros semanales y firma en paralelo con todos los núcleos.
+Después, /finance/settlement/sign solo tiene que leer la firma guardada.
+
+Si se interrumpe, volver a ejecutarlo continúa donde quedó.
+
+Uso:
+    python settle_week.py --week-id 7                  # Base Sepolia, todos los núcleos
+    python settle_week.py --week-id 7 --workers 4      # Limitar procesos
+    python settle_week.py --week-id 7 --restart        # Ignorar el progreso guardado
+"""
+import argparse
+import asyncio
+import logging
+
+from services.settlement_service import DEFAULT_CHAIN_ID, SETTLEMENT_BATCH_SIZE, ensure_indexes, settle_week
+
+
+async def main(week_id: int, chain_id: int, workers: int, batch_size: int, restart: bool):
+    await ensure_indexes()
+
+    print(f"🧾 Preparando liquidaciones de la semana {week_id} (chain {chain_id})...\n")
+    report = await settle_week(week_id, chain_id, workers or None, batch_size, restart)
+
+    if report["resumed"]:
+        print("↪️ Se continuó desde el último lote guardado.")
+    print(f"✍️ Firmas generadas: {report['signed']}")
+    print(f"⏱️ Tiempo: {report['seconds']} s")
+    print(f"🚀 Velocidad: {report['signatures_per_sec']} firmas/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Firma por lotes las liquidaciones de una semana")
+    parser.add_argument("--week-id", type=int, required=True, help="Semana a liquidar")
+    parser.add_argument("--chain-id", type=int, default=DEFAULT_CHAIN_ID, help="Red del contrato HabitEscrow")
+    parser.add_argument("--workers", type=int, default=0, help="Procesos de firma (0 = todos los núcleos)")
+    parser.add_argument("--batch-size", type=int, default=SETTLEMENT_BATCH_SIZE, help="Configuraciones por lote")
+    parser.add_argument("--restart", action="store_true", help="Empezar de cero")
+    args = parser.parse_args()
+
+    # Progreso por lote que registra settlement_service
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(main(args.week_id, args.chain_id, args.workers, args.batch_size, args.restart))
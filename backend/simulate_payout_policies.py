@@ -0,0 +1,68 @@
+"""
+Simula políticas de pago (umbral de éxito y penalización) sobre el historial real.
+
+Carga una vez el cumplimiento semanal (weekly_ledger) y los depósitos
+indexados de HabitEscrow, y evalúa toda la rejilla de políticas en NumPy.
+No escribe nada en la base de datos. La regla vigente se marca con ★.
+
+Requiere numpy (pip install numpy); el servidor no lo necesita.
+
+Uso:
+    python simulate_payout_policies.py --from-week 1 --to-week 52
+    python simulate_payout_policies.py --thresholds 0.6:0.9:0.05 --penalties 0.05,0.1,0.2
+    python simulate_payout_policies.py --curves linear --csv politicas.csv
+"""
+import argparse
+import asyncio
+import csv
+import time
+
+from services.payout_simulation_service import PENALTY_CURVES, load_history, parse_grid, simulate
+from services.settlement_service import DEFAULT_CHAIN_ID
+
+
+async def main(args):
+    thresholds = parse_grid(args.thresholds)
+    penalties = parse_grid(args.penalties)
+    curves = args.curves.split(",")
+
+    print("📥 Cargando historial...")
+    started = time.perf_counter()
+    history = await load_history(args.from_week, args.to_week, args.chain_id)
+    loaded = time.perf_counter()
+    print(f"   {len(history['deposit'])} usuario-semanas con depósito, {history['users']} usuarios ({loaded - started:.2f} s)")
+    if history["without_ledger"]:
+        print(f"   ⚠️ {history['without_ledger']} depósitos sin libro semanal (no se simulan)")
+
+    results = simulate(history, thresholds, penalties, curves)
+    print(f"🧮 {len(results)} políticas simuladas en {time.perf_counter() - loaded:.2f} s\n")
+
+    print(f"   {'curva':<7}{'umbral':>7}{'penal.':>7}{'devuelto ETH':>15}{'tesorería ETH':>15}{'% tes.':>8}{'afectados':>11}{'p50 ETH':>10}{'p90 ETH':>10}")
+    for row in results:
+        mark = "★" if row["current"] else " "
+        print(
+            f" {mark} {row['curve']:<7}{row['threshold']:>7.2f}{row['penalty']:>7.2f}"
+            f"{row['total_returned_eth']:>15.4f}{row['treasury_eth']:>15.4f}{row['treasury_share'] * 100:>7.2f}%"
+            f"{row['affected_users']:>11}{row['loss_per_user_p50_eth']:>10.4f}{row['loss_per_user_p90_eth']:>10.4f}"
+        )
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]) if results else [])
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"\n💾 Resultados guardados en {args.csv}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simula políticas de pago sobre el historial")
+    parser.add_argument("--from-week", type=int, default=None, help="Primera semana (default: todas)")
+    parser.add_argument("--to-week", type=int, default=None, help="Última semana (default: todas)")
+    parser.add_argument("--chain-id", type=int, default=DEFAULT_CHAIN_ID, help="Red de los depósitos indexados")
+    parser.add_argument("--thresholds", default="0.5:1.0:0.05", help="Umbrales de éxito (inicio:fin:paso o lista)")
+    parser.add_argument("--penalties", default="0.05:0.5:0.05", help="Penalizaciones (fracción del depósito)")
+    parser.add_argument("--curves", default=",".join(PENALTY_CURVES), help="Curvas: flat, linear")
+    parser.add_argument("--csv", default=None, help="Guardar todas las filas en un CSV")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
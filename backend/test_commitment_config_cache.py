@@ -0,0 +1,101 @@
+"""
+Prueba del cache de configuraciones de compromiso.
+
+Revisa que:
+- una segunda lectura sale del cache
+- invalidate() hace que la siguiente lectura vaya a la base de datos
+- una lectura que empezó ANTES de una escritura no vuelve a meter la
+  configuración vieja en el cache
+
+Usa una colección falsa en memoria (no necesita MongoDB) para poder pausar
+la lectura justo en medio de la carrera.
+
+Uso:
+    python test_commitment_config_cache.py
+"""
+import asyncio
+
+from services import commitment_config_service
+
+USER = "0xtest_config_cache"
+WEEK_ID = 40
+
+
+class FakeConfigs:
+    """Colección de una sola configuración; find_one puede pausarse."""
+
+    def __init__(self):
+        self.config = {"user_address": USER, "week_id": WEEK_ID, "mode": "HARD", "selected_habit_ids": []}
+        self.reads = 0
+        self.pause = None
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        value = dict(self.config)
+        if self.pause:
+            reached, release = self.pause
+            reached.set()
+            await release.wait()
+        return value
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.commitment_configs = FakeConfigs()
+
+
+async def test_commitment_config_cache():
+    print("📌 Probando el cache de configuraciones...")
+
+    fake = FakeDatabase()
+    original_database = commitment_config_service.database
+    commitment_config_service.database = fake
+    try:
+        # 1. Acierto
+        print("\n1️⃣ Dos lecturas seguidas...")
+        await commitment_config_service.get_config(USER, WEEK_ID)
+        await commitment_config_service.get_config(USER, WEEK_ID)
+        if fake.commitment_configs.reads != 1:
+            print(f"❌ Se esperaba 1 lectura a la base, hubo {fake.commitment_configs.reads}")
+            return
+        print("✅ La segunda salió del cache")
+
+        # 2. Invalidación explícita
+        print("\n2️⃣ Escribir e invalidar...")
+        fake.commitment_configs.config["mode"] = "CUSTOM"
+        commitment_config_service.invalidate(USER, WEEK_ID)
+        config = await commitment_config_service.get_config(USER, WEEK_ID)
+        if config["mode"] != "CUSTOM":
+            print(f"❌ Se leyó la configuración vieja: {config['mode']}")
+            return
+        print("✅ Se leyó la configuración nueva")
+
+        # 3. Lectura lenta que empezó antes de la escritura
+        print("\n3️⃣ Lectura en curso durante una escritura...")
+        commitment_config_service.invalidate(USER, WEEK_ID)
+        reached, release = asyncio.Event(), asyncio.Event()
+        fake.commitment_configs.pause = (reached, release)
+        slow_read = asyncio.create_task(commitment_config_service.get_config(USER, WEEK_ID))
+        await reached.wait()
+
+        fake.commitment_configs.config["mode"] = "HARD"
+        commitment_config_service.invalidate(USER, WEEK_ID)
+        fake.commitment_configs.pause = None
+        release.set()
+        stale = await slow_read
+        print(f"   la lectura lenta vio mode={stale['mode']}")
+
+        config = await commitment_config_service.get_config(USER, WEEK_ID)
+        if config["mode"] != "HARD":
+            print("❌ La lectura lenta volvió a meter la configuración vieja en el cache")
+            return
+        print("✅ El cache no guardó la lectura vieja")
+
+        print("\n🎉 Cache de configuraciones correcto")
+    finally:
+        commitment_config_service.database = original_database
+        commitment_config_service.invalidate(USER, WEEK_ID)
+
+
+if __name__ == "__main__":
+    asyncio.run(test_commitment_config_cache())
@@ -0,0 +1,114 @@
+"""
+Prueba del indexador de HabitEscrow contra un nodo local (anvil).
+
+Despliega un HabitEscrow nuevo, deposita dos veces, indexa, retira y vuelve
+a indexar, revisando el depósito que leería la liquidación.
+
+Requisitos:
+    anvil                                   # en otra terminal
+    cd ../contracts && forge build          # genera out/HabitEscrow.sol/HabitEscrow.json
+    MongoDB corriendo (los eventos quedan con chain_id 31337)
+
+Uso:
+    python test_escrow_indexer.py
+"""
+import asyncio
+import json
+import os
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+from config.database import escrow_events_collection
+from services.escrow_indexer_service import ensure_indexes, get_deposit, index_events
+
+ANVIL_URL = os.getenv("ANVIL_RPC_URL", "http://127.0.0.1:8545")
+
+# Cuentas por defecto de anvil (públicas, solo para pruebas locales)
+ANVIL_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+TREASURY = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+
+ARTIFACT = os.path.join(os.path.dirname(__file__), "..", "contracts", "out", "HabitEscrow.sol", "HabitEscrow.json")
+WEEK_ID = 7
+
+
+def transact(w3, call, sender, value=0):
+    """Envía una transacción desde una cuenta desbloqueada de anvil y espera el recibo."""
+    tx_hash = call.transact({"from": sender, "value": value})
+    return w3.eth.wait_for_transaction_receipt(tx_hash)
+
+
+async def test_escrow_indexer():
+    print("⛓️ Probando el indexador de HabitEscrow en anvil...")
+
+    w3 = Web3(Web3.HTTPProvider(ANVIL_URL))
+    if not w3.is_connected():
+        print(f"❌ No hay nodo en {ANVIL_URL} (¿corriste anvil?)")
+        return
+    oracle = Account.from_key(ANVIL_KEY)
+    chain_id = w3.eth.chain_id
+
+    # 1. Desplegar (el oráculo es la misma cuenta que deposita)
+    with open(ARTIFACT) as f:
+        artifact = json.load(f)
+    factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"]["object"])
+    receipt = transact(w3, factory.constructor(oracle.address, TREASURY), oracle.address)
+    escrow = w3.eth.contract(address=receipt.contractAddress, abi=artifact["abi"])
+    start_block = receipt.blockNumber
+    print(f"\n1️⃣ HabitEscrow desplegado en {escrow.address} (bloque {start_block})")
+
+    await ensure_indexes()
+
+    # 2. Dos depósitos (top-up) e indexar
+    transact(w3, escrow.functions.deposit(WEEK_ID), oracle.address, Web3.to_wei(1, "ether"))
+    transact(w3, escrow.functions.deposit(WEEK_ID), oracle.address, Web3.to_wei(0.5, "ether"))
+    report = await index_events(ANVIL_URL, escrow.address, confirmations=0, from_block=start_block)
+    deposit = await get_deposit(oracle.address, WEEK_ID, chain_id)
+    expected = Web3.to_wei(1.5, "ether")
+    print(f"\n2️⃣ Indexados {report['events']} eventos; depósito = {deposit} Wei")
+    if deposit != expected:
+        print(f"❌ Se esperaba {expected}")
+        return
+    print("✅ Depósito correcto")
+
+    # 3. Reindexar el mismo rango no duplica
+    await index_events(ANVIL_URL, escrow.address, confirmations=0, from_block=start_block)
+    stored = await escrow_events_collection.count_documents({"chain_id": chain_id, "contract": escrow.address.lower()})
+    print(f"\n3️⃣ Eventos guardados tras reindexar: {stored}")
+    if stored != 2:
+        print("❌ Se esperaban 2 (la escritura no es idempotente)")
+        return
+    print("✅ Reindexar es idempotente")
+
+    # 4. Retirar con una firma del oráculo e indexar desde el punto de control
+    amount_to_return = Web3.to_wei(1.35, "ether")
+    deadline = int(time.time()) + 3600
+    signed = oracle.sign_typed_data(
+        domain_data={"name": "HabitEscrow", "version": "1", "chainId": chain_id, "verifyingContract": escrow.address},
+        message_types={"Settlement": [
+            {"name": "user", "type": "address"},
+            {"name": "weekId", "type": "uint256"},
+            {"name": "amountToReturn", "type": "uint256"},
+            {"name": "deadline", "type": "uint256"}
+        ]},
+        message_data={"user": oracle.address, "weekId": WEEK_ID, "amountToReturn": amount_to_return, "deadline": deadline}
+    )
+    transact(w3, escrow.functions.withdraw(WEEK_ID, amount_to_return, deadline, signed.signature), oracle.address)
+    await index_events(ANVIL_URL, escrow.address, confirmations=0)
+
+    withdrawn = await escrow_events_collection.find_one(
+        {"chain_id": chain_id, "contract": escrow.address.lower(), "event": "Withdrawn"}
+    )
+    deposit = await get_deposit(oracle.address, WEEK_ID, chain_id)
+    print(f"\n4️⃣ Withdrawn: {withdrawn and withdrawn['amount_returned']} Wei devueltos; depósito = {deposit} Wei")
+    if not withdrawn or withdrawn["amount_returned"] != str(amount_to_return) or deposit != 0:
+        print("❌ El retiro no quedó indexado como se esperaba")
+        return
+    print("✅ Retiro indexado; el depósito queda en 0")
+
+    print("\n🎉 Indexador verificado")
+
+
+if __name__ == "__main__":
+    asyncio.run(test_escrow_indexer())
@@ -0,0 +1,102 @@
+"""
+Prueba de los lotes JSON-RPC de la verificación de liquidaciones.
+
+Levanta un nodo falso (aiohttp) que responde un lote con errores mezclados
+y revisa que un tx_hash malo no tumbe a los demás del lote:
+- el hash con error -32602 queda INVALID
+- un error pasajero se reintenta solo para esa confirmación
+- las demás reciben su recibo normalmente
+- una respuesta que no es un lote sí reintenta todo el lote
+
+Requisitos:
+    Ninguno (no usa MongoDB ni un nodo real)
+
+Uso:
+    python test_settlement_verification.py
+"""
+import asyncio
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+from services.settlement_verification_service import _fetch_receipts, check_rpc_error
+
+GOOD_TX = "0x" + "a" * 64
+PENDING_TX = "0x" + "b" * 64
+BAD_TX = "0xnot-a-hash"
+RATE_LIMITED_TX = "0x" + "c" * 64
+
+
+async def fake_node(request: web.Request) -> web.Response:
+    """Responde cada eth_getTransactionReceipt según su hash (en orden inverso, como algunos nodos)."""
+    calls = await request.json()
+    if request.query.get("broken"):
+        return web.json_response({"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "batch too large"}})
+
+    replies = []
+    for call in reversed(calls):
+        tx = call["params"][0]
+        if tx == BAD_TX:
+            replies.append({"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32602, "message": "invalid argument 0: hex string has length 10"}})
+        elif tx == RATE_LIMITED_TX:
+            replies.append({"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32005, "message": "rate limited"}})
+        elif tx == GOOD_TX:
+            replies.append({"jsonrpc": "2.0", "id": call["id"], "result": {"status": "0x1", "logs": []}})
+        else:
+            replies.append({"jsonrpc": "2.0", "id": call["id"], "result": None})
+    return web.json_response(replies)
+
+
+async def test_settlement_verification():
+    print("✅ Probando lotes JSON-RPC con errores mezclados...")
+
+    app = web.Application()
+    app.router.add_post("/", fake_node)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/"
+
+    try:
+        semaphore = asyncio.Semaphore(1)
+        async with aiohttp.ClientSession() as session:
+            # 1. Lote con un hash malo y uno con error pasajero
+            print("\n1️⃣ Lote con errores por transacción...")
+            txs = [GOOD_TX, BAD_TX, PENDING_TX, RATE_LIMITED_TX]
+            fetched = await _fetch_receipts(session, url, txs, semaphore)
+            if fetched is None:
+                print("❌ Un error de una transacción tumbó todo el lote")
+                return
+            receipts, errors = fetched
+            if sorted(errors) != [1, 3] or receipts[0] is None or receipts[2] is not None:
+                print(f"❌ Resultados inesperados: {receipts} / {errors}")
+                return
+            print("✅ El resto del lote recibió sus recibos")
+
+            now = datetime.utcnow()
+            config = {"settlement_confirmed_at": now}
+            bad_verdict, fields = check_rpc_error(config, errors[1], now)
+            retry_verdict, _ = check_rpc_error(config, errors[3], now)
+            print(f"   hash malo → {bad_verdict} ({fields.get('settlement_rejection')}); error pasajero → {retry_verdict}")
+            if bad_verdict != "INVALID" or retry_verdict is not None:
+                print("❌ Se esperaba INVALID para el hash malo y reintento para el pasajero")
+                return
+            print("✅ Solo el hash malo queda INVALID")
+
+            # 2. Respuesta que no es un lote: se reintenta todo
+            print("\n2️⃣ Respuesta que no es un lote...")
+            if await _fetch_receipts(session, url + "?broken=1", txs, semaphore) is not None:
+                print("❌ Una respuesta malformada debería reintentar el lote")
+                return
+            print("✅ Lote marcado para reintento")
+
+        print("\n🎉 Lotes JSON-RPC correctos")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(test_settlement_verification())
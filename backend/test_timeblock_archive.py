@@ -0,0 +1,88 @@
+"""
+Prueba del archivado de timeblocks con una escritura concurrente.
+
+Mientras se archiva un lote, otro "cliente" marca como completado uno de
+sus bloques justo después de la copia y antes del borrado. Revisa que:
+- ese bloque no se borra con la versión vieja (se reintenta)
+- al final el archivo tiene la versión nueva (completed=True)
+- los demás bloques del lote se movieron normalmente
+
+Requisitos:
+    MongoDB corriendo. Usa bloques del 1990-01-01 y un horizonte que solo
+    alcanza esos días; se borran al final.
+
+Uso:
+    python test_timeblock_archive.py
+"""
+import asyncio
+from datetime import datetime
+
+from config.database import database, timeblock_archive_state_collection, timeblocks_archive_collection
+from services import timeblock_archive_service
+
+TEST_DAY = datetime(1990, 1, 1)
+TEST_HABIT = "test_archive_race"
+
+
+class UpdateAfterCopy:
+    """El archivo real, pero después del primer insert_many se actualiza un bloque en la colección caliente."""
+
+    def __init__(self, target_id):
+        self.target_id = target_id
+        self.fired = False
+
+    def __getattr__(self, name):
+        return getattr(timeblocks_archive_collection, name)
+
+    async def insert_many(self, docs, **kwargs):
+        result = await timeblocks_archive_collection.insert_many(docs, **kwargs)
+        if not self.fired:
+            self.fired = True
+            await database.timeblocks.update_one({"_id": self.target_id}, {"$set": {"completed": True}})
+        return result
+
+
+async def test_timeblock_archive():
+    print("🗄️ Probando el archivado con una escritura concurrente...")
+
+    had_watermark = await timeblock_archive_service.get_watermark() is not None
+    horizon_days = (datetime.now() - TEST_DAY).days - 1
+    blocks = [
+        {"title": f"bloque {i}", "habit_id": TEST_HABIT, "date": "1990-01-01", "day": TEST_DAY,
+         "start_minute": 60 * i, "end_minute": 60 * i + 30, "completed": False}
+        for i in range(3)
+    ]
+    result = await database.timeblocks.insert_many(blocks)
+    target = result.inserted_ids[1]
+
+    proxy = UpdateAfterCopy(target)
+    timeblock_archive_service.timeblocks_archive_collection = proxy
+    try:
+        report = await timeblock_archive_service.archive_old_blocks(horizon_days=horizon_days, batch_size=10)
+        print(f"   reporte: {report}")
+
+        hot = await database.timeblocks.count_documents({"habit_id": TEST_HABIT})
+        archived = await timeblocks_archive_collection.find({"habit_id": TEST_HABIT}).to_list(length=None)
+        target_copy = next((b for b in archived if b["_id"] == target), None)
+
+        if not proxy.fired:
+            print("❌ La escritura concurrente no se disparó")
+        elif report["retried"] < 1:
+            print("❌ El bloque actualizado no se reintentó: se borró con la versión vieja")
+        elif hot != 0 or len(archived) != 3:
+            print(f"❌ Quedaron {hot} en la colección caliente y {len(archived)} en el archivo (se esperaban 0 y 3)")
+        elif not target_copy or not target_copy["completed"]:
+            print("❌ El archivo tiene la versión vieja del bloque actualizado")
+        else:
+            print("✅ La actualización concurrente llegó al archivo y el resto se movió")
+            print("\n🎉 Archivado correcto")
+    finally:
+        timeblock_archive_service.timeblocks_archive_collection = timeblocks_archive_collection
+        await database.timeblocks.delete_many({"habit_id": TEST_HABIT})
+        await timeblocks_archive_collection.delete_many({"habit_id": TEST_HABIT})
+        if not had_watermark:
+            await timeblock_archive_state_collection.delete_one({"_id": timeblock_archive_service.ARCHIVE_STATE_ID})
+
+
+if __name__ == "__main__":
+    asyncio.run(test_timeblock_archive())
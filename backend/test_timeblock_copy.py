@@ -0,0 +1,81 @@
+"""
+Prueba de copiar una semana de timeblocks.
+
+Revisa que:
+- la primera copia crea los bloques (sin completar) y los suma a los rollups
+- repetir la misma copia no duplica nada ni vuelve a sumar a los rollups
+- los bloques copiados no conservan el marcador interno `copy_batch`
+
+Requisitos:
+    MongoDB corriendo. Usa las semanas 2099-W10 → 2099-W11 y un hábito de
+    prueba; se borran al final.
+
+Uso:
+    python test_timeblock_copy.py
+"""
+import asyncio
+from datetime import timedelta
+
+from config.database import database, timeblock_rollups_collection
+from services import timeblock_copy_service, timeblock_rollup_service
+
+TEST_HABIT = "test_copy_week"
+FROM_WEEK = "2099-W10"
+TO_WEEK = "2099-W11"
+
+
+async def target_totals(to_monday) -> int:
+    """Bloques planeados del hábito de prueba en la semana destino, según los rollups."""
+    dates = [(to_monday + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7)]
+    totals = await timeblock_rollup_service.get_daily_totals(dates[0], dates[-1], [TEST_HABIT])
+    return sum(row["total"] for row in totals.values())
+
+
+async def test_timeblock_copy():
+    print("📋 Probando copiar una semana...")
+
+    from_monday = timeblock_copy_service.parse_iso_week(FROM_WEEK)
+    to_monday = timeblock_copy_service.parse_iso_week(TO_WEEK)
+    await timeblock_copy_service.ensure_indexes()
+
+    blocks = [
+        {"title": f"bloque {i}", "habit_id": TEST_HABIT, "date": (from_monday + timedelta(days=i)).strftime("%Y-%m-%d"),
+         "day": from_monday + timedelta(days=i), "start_time": "09:00", "end_time": "10:00",
+         "start_minute": 540, "end_minute": 600, "completed": True}
+        for i in range(2)
+    ]
+    await database.timeblocks.insert_many(blocks)
+
+    try:
+        # 1. Primera copia
+        print("\n1️⃣ Primera copia...")
+        report = await timeblock_copy_service.copy_week(from_monday, to_monday)
+        copies = await database.timeblocks.find({"habit_id": TEST_HABIT, "day": {"$gte": to_monday}}).to_list(length=None)
+        if report["copied"] != 2 or len(copies) != 2 or any(c["completed"] for c in copies):
+            print(f"❌ Se esperaban 2 copias sin completar: {report}, {len(copies)} guardadas")
+            return
+        if any("copy_batch" in c for c in copies):
+            print("❌ Las copias conservan copy_batch")
+            return
+        if await target_totals(to_monday) != 2:
+            print("❌ Los rollups de la semana destino no suman 2")
+            return
+        print("✅ 2 bloques copiados, sin marcador y sumados a los rollups")
+
+        # 2. Repetir la copia
+        print("\n2️⃣ Repetir la misma copia...")
+        report = await timeblock_copy_service.copy_week(from_monday, to_monday)
+        copies = await database.timeblocks.count_documents({"habit_id": TEST_HABIT, "day": {"$gte": to_monday}})
+        if report["copied"] != 0 or copies != 2 or await target_totals(to_monday) != 2:
+            print(f"❌ La copia repetida duplicó bloques o rollups: {report}, {copies} guardadas")
+            return
+        print("✅ Repetir no duplica nada")
+
+        print("\n🎉 Copiar semana es idempotente")
+    finally:
+        await database.timeblocks.delete_many({"habit_id": TEST_HABIT})
+        await timeblock_rollups_collection.delete_many({"habit_id": TEST_HABIT})
+
+
+if __name__ == "__main__":
+    asyncio.run(test_timeblock_copy())
@@ -0,0 +1,101 @@
+"""
+Prueba del change stream compartido de timeblocks (SSE).
+
+Revisa que:
+- un cliente conectado recibe los cambios en vivo
+- al irse el último cliente el stream olvida su posición: lo que cambió sin
+  nadie escuchando NO se reenvía al siguiente cliente
+- un Last-Event-ID que sigue en el historial reenvía lo perdido
+- un Last-Event-ID de un stream anterior recibe "reset"
+
+Requisitos:
+    MongoDB como replica set (`mongod --replSet rs0` + `rs.initiate()`)
+    Usa bloques con fecha 2099-01-01; se borran al final
+
+Uso:
+    python test_timeblock_events.py
+"""
+import asyncio
+
+from config.database import database
+from services.timeblock_events_service import event_broker
+
+TEST_DATE = "2099-01-01"
+
+# Espera para que el change stream quede abierto antes de escribir
+STREAM_WARMUP_SECONDS = 1.0
+
+
+async def insert_block(title: str) -> None:
+    await database.timeblocks.insert_one({"title": title, "date": TEST_DATE, "habit_id": "test_events", "completed": False})
+
+
+async def next_event(subscriber, timeout: float = 5.0):
+    """Siguiente (token, evento) del cliente, o None si no llega nada."""
+    try:
+        return await asyncio.wait_for(subscriber.queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+async def test_timeblock_events():
+    print("📡 Probando el change stream de timeblocks...")
+
+    try:
+        # 1. En vivo
+        print("\n1️⃣ Cliente conectado...")
+        first = event_broker.subscribe(TEST_DATE)
+        await asyncio.sleep(STREAM_WARMUP_SECONDS)
+        await insert_block("en vivo")
+        received = await next_event(first)
+        if not received or received[1]["block"]["title"] != "en vivo":
+            print(f"❌ No llegó el evento en vivo: {received}")
+            return
+        old_token = received[0]
+        print("✅ Evento recibido")
+
+        # 2. Sin nadie escuchando
+        print("\n2️⃣ Cambio sin clientes conectados...")
+        event_broker.unsubscribe(first)
+        if event_broker.resume_token is not None or event_broker.history:
+            print("❌ El stream detenido conserva su resume token o su historial")
+            return
+        await insert_block("sin nadie")
+
+        second = event_broker.subscribe(TEST_DATE)
+        await asyncio.sleep(STREAM_WARMUP_SECONDS)
+        await insert_block("de nuevo en vivo")
+        received = await next_event(second)
+        if not received or received[1]["block"]["title"] != "de nuevo en vivo":
+            print(f"❌ El nuevo cliente recibió un cambio viejo como si fuera en vivo: {received}")
+            return
+        print("✅ Lo cambiado sin clientes no se reenvía")
+
+        # 3. Reconexión con Last-Event-ID
+        print("\n3️⃣ Reconexión con Last-Event-ID...")
+        last_seen = received[0]
+        await insert_block("perdido")
+        if not await next_event(second):
+            print("❌ No llegó el evento a quien sigue conectado")
+            return
+        replayed = event_broker.subscribe(TEST_DATE, last_seen)
+        received = await next_event(replayed, timeout=0.5)
+        if not received or received[1]["block"]["title"] != "perdido":
+            print(f"❌ No se reenvió el evento perdido: {received}")
+            return
+        print("✅ Se reenvió lo que se perdió")
+
+        stale = event_broker.subscribe(TEST_DATE, old_token)
+        if not stale.overflowed:
+            print("❌ Un Last-Event-ID de un stream anterior debería recibir reset")
+            return
+        print("✅ Last-Event-ID viejo → reset")
+
+        print("\n🎉 Change stream correcto")
+    finally:
+        await event_broker.close()
+        await database.timeblocks.delete_many({"date": TEST_DATE, "habit_id": "test_events"})
+
+
+if __name__ == "__main__":
+    asyncio.run(test_timeblock_events())
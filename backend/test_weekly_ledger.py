@@ -0,0 +1,107 @@
+"""
+Prueba de concurrencia de los libros semanales (weekly_ledger).
+
+Fuerza, de forma determinista, las dos carreras entre un recálculo del libro
+(rebuild_ledger) y un delta de timeblocks (apply_deltas), y revisa que el
+libro termine igual a un recálculo desde los rollups:
+
+A. El delta llega entre la lectura de los rollups y la escritura del libro
+   (sin protección, el delta se perdía).
+B. El delta escribe los rollups antes de que el recálculo los lea, pero su
+   $inc al libro llega después de la escritura (sin protección, se contaba doble).
+
+Requisitos:
+    MongoDB corriendo (usa un hábito y un usuario de prueba; se limpian al final)
+
+Uso:
+    python test_weekly_ledger.py
+"""
+import asyncio
+
+from config.database import timeblock_rollups_collection, weekly_ledger_collection
+from services import timeblock_rollup_service, weekly_ledger_service
+
+TEST_USER = "0xtest_ledger_race"
+TEST_HABIT = "test_ledger_race_habit"
+WEEK_ID = 40
+
+
+async def apply_test_delta(date: str, total: int) -> None:
+    """Un bloque de prueba creado (total=1) o borrado (total=-1) en una fecha."""
+    await timeblock_rollup_service.apply_deltas({(date, TEST_HABIT): {"total": total}}, {date}, {TEST_HABIT})
+
+
+async def check(label: str, expected_relevant: int) -> bool:
+    """El libro guardado debe coincidir con un recálculo y con el valor esperado."""
+    week_dates = weekly_ledger_service.resolve_week_dates(WEEK_ID)
+    stored = await weekly_ledger_collection.find_one({"user_address": TEST_USER, "week_id": WEEK_ID})
+    fresh = await weekly_ledger_service.compute_ledger(TEST_USER, WEEK_ID, week_dates)
+    print(f"   guardado={stored['relevant_blocks']} recalculado={fresh['relevant_blocks']} esperado={expected_relevant}")
+    if stored["relevant_blocks"] == fresh["relevant_blocks"] == expected_relevant:
+        print(f"✅ {label}")
+        return True
+    print(f"❌ {label}")
+    return False
+
+
+async def test_weekly_ledger():
+    print("📒 Probando carreras entre recálculos y deltas del libro semanal...")
+
+    date = weekly_ledger_service.resolve_week_dates(WEEK_ID)[2]
+    original_totals = timeblock_rollup_service.get_habit_totals
+    original_on_deltas = weekly_ledger_service.on_deltas
+    applied = 0
+    try:
+        baseline = (await weekly_ledger_service.rebuild_ledger(TEST_USER, WEEK_ID))["relevant_blocks"]
+
+        # A. Delta entre la lectura de los rollups y la escritura del libro
+        print("\n1️⃣ Delta durante el recálculo (entre leer rollups y escribir)...")
+        calls = {"n": 0}
+
+        async def totals_then_delta(start, end):
+            totals = await original_totals(start, end)
+            calls["n"] += 1
+            if calls["n"] == 1:
+                await apply_test_delta(date, 1)
+            return totals
+
+        timeblock_rollup_service.get_habit_totals = totals_then_delta
+        await weekly_ledger_service.rebuild_ledger(TEST_USER, WEEK_ID)
+        timeblock_rollup_service.get_habit_totals = original_totals
+        applied += 1
+        if not await check("El delta no se perdió", baseline + 1):
+            return
+
+        # B. Rollups escritos antes del recálculo, $inc al libro después
+        print("\n2️⃣ $inc del delta después de que el recálculo ya lo contó...")
+        reached, release = asyncio.Event(), asyncio.Event()
+
+        async def paused_on_deltas(deltas, snapshot):
+            reached.set()
+            await release.wait()
+            await original_on_deltas(deltas, snapshot)
+
+        weekly_ledger_service.on_deltas = paused_on_deltas
+        delta_task = asyncio.create_task(apply_test_delta(date, 1))
+        await reached.wait()
+        await weekly_ledger_service.rebuild_ledger(TEST_USER, WEEK_ID)
+        release.set()
+        await delta_task
+        weekly_ledger_service.on_deltas = original_on_deltas
+        applied += 1
+        if not await check("El delta no se contó doble", baseline + 2):
+            return
+
+        print("\n🎉 Libro semanal consistente en ambas carreras")
+    finally:
+        # Limpieza: quitar los bloques de prueba y el libro de prueba
+        timeblock_rollup_service.get_habit_totals = original_totals
+        weekly_ledger_service.on_deltas = original_on_deltas
+        if applied:
+            await apply_test_delta(date, -applied)
+        await timeblock_rollups_collection.delete_many({"habit_id": TEST_HABIT})
+        await weekly_ledger_collection.delete_one({"user_address": TEST_USER, "week_id": WEEK_ID})
+
+
+if __name__ == "__main__":
+    asyncio.run(test_weekly_ledger())
@@ -0,0 +1,49 @@
+"""
+Verifica contra la cadena las liquidaciones confirmadas por los clientes.
+
+El servidor ya lo hace en segundo plano cada SETTLEMENT_VERIFY_INTERVAL_SECONDS;
+este script procesa toda la cola de una vez y reporta la velocidad
+(útil contra un nodo local para medir el throughput).
+
+Uso:
+    python verify_settlements.py                                   # Nodo de ESCROW_RPC_URL
+    python verify_settlements.py --rpc-url http://127.0.0.1:8545   # anvil
+"""
+import argparse
+import asyncio
+import time
+
+from services.settlement_verification_service import VERIFY_SCAN_LIMIT, ensure_indexes, verify_pending
+
+
+async def main(rpc_url: str, contract: str, limit: int):
+    await ensure_indexes()
+
+    print("✅ Verificando liquidaciones pendientes...\n")
+    totals = {"checked": 0, "verified": 0, "rejected": 0, "invalid": 0}
+    started = time.perf_counter()
+    while True:
+        report = await verify_pending(rpc_url, contract, limit)
+        for key in totals:
+            totals[key] += report[key]
+        # Lo que queda en espera (sin recibo aún) se revisa en otra ejecución
+        if report["verified"] + report["rejected"] + report["invalid"] == 0:
+            break
+        print(f"📦 Vuelta: {report['checked']} revisadas ({report['per_minute']}/min)")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ Verificadas: {totals['verified']}")
+    print(f"❌ Rechazadas: {totals['rejected']}")
+    print(f"🚫 Inválidas (error del nodo): {totals['invalid']}")
+    print(f"⏳ En espera: {report['waiting']}")
+    print(f"🚀 Velocidad: {round(totals['checked'] * 60 / elapsed, 1) if elapsed > 0 else 0.0} confirmaciones/min")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica on-chain las liquidaciones confirmadas")
+    parser.add_argument("--rpc-url", default=None, help="Nodo RPC (default ESCROW_RPC_URL)")
+    parser.add_argument("--contract", default=None, help="Dirección de HabitEscrow (default HABIT_ESCROW_ADDRESS)")
+    parser.add_argument("--limit", type=int, default=VERIFY_SCAN_LIMIT, help="Confirmaciones por vuelta")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rpc_url, args.contract, args.limit))